@@ -0,0 +1,126 @@
+"""
+比较XMLHighlighter与原来的四个正则表达式的高亮器的速度
+
+用法:
+    python benchmark_highlighter.py [XML文件] [重复次数]
+
+不指定文件时生成一个约3万行的锁屏XML。每种高亮器都对包含同一份文本的
+QTextDocument重新高亮全部的行（与代码视图setText之后的工作量相同），记录耗时，
+并检查新高亮器对跨行注释的处理。
+最后比较代码视图设置文本后到可以响应操作的时间：QTextEdit加XMLHighlighter同步高亮全部的行，
+QPlainTextEdit加ViewportXMLHighlighter只立即高亮可见的行。
+"""
+import os
+import re
+import sys
+import time
+
+if 'DISPLAY' not in os.environ and 'QT_QPA_PLATFORM' not in os.environ:
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+
+from PyQt5.QtGui import QColor, QSyntaxHighlighter, QTextCharFormat, QTextDocument
+from PyQt5.QtWidgets import QApplication, QPlainTextEdit, QTextEdit
+from xml_highlighter import XMLHighlighter, ViewportXMLHighlighter, IN_COMMENT
+
+class LegacyXMLHighlighter(QSyntaxHighlighter):
+    """原来的高亮器：每行依次运行四个正则表达式，不处理跨行注释"""
+    def __init__(self, parent=None):
+        super(LegacyXMLHighlighter, self).__init__(parent)
+        
+        self.highlighting_rules = []
+        
+        tag_format = QTextCharFormat()
+        tag_format.setForeground(QColor("#00008B"))
+        self.highlighting_rules.append((re.compile(r"<[^>]*>"), tag_format))
+        
+        attr_format = QTextCharFormat()
+        attr_format.setForeground(QColor("#8B0000"))
+        self.highlighting_rules.append((re.compile(r"\s+([a-zA-Z_][a-zA-Z0-9_\-]*)="), attr_format))
+        
+        attr_value_format = QTextCharFormat()
+        attr_value_format.setForeground(QColor("#006400"))
+        self.highlighting_rules.append((re.compile(r"=\"([^\"]*)\"|='([^']*)'"), attr_value_format))
+        
+        comment_format = QTextCharFormat()
+        comment_format.setForeground(QColor("#808080"))
+        self.highlighting_rules.append((re.compile(r"<!--[^<]*-->"), comment_format))
+    
+    def highlightBlock(self, text):
+        for pattern, format in self.highlighting_rules:
+            for match in pattern.finditer(text):
+                self.setFormat(match.start(), match.end() - match.start(), format)
+
+def generate_xml(groups=3000):
+    """生成测试用的锁屏XML，每组约10行，包含跨行注释"""
+    lines = ['<?xml version=\'1.0\' encoding=\'utf-8\'?>',
+             '<Lockscreen version="1" frameRate="60">']
+    for i in range(groups):
+        lines.append(f'  <!-- group {i}')
+        lines.append('       spans two lines -->')
+        lines.append(f'  <Group name="g{i}" x="#screen_width/2" visibility="@hour">')
+        for j in range(5):
+            lines.append(f'    <Image name="img{i}_{j}" x="{j}" y="#g{i}_y" src="a/{j}.png"/>')
+        lines.append(f'    <Text text="hello {i}" color="#ffffff"/>')
+        lines.append('  </Group>')
+    lines.append('</Lockscreen>')
+    return '\n'.join(lines)
+
+def measure(highlighter_class, text, repeat):
+    """返回高亮整个文档的最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        document = QTextDocument()
+        document.setPlainText(text)
+        highlighter = highlighter_class(document)
+        start = time.perf_counter()
+        highlighter.rehighlight()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measure_open(app, editor_class, highlighter_factory, text):
+    """返回代码视图设置文本并处理完事件（可以响应操作）的耗时（秒）"""
+    editor = editor_class()
+    editor.resize(800, 600)
+    editor.show()
+    editor.highlighter = highlighter_factory(editor)  # 保持引用，避免高亮器被回收
+    start = time.perf_counter()
+    editor.setPlainText(text)
+    app.processEvents()
+    elapsed = time.perf_counter() - start
+    editor.close()
+    return elapsed
+
+def check_multiline_comment():
+    """跨行注释的第二行应处于注释状态，注释结束后的行恢复普通状态"""
+    document = QTextDocument()
+    highlighter = XMLHighlighter(document)
+    document.setPlainText('<a>\n<!-- first\nsecond\nthird -->\n<b x="1"/>\n</a>')
+    highlighter.rehighlight()
+    states = [document.findBlockByNumber(i).userState() for i in range(document.blockCount())]
+    return states[1:3] == [IN_COMMENT, IN_COMMENT] and states[3] != IN_COMMENT
+
+def main():
+    app = QApplication(sys.argv)
+    
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = generate_xml()
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    
+    print(f"行数: {text.count(chr(10)) + 1}, 字符数: {len(text)}")
+    legacy = measure(LegacyXMLHighlighter, text, repeat)
+    current = measure(XMLHighlighter, text, repeat)
+    print(f"原高亮器:   {legacy:.3f} 秒")
+    print(f"新高亮器:   {current:.3f} 秒 ({legacy / current:.1f}x)")
+    print(f"跨行注释:   {'正确' if check_multiline_comment() else '错误'}")
+    
+    full = measure_open(app, QTextEdit, lambda editor: XMLHighlighter(editor.document()), text)
+    viewport = measure_open(app, QPlainTextEdit, ViewportXMLHighlighter, text)
+    print(f"打开代码视图（全部高亮）:     {full:.3f} 秒")
+    print(f"打开代码视图（可见区域优先）: {viewport:.3f} 秒 ({full / viewport:.1f}x)")
+
+if __name__ == '__main__':
+    main()
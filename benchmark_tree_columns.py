@@ -0,0 +1,119 @@
+"""
+比较结构树按列方案读取各列文本与原来逐个节点处理列配置的速度
+
+用法:
+    python benchmark_tree_columns.py [元素数量] [自定义列数量] [重复次数]
+
+生成指定数量的元素（默认2万个）和自定义列（默认4个，列名以"值"结尾），
+分别用原来的方式（每个节点调用get_visible_columns，每列用index查找位置、处理列名）
+和TreeColumnPlan.text（结构树模型读取单元格的方式）得到每个元素元素列以外各列的文本，
+输出每个节点的平均耗时，并检查两种方式得到的文本相同。
+"""
+import sys
+import time
+
+from lxml import etree
+from tree_column_plan import TreeColumnPlan
+
+class LegacyColumns:
+    """原来的列填充方式，与修改前的XMLEditor中刷新树项目各列的代码相同，文本写入列表而不是树项目"""
+    def __init__(self, tree_columns, feature_comments, usage_comments):
+        self.tree_columns = tree_columns
+        self.feature_comments = feature_comments
+        self.usage_comments = usage_comments
+    
+    def get_visible_columns(self):
+        columns = ['元素']
+        for col in self.tree_columns['default'][1:]:
+            if self.tree_columns['visible'].get(col, True):
+                columns.append(col)
+        columns.extend(self.tree_columns['custom'])
+        return columns
+    
+    def row_texts(self, element):
+        """refresh_tree_columns中刷新一个已有项目各列的部分"""
+        visible_columns = self.get_visible_columns()
+        texts = [""] * len(visible_columns)
+        tag = element.tag
+        
+        if '功能注释' in visible_columns:
+            col_position = visible_columns.index('功能注释')
+            if tag in self.feature_comments:
+                texts[col_position] = self.feature_comments[tag]
+        
+        if '作用注释' in visible_columns:
+            col_position = visible_columns.index('作用注释')
+            comment = self.usage_comments.get(element)
+            texts[col_position] = comment if comment else ""
+        
+        if 'Name值' in visible_columns:
+            col_position = visible_columns.index('Name值')
+            if "name" in element.attrib:
+                texts[col_position] = element.attrib["name"]
+        
+        for attr_name in self.tree_columns['custom']:
+            if attr_name in visible_columns:
+                col_position = visible_columns.index(attr_name)
+                real_attr_name = attr_name
+                if attr_name.endswith("值"):
+                    real_attr_name = attr_name[:-1]
+                if real_attr_name.lower() == "name":
+                    real_attr_name = "name"
+                if real_attr_name in element.attrib:
+                    texts[col_position] = element.attrib[real_attr_name]
+        return texts[1:]
+
+def generate_elements(count, attributes):
+    """生成测试用的元素，各元素带有name和部分自定义列对应的属性"""
+    tags = ['Image', 'Text', 'Group', 'Button', 'Var']
+    root = etree.Element('Lockscreen')
+    for i in range(count):
+        element = etree.SubElement(root, tags[i % len(tags)], name=f"e{i}")
+        for j, attr in enumerate(attributes):
+            if (i + j) % 3:
+                element.set(attr, str(i * j))
+    return list(root)
+
+def measure(read, elements, repeat):
+    """返回读取全部元素各列的最短耗时（秒）和最后一次读取的文本"""
+    best = None
+    texts = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        texts = [read(element) for element in elements]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, texts
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    custom_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    
+    attributes = ['x', 'y', 'alpha', 'src', 'visibility', 'w', 'h', 'color'][:custom_count]
+    tree_columns = {
+        'default': ['元素', '功能注释', '作用注释', 'Name值'],
+        'custom': [attr + "值" for attr in attributes],
+        'visible': {'功能注释': True, '作用注释': True, 'Name值': True}
+    }
+    elements = generate_elements(count, attributes)
+    feature_comments = {'Image': '图片', 'Text': '文字', 'Group': '组'}
+    usage_comments = {element: f"说明{i}" for i, element in enumerate(elements) if i % 4 == 0}
+    
+    legacy = LegacyColumns(tree_columns, feature_comments, usage_comments)
+    plan = TreeColumnPlan(legacy.get_visible_columns(), tree_columns['custom'])
+    columns = range(1, len(plan.headers))
+    
+    def plan_texts(element):
+        return [plan.text(element, column, feature_comments, usage_comments.get) for column in columns]
+    
+    print(f"元素数: {count}, 列数: {len(plan.headers)}")
+    before, legacy_texts = measure(legacy.row_texts, elements, repeat)
+    after, plan_result = measure(plan_texts, elements, repeat)
+    same = legacy_texts == plan_result
+    print(f"读取各列: 原方式 {before / count * 1e6:.2f} 微秒/节点, "
+          f"列方案 {after / count * 1e6:.2f} 微秒/节点 ({before / after:.1f}x), "
+          f"结果{'相同' if same else '不同'}")
+
+if __name__ == '__main__':
+    main()
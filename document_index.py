@@ -0,0 +1,344 @@
+import itertools
+import re
+from lxml import etree
+
+# 属性值中引用的变量（#var 或 @var）
+_VAR_REF_RE = re.compile(r'[#@]([a-zA-Z0-9_]+)')
+
+# 文本倒排索引使用的n-gram长度（三元组）
+_GRAM_SIZE = 3
+
+def _grams(text):
+    """返回文本中所有长度为_GRAM_SIZE的子串"""
+    return {text[start:start + _GRAM_SIZE] for start in range(len(text) - _GRAM_SIZE + 1)}
+
+def _add_site(sites, key, node):
+    """在 {key: {node: 次数}} 映射中记录一次出现"""
+    nodes = sites.get(key)
+    if nodes is None:
+        nodes = sites[key] = {}
+    nodes[node] = nodes.get(node, 0) + 1
+
+def _remove_site(sites, key, node):
+    """在 {key: {node: 次数}} 映射中移除一次出现"""
+    nodes = sites.get(key)
+    if nodes is None:
+        return
+    count = nodes.get(node, 0) - 1
+    if count > 0:
+        nodes[node] = count
+    else:
+        nodes.pop(node, None)
+        if not nodes:
+            del sites[key]
+
+class DocumentIndex:
+    """
+    文档索引：一次遍历建立，编辑时增量维护
+    
+    搜索、自动补全等功能从这里查询，不再各自递归遍历整棵树。包含：
+        tag_elements: {标签名: {元素: 次数}}
+        attribute_values: {属性名: {属性值: {元素: 次数}}}
+        declared_vars: {name属性声明的变量名: {元素: 次数}}
+        reference_sites: {#var/@var引用的变量名: {元素: 次数}}
+        variable_names: {变量名: 次数}，声明和引用的变量名合计，供补全使用
+    补全器据value_versions和variables_version判断缓存的补全列表是否过期：
+    某个属性出现新的值或某个值不再出现时更新value_versions[属性名]，
+    变量名出现或消失时更新variables_version，值的次数变化不更新版本。
+    全局文本搜索使用三元组倒排索引（三元组 -> 包含它的小写文本），
+    查询时只检查同时包含查询中所有三元组的文本，不再扫描全部文本。
+    每个节点被索引的内容单独记录，节点修改或删除时据此撤销原来的索引项。
+    """
+    def __init__(self, root=None):
+        """
+        Args:
+            root: 要建立索引的根元素，可以为None
+        """
+        # 版本号在重建后继续递增，不会与重建前的版本相同
+        self._versions = itertools.count(1)
+        self.rebuild(root)
+    
+    def rebuild(self, root):
+        """丢弃现有数据，重新为整个文档建立索引"""
+        self.root = root
+        self.tag_elements = {}
+        self.attribute_values = {}
+        self.declared_vars = {}
+        self.reference_sites = {}
+        self.variable_names = {}
+        
+        # 属性名 -> 该属性的值集合的版本；变量名集合的版本
+        self.value_versions = {}
+        self.variables_version = next(self._versions)
+        
+        # 小写文本 -> 节点，分别用于全局文本搜索（标签、属性值、文本、注释）和属性值搜索
+        self.text_sites = {}
+        self.attribute_sites = {}
+        # 三元组 -> 包含它的text_sites键
+        self._text_grams = {}
+        
+        # 节点 -> 该节点贡献的索引项，用于增量更新
+        self._records = {}
+        
+        if root is not None:
+            for node in root.iter():
+                self._index_node(node)
+    
+    def __contains__(self, node):
+        return node in self._records
+    
+    def __len__(self):
+        return len(self._records)
+    
+    # ---- 增量维护 ----
+    
+    def add_subtree(self, node):
+        """为插入文档的节点及其子孙建立索引（已有的索引项会先被移除）"""
+        for current in node.iter():
+            if current in self._records:
+                self._unindex_node(current)
+            self._index_node(current)
+    
+    def remove_subtree(self, node):
+        """移除被删除节点及其子孙的索引"""
+        for current in node.iter():
+            if current in self._records:
+                self._unindex_node(current)
+    
+    def update_node(self, node):
+        """节点自身的标签、属性或文本变化后重新索引该节点"""
+        if node in self._records:
+            self._unindex_node(node)
+        self._index_node(node)
+    
+    def _add_text_site(self, key, node):
+        """记录可被全局搜索的文本，新出现的文本同时加入三元组索引"""
+        nodes = self.text_sites.get(key)
+        if nodes is None:
+            nodes = self.text_sites[key] = {}
+            text_grams = self._text_grams
+            for gram in _grams(key):
+                keys = text_grams.get(gram)
+                if keys is None:
+                    text_grams[gram] = {key}
+                else:
+                    keys.add(key)
+        nodes[node] = nodes.get(node, 0) + 1
+    
+    def _remove_text_site(self, key, node):
+        """移除可被全局搜索的文本，不再出现的文本同时移出三元组索引"""
+        _remove_site(self.text_sites, key, node)
+        if key not in self.text_sites:
+            for gram in _grams(key):
+                keys = self._text_grams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._text_grams[gram]
+    
+    def _index_node(self, node):
+        """记录一个节点的索引项"""
+        if isinstance(node, etree._Comment):
+            text = node.text or ''
+            record = (None, (), text)
+            if text:
+                self._add_text_site(text.lower(), node)
+            self._records[node] = record
+            return
+        
+        if not isinstance(node.tag, str):
+            # 处理指令、实体等不参与索引
+            return
+        
+        tag = node.tag
+        attributes = tuple(node.attrib.items())
+        text = node.text if node.text and node.text.strip() else ''
+        self._records[node] = (tag, attributes, text)
+        
+        _add_site(self.tag_elements, tag, node)
+        self._add_text_site(tag.lower(), node)
+        if text:
+            self._add_text_site(text.lower(), node)
+        
+        for attr_name, attr_value in attributes:
+            values = self.attribute_values.get(attr_name)
+            if values is None:
+                values = self.attribute_values[attr_name] = {}
+            if attr_value not in values:
+                self.value_versions[attr_name] = next(self._versions)
+            _add_site(values, attr_value, node)
+            
+            lowered = attr_value.lower()
+            self._add_text_site(lowered, node)
+            _add_site(self.attribute_sites, lowered, node)
+            
+            # 提取name属性的值（供引用使用）
+            if attr_name == "name":
+                _add_site(self.declared_vars, attr_value, node)
+                self._add_variable(attr_value)
+            
+            # 从属性值中提取所有引用的变量名
+            if "#" in attr_value or "@" in attr_value:
+                for var_name in _VAR_REF_RE.findall(attr_value):
+                    _add_site(self.reference_sites, var_name, node)
+                    self._add_variable(var_name)
+    
+    def _unindex_node(self, node):
+        """撤销一个节点的索引项"""
+        tag, attributes, text = self._records.pop(node)
+        if text:
+            self._remove_text_site(text.lower(), node)
+        if tag is None:
+            return
+        
+        _remove_site(self.tag_elements, tag, node)
+        self._remove_text_site(tag.lower(), node)
+        
+        for attr_name, attr_value in attributes:
+            values = self.attribute_values.get(attr_name)
+            if values is not None:
+                _remove_site(values, attr_value, node)
+                if attr_value not in values:
+                    self.value_versions[attr_name] = next(self._versions)
+                if not values:
+                    del self.attribute_values[attr_name]
+            
+            lowered = attr_value.lower()
+            self._remove_text_site(lowered, node)
+            _remove_site(self.attribute_sites, lowered, node)
+            
+            var_names = []
+            if attr_name == "name":
+                _remove_site(self.declared_vars, attr_value, node)
+                var_names.append(attr_value)
+            if "#" in attr_value or "@" in attr_value:
+                for var_name in _VAR_REF_RE.findall(attr_value):
+                    _remove_site(self.reference_sites, var_name, node)
+                    var_names.append(var_name)
+            for var_name in var_names:
+                count = self.variable_names.get(var_name, 0) - 1
+                if count > 0:
+                    self.variable_names[var_name] = count
+                elif self.variable_names.pop(var_name, None) is not None:
+                    self.variables_version = next(self._versions)
+    
+    def _add_variable(self, var_name):
+        """变量名出现次数加一，新出现的变量名更新变量版本"""
+        count = self.variable_names.get(var_name, 0)
+        if not count:
+            self.variables_version = next(self._versions)
+        self.variable_names[var_name] = count + 1
+    
+    # ---- 查询 ----
+    
+    def elements_with_tag(self, tag):
+        """按文档顺序返回指定标签的所有元素"""
+        return self.document_order(self.tag_elements.get(tag, ()))
+    
+    def node_variables(self, node):
+        """
+        节点声明（name属性）和引用（#var/@var）的变量名
+        
+        Args:
+            node: 文档中的节点
+        
+        Returns:
+            变量名列表，未被索引的节点返回空列表
+        """
+        record = self._records.get(node)
+        if record is None:
+            return []
+        names = []
+        for attr_name, attr_value in record[1]:
+            if attr_name == "name":
+                names.append(attr_value)
+            if "#" in attr_value or "@" in attr_value:
+                names.extend(_VAR_REF_RE.findall(attr_value))
+        return names
+    
+    def find_text(self, search_text, exact=False):
+        """
+        在标签名、属性值、元素文本和注释中搜索（不区分大小写）
+        
+        Args:
+            search_text: 搜索文本
+            exact: 为True时要求整个值与搜索文本相同，否则为包含匹配
+        
+        Returns:
+            按文档顺序排列的匹配节点列表
+        """
+        search_text = search_text.lower()
+        if exact:
+            return self.document_order(self.text_sites.get(search_text, ()))
+        
+        found = set()
+        for key in self._matching_text_keys(search_text):
+            found.update(self.text_sites[key])
+        return self.document_order(found)
+    
+    def _matching_text_keys(self, search_text):
+        """通过三元组索引找出包含search_text的所有文本"""
+        if len(search_text) < _GRAM_SIZE:
+            # 一两个字符的查询本来就会匹配大量文本，直接扫描不同的文本即可
+            return [key for key in self.text_sites if search_text in key]
+        if len(search_text) == _GRAM_SIZE:
+            return self._text_grams.get(search_text, ())
+        
+        # 候选文本必须包含查询中的每个三元组，从最少的集合开始求交集
+        candidates = []
+        for start in range(len(search_text) - _GRAM_SIZE + 1):
+            keys = self._text_grams.get(search_text[start:start + _GRAM_SIZE])
+            if not keys:
+                return ()
+            candidates.append(keys)
+        candidates.sort(key=len)
+        keys = candidates[0].intersection(*candidates[1:])
+        
+        # 三元组都出现不代表整个查询连续出现，需要再确认
+        return [key for key in keys if search_text in key]
+    
+    def find_by_attribute(self, attr_name, attr_value=None):
+        """
+        查找具有指定属性（值包含attr_value，不区分大小写）的元素
+        
+        Args:
+            attr_name: 属性名，为空时在所有属性值中查找
+            attr_value: 属性值中应包含的文本，为空时只要求存在该属性
+        
+        Returns:
+            按文档顺序排列的匹配元素列表
+        """
+        attr_value = (attr_value or '').lower()
+        found = set()
+        if attr_name:
+            for value, nodes in self.attribute_values.get(attr_name, {}).items():
+                if not attr_value or attr_value in value.lower():
+                    found.update(nodes)
+        elif attr_value:
+            for key, nodes in self.attribute_sites.items():
+                if attr_value in key:
+                    found.update(nodes)
+        return self.document_order(found)
+    
+    def document_order(self, nodes):
+        """把一组节点按其在文档中的顺序排列"""
+        nodes = [node for node in nodes if node in self._records]
+        if len(nodes) < 2:
+            return nodes
+        
+        if len(nodes) * 8 > len(self._records):
+            # 结果较多时一次遍历比逐个计算位置更快
+            wanted = set(nodes)
+            return [node for node in self.root.iter() if node in wanted]
+        return sorted(nodes, key=self._order_key)
+    
+    def _order_key(self, node):
+        """节点从根元素开始的各级子节点序号"""
+        key = []
+        parent = node.getparent()
+        while parent is not None:
+            key.append(parent.index(node))
+            node = parent
+            parent = node.getparent()
+        key.reverse()
+        return key
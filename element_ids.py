@@ -0,0 +1,212 @@
+import hashlib
+import uuid
+from lxml import etree
+
+def _digest(text):
+    """文本的短哈希（8位十六进制）"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:8]
+
+def element_fingerprint(node):
+    """
+    节点的结构指纹：元素为标签名加name属性，注释为注释文本
+    
+    指纹不包含位置和其他属性，修改坐标等属性或移动节点后保持不变。
+    """
+    if isinstance(node, etree._Comment):
+        return "#comment\0" + (node.text or '').strip()
+    return node.tag + "\0" + (node.get("name") or '')
+
+def iter_positions(root):
+    """
+    按文档顺序遍历元素和注释节点，返回(节点, 位置路径)
+    
+    位置路径由各级标签名和同一父元素下同名节点的序号组成，只遍历一次文档。
+    """
+    if root is None:
+        return
+    root_path = f"/{root.tag}[0]"
+    yield root, root_path
+    stack = [(root, root_path)]
+    while stack:
+        parent, parent_path = stack.pop()
+        counts = {}
+        children = []
+        for child in parent:
+            if isinstance(child, etree._Comment):
+                tag = "#comment"
+            elif isinstance(child.tag, str):
+                tag = child.tag
+            else:
+                # 处理指令、实体等不分配ID
+                continue
+            index = counts.get(tag, 0)
+            counts[tag] = index + 1
+            children.append((child, f"{parent_path}/{tag}[{index}]"))
+        for child, path in children:
+            yield child, path
+        # 逆序入栈，保证按文档顺序处理各个子元素
+        for child, path in reversed(children):
+            if len(child):
+                stack.append((child, path))
+
+def canonical_id(node, path):
+    """节点在当前位置的规范ID：结构指纹的哈希加位置路径的哈希"""
+    return _digest(element_fingerprint(node)) + _digest(path)
+
+class ElementIdRegistry:
+    """
+    为元素分配在撤销、重新解析和重新加载后保持不变的ID
+    
+    打开文件时每个节点的ID是其规范ID（指纹哈希+位置哈希），因此同一个文件
+    再次打开时得到相同的ID。编辑过程中ID跟随元素对象，移动或修改属性不会改变ID。
+    文档被重新解析后（应用代码更改、外部修改重新加载、撤销这些操作），
+    reconcile按位置和指纹把旧文档的ID一次性转移到新文档的节点上。
+    保存到文件时用canonical_key把ID换算为节点当前位置的规范ID，供下次打开时匹配。
+    """
+    def __init__(self):
+        self.root = None
+        self._ids = {}  # 节点 -> ID
+        self._elements = {}  # ID -> 节点
+        self._previous_ids = {}  # 上一次被替换的文档中的 节点 -> ID，撤销替换时直接恢复
+        self._canonical = None  # 当前文档的 {ID: 规范ID}，文档变化后重新计算
+    
+    def rebuild(self, root):
+        """为新打开的文档分配规范ID"""
+        self.root = root
+        self._ids = {}
+        self._elements = {}
+        self._previous_ids = {}
+        self._canonical = None
+        for node, path in iter_positions(root):
+            self._register(node, canonical_id(node, path))
+    
+    def reconcile(self, root):
+        """
+        文档被替换为新解析的树后，把旧文档节点的ID转移到新文档中对应的节点
+        
+        依次按以下规则匹配，只遍历新旧文档各一次：
+            1. 节点对象本身已有ID（撤销或重做替换文档后恢复的上一个文档）
+            2. 规范ID相同，即相同位置上指纹相同的节点
+            3. 指纹在新旧文档中都唯一的节点（被移动的节点）
+        其余节点使用新的规范ID。
+        """
+        old_positions = list(iter_positions(self.root))
+        old_ids = self._ids
+        previous_ids = self._previous_ids
+        self.root = root
+        self._ids = {}
+        self._elements = {}
+        self._previous_ids = old_ids
+        self._canonical = None
+        self._match(old_positions, old_ids, previous_ids, list(iter_positions(root)), canonical_id)
+    
+    def transfer(self, old, new):
+        """
+        文档中的一个子树被重新解析的副本替换后，把旧子树节点的ID转移到新子树中对应的节点
+        
+        匹配规则与reconcile相同，位置按子树内的相对路径计算；没有对应的节点分配新的ID。
+        撤销替换时以新旧子树对调再调用一次，旧子树的节点恢复原来的ID。
+        
+        Args:
+            old: 被替换、已不在文档中的节点
+            new: 替换后在文档中的节点
+        """
+        old_positions = list(iter_positions(old))
+        old_ids = {}
+        for node, path in old_positions:
+            node_id = self._ids.pop(node, None)
+            if node_id is not None:
+                self._elements.pop(node_id, None)
+                old_ids[node] = node_id
+        self._previous_ids.update(old_ids)
+        self._canonical = None
+        self._match(old_positions, old_ids, self._previous_ids, list(iter_positions(new)),
+                    lambda node, path: None)
+    
+    def _match(self, old_positions, old_ids, previous_ids, positions, default_id):
+        """
+        按reconcile中的规则为positions中的节点分配old_positions中节点的ID
+        
+        Args:
+            old_positions: 旧节点及其位置路径
+            old_ids: 旧节点 -> ID
+            previous_ids: 更早被替换的节点 -> ID，节点对象本身重新出现时直接使用
+            positions: 新节点及其位置路径
+            default_id: 没有匹配时的ID default_id(节点, 路径)，为None或已被使用时分配随机ID
+        """
+        # 旧节点中每个规范ID和每个指纹对应的ID
+        old_by_canonical = {}
+        old_by_fingerprint = {}
+        for node, path in old_positions:
+            node_id = old_ids.get(node)
+            if node_id is None:
+                continue
+            old_by_canonical[canonical_id(node, path)] = node_id
+            fingerprint = _digest(element_fingerprint(node))
+            old_by_fingerprint[fingerprint] = node_id if fingerprint not in old_by_fingerprint else None
+        
+        new_fingerprint_counts = {}
+        for node, path in positions:
+            fingerprint = _digest(element_fingerprint(node))
+            new_fingerprint_counts[fingerprint] = new_fingerprint_counts.get(fingerprint, 0) + 1
+        
+        unmatched = []
+        for node, path in positions:
+            node_id = old_ids.get(node) or previous_ids.get(node)
+            if node_id is None or node_id in self._elements:
+                node_id = old_by_canonical.get(canonical_id(node, path))
+            if node_id is None or node_id in self._elements:
+                unmatched.append((node, path))
+            else:
+                self._register(node, node_id)
+        
+        for node, path in unmatched:
+            fingerprint = _digest(element_fingerprint(node))
+            node_id = old_by_fingerprint.get(fingerprint)
+            if node_id is None or node_id in self._elements or new_fingerprint_counts[fingerprint] != 1:
+                node_id = default_id(node, path)
+                if node_id is None or node_id in self._elements:
+                    node_id = uuid.uuid4().hex
+            self._register(node, node_id)
+    
+    def invalidate(self):
+        """文档结构或节点指纹变化后调用，下次需要时重新计算规范ID"""
+        self._canonical = None
+    
+    def _register(self, node, node_id):
+        self._ids[node] = node_id
+        self._elements[node_id] = node
+    
+    def id_of(self, node):
+        """
+        获取节点的ID，编辑中新建的节点分配新的ID
+        
+        Args:
+            node: 元素或注释节点
+        """
+        node_id = self._ids.get(node)
+        if node_id is None:
+            # 刚被替换的文档中的节点返回其ID（已转移到新文档的对应节点上）
+            node_id = self._previous_ids.get(node)
+        if node_id is None:
+            node_id = uuid.uuid4().hex
+            self._register(node, node_id)
+        return node_id
+    
+    def element_of(self, node_id):
+        """根据ID查找节点，不存在时返回None"""
+        return self._elements.get(node_id)
+    
+    def canonical_key(self, node_id):
+        """
+        ID对应节点在当前文档中的规范ID，用于保存到文件
+        
+        节点已不在文档中时返回None。
+        """
+        if self._canonical is None:
+            self._canonical = {}
+            for node, path in iter_positions(self.root):
+                known_id = self._ids.get(node)
+                if known_id is not None:
+                    self._canonical[known_id] = canonical_id(node, path)
+        return self._canonical.get(node_id)
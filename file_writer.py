@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# 新建文件的默认权限与open()相同，受umask限制；umask只能通过设置来读取，在导入时读取一次
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def text_digest(text):
+    """文本内容的哈希"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def content_digest(data):
+    """
+    文件内容（字节）的哈希，统一换行符后计算
+    
+    直接使用原始字节，不需要解码，文件使用任何编码都可以计算；
+    同一内容用\r\n、\r或\n换行得到相同的哈希。
+    """
+    return hashlib.md5(data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')).hexdigest()
+
+def _file_digest(path, encoding='utf-8'):
+    """磁盘上文件内容的哈希，文件不存在或无法读取时返回None"""
+    try:
+        with open(path, 'r', encoding=encoding) as f:
+            return text_digest(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def atomic_write(path, text, encoding='utf-8'):
+    """
+    原子地写入文本文件
+    
+    先写入同一目录下的临时文件并刷新到磁盘，再用os.replace替换目标文件。
+    写入中途出错或程序退出时，目标文件仍是原来的完整内容，不会被截断。
+    已存在的文件保留原来的权限。
+    
+    Args:
+        path: 目标文件路径
+        text: 文件内容
+        encoding: 文件编码
+    
+    Raises:
+        OSError: 写入或替换失败时，临时文件已被删除
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def write_json(path, data, writer=None):
+    """
+    以原来json.dump的格式（不转义中文，缩进2）保存JSON文件
+    
+    Args:
+        path: 文件路径
+        data: 要保存的数据，在调用时即被序列化
+        writer: 可选，SidecarWriter，指定时在后台写入，内容未变化时跳过；否则立即原子写入
+    """
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if writer is None:
+        atomic_write(path, text)
+    else:
+        writer.submit(path, text)
+
+class SidecarWriter:
+    """
+    在后台线程中写入附属文件（注释、列宽等JSON文件），保存时界面不必等待磁盘
+    
+    submit在界面线程中调用，只比较内容的哈希：与上次提交的内容（首次提交时与磁盘上的内容）
+    相同时直接跳过。内容变化的文件交给后台线程用atomic_write写入，
+    同一文件尚未写入的旧内容被新内容取代，只写入最新的一份。
+    程序退出前调用stop，等待所有写入完成，之后提交的内容直接写入。
+    """
+    def __init__(self):
+        self._hashes = {}  # 路径 -> 最近一次提交的内容的哈希
+        self._pending = {}  # 路径 -> 等待写入的文本
+        self._busy = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='SidecarWriter', daemon=True)
+        self._thread.start()
+    
+    def submit(self, path, text):
+        """
+        提交文件的新内容
+        
+        Args:
+            path: 文件路径
+            text: 文件内容
+        
+        Returns:
+            内容有变化、已安排写入时返回True，内容未变化时返回False
+        """
+        path = os.path.abspath(path)
+        digest = text_digest(text)
+        with self._condition:
+            if path not in self._hashes:
+                self._hashes[path] = _file_digest(path)
+            if self._hashes[path] == digest:
+                return False
+            self._hashes[path] = digest
+            stopped = self._stopped
+            if not stopped:
+                self._pending[path] = text
+                self._condition.notify_all()
+        if stopped:
+            # 后台线程已结束（窗口已关闭），直接写入
+            atomic_write(path, text)
+        return True
+    
+    def flush(self, timeout=None):
+        """
+        等待已提交的内容全部写入
+        
+        Returns:
+            在超时之前全部写入时返回True
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+    
+    def stop(self):
+        """写入所有已提交的内容后结束后台线程"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                path, text = self._pending.popitem()
+                self._busy = True
+            
+            try:
+                atomic_write(path, text)
+            except Exception as e:
+                print(f"写入文件失败: {path}: {e}")
+                with self._condition:
+                    # 下次提交相同的内容时重新写入
+                    if self._hashes.get(path) == text_digest(text):
+                        del self._hashes[path]
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
@@ -0,0 +1,61 @@
+def column_attribute(column):
+    """
+    自定义列对应的属性名
+    
+    以"值"结尾的列名去掉"值"，Name（不区分大小写）统一为小写的name。
+    """
+    name = column[:-1] if column.endswith("值") else column
+    if name.lower() == "name":
+        name = "name"
+    return name
+
+class TreeColumnPlan:
+    """
+    结构树各列的填充方案，由列配置生成，列配置变化（ColumnConfigDialog确定）后重新生成
+    
+    生成时确定功能注释列、作用注释列的位置，以及每个属性列的位置和实际的属性名，
+    结构树模型读取一个单元格时只需查找注释或属性，不必再查找列的位置或处理列名。
+    列的含义："功能注释"显示标签的功能注释，"作用注释"或"使用说明"（默认配置中的列名）
+    显示元素的作用注释，"Name值"显示name属性，自定义列显示对应的属性。
+    """
+    def __init__(self, visible_columns, custom_columns):
+        """
+        Args:
+            visible_columns: 当前可见的列名，第一列为元素列
+            custom_columns: 自定义列名
+        """
+        self.headers = list(visible_columns)
+        self.feature_column = None
+        self.usage_column = None
+        self.attributes = {}  # {列位置: 属性名}
+        
+        if '功能注释' in self.headers:
+            self.feature_column = self.headers.index('功能注释')
+        for name in ('作用注释', '使用说明'):
+            if name in self.headers:
+                self.usage_column = self.headers.index(name)
+                break
+        if 'Name值' in self.headers:
+            self.attributes[self.headers.index('Name值')] = "name"
+        for column in custom_columns:
+            if column in self.headers:
+                self.attributes[self.headers.index(column)] = column_attribute(column)
+    
+    def text(self, element, column, feature_comments, usage_comment):
+        """
+        元素在元素列以外某一列中显示的文本
+        
+        Args:
+            element: 元素
+            column: 列位置
+            feature_comments: {标签: 功能注释}
+            usage_comment: 函数，参数为元素，返回其作用注释（可以为None）；只在读取作用注释列时调用
+        """
+        if column == self.feature_column:
+            return feature_comments.get(element.tag) or ""
+        if column == self.usage_column:
+            return usage_comment(element) or ""
+        name = self.attributes.get(column)
+        if name is None:
+            return ""
+        return element.get(name) or ""
@@ -1,20 +1,32 @@
 from lxml import etree
+from PyQt5.QtCore import QItemSelectionModel
 
 class TreeStateManager:
     """
     管理树视图状态的类，用于保存和恢复树视图的展开状态和滚动位置
+    
+    树视图的模型为XmlTreeModel，只遍历模型已缓存的行（视图访问过的部分）。
+    节点同时按元素对象、元素ID（提供element_id时）和路径记录：元素未变时直接按对象匹配，
+    文档被重新解析（元素对象已更换）时按稳定ID匹配，最后才按路径匹配。
+    保存和恢复都只自上而下遍历一次树，路径在遍历中逐级拼接，查找使用集合。
     """
-    def __init__(self, tree_widget):
+    def __init__(self, tree_widget, element_id=None):
         """
         初始化状态管理器
         
         Args:
-            tree_widget: 要管理状态的树视图控件
+            tree_widget: 要管理状态的树视图（模型为XmlTreeModel）
+            element_id: 可选，返回元素稳定ID的函数，重新解析后仍能关联到对应元素
         """
         self.tree_widget = tree_widget
-        self.expanded_paths = []
+        self.element_id = element_id
+        self.expanded_elements = set()
+        self.expanded_ids = set()
+        self.expanded_paths = set()
         self.scroll_position = 0
-        self.selected_paths = []
+        self.selected_elements = set()
+        self.selected_ids = set()
+        self.selected_paths = set()
     
     def save_state(self):
         """
@@ -25,243 +37,109 @@ class TreeStateManager:
         if scrollbar:
             self.scroll_position = scrollbar.value()
         
-        # 保存展开状态
-        self.expanded_paths = []
-        self._save_expanded_state(None)
-        
-        # 保存选中状态
-        self.selected_paths = []
-        self._save_selected_state()
+        # 保存展开状态和选中状态
+        self.expanded_elements = set()
+        self.expanded_ids = set()
+        self.expanded_paths = set()
+        self.selected_elements = set()
+        self.selected_ids = set()
+        self.selected_paths = set()
+        model = self.tree_widget.model()
+        selection = self.tree_widget.selectionModel()
+        for element, path in self._iter_nodes():
+            index = model.cached_index(element)
+            if self.tree_widget.isExpanded(index):
+                self.expanded_paths.add(path)
+                self.expanded_elements.add(element)
+                if self.element_id:
+                    self.expanded_ids.add(self.element_id(element))
+            if selection.isSelected(index):
+                self.selected_paths.add(path)
+                self.selected_elements.add(element)
+                if self.element_id:
+                    self.selected_ids.add(self.element_id(element))
         
         return self
     
-    def _get_item_path(self, item):
-        """获取树节点的路径。"""
-        path_parts = []
-        current_item = item
-
-        while current_item:
-            if hasattr(current_item, 'element'):
-                element = current_item.element
-                if isinstance(element, etree._Comment):
-                    # 对于注释节点，使用完整的注释文本作为路径部分
-                    path_parts.insert(0, f"<!--{element.text.strip()}-->")
-                else:
-                    # 对于普通元素节点，使用标签名和索引
-                    tag = element.tag
-                    parent = current_item.parent()
-                    if parent:
-                        index = 0
-                        for i in range(parent.childCount()):
-                            sibling = parent.child(i)
-                            if (hasattr(sibling, 'element') and 
-                                sibling.element.tag == tag):
-                                if sibling == current_item:
-                                    break
-                                index += 1
-                        path_parts.insert(0, f"{tag}[{index}]")
-                    else:
-                        path_parts.insert(0, tag)
-            current_item = current_item.parent()
-
-        return '/'.join(path_parts)
-    
-    def _save_expanded_state(self, parent_item):
+    def _iter_nodes(self):
         """
-        递归保存展开状态
+        自上而下遍历模型已缓存的所有节点，返回(节点, 路径)
         
-        Args:
-            parent_item: 父节点，如果为None则表示根节点
+        遍历到某个节点时才读取它的子节点缓存，因此在遍历中展开节点后，
+        模型为它读取的子节点同样会被遍历到。
         """
-        items = []
-        if parent_item is None:
-            # 获取顶层项目
-            for i in range(self.tree_widget.topLevelItemCount()):
-                items.append(self.tree_widget.topLevelItem(i))
-        else:
-            # 获取子项目
-            for i in range(parent_item.childCount()):
-                items.append(parent_item.child(i))
-        
-        # 遍历所有项目
-        for item in items:
-            if item.isExpanded():
-                # 保存展开状态
-                path = self._get_item_path(item)
-                self.expanded_paths.append(path)
+        model = self.tree_widget.model()
+        if model.root is None:
+            return
+        stack = [(None, '')]
+        while stack:
+            parent_node, parent_path = stack.pop()
+            
+            # 同一父节点下同名元素的序号
+            tag_counts = {}
+            children = []
+            nodes = [model.root] if parent_node is None else model.loaded_children(parent_node)
+            for node in nodes:
+                path = parent_path + '/' + self._path_part(node, tag_counts)
+                children.append((node, path))
             
-            # 递归处理子项目
-            self._save_expanded_state(item)
+            for node, path in children:
+                yield node, path
+                stack.append((node, path))
     
-    def _save_selected_state(self):
-        """保存选中项的状态"""
-        for item in self.tree_widget.selectedItems():
-            path = self._get_item_path(item)
-            self.selected_paths.append(path)
+    def _path_part(self, element, tag_counts):
+        """
+        节点在路径中的一段
+        
+        Args:
+            element: 元素或注释节点
+            tag_counts: 同一父节点下已出现的各标签数量，会被更新
+        """
+        if isinstance(element, etree._Comment):
+            # 对于注释节点，使用完整的注释文本作为路径部分
+            return f"<!--{(element.text or '').strip()}-->"
+        
+        # 对于普通元素节点，使用标签名和同名元素中的序号
+        tag = element.tag
+        index = tag_counts.get(tag, 0)
+        tag_counts[tag] = index + 1
+        return f"{tag}[{index}]"
     
     def restore_state(self):
         """
         恢复树视图的状态
         """
-        # 不再先收起所有节点，直接恢复展开状态
-        # 遍历树中所有项目并根据保存的展开路径设置状态
-        self._restore_expanded_state(None)
-        
-        # 恢复选中状态
-        self.tree_widget.clearSelection()
-        for path in self.selected_paths:
-            item = self._find_item_by_path(path)
-            if item:
-                item.setSelected(True)
+        # 不再先收起所有节点，直接恢复展开状态和选中状态
+        model = self.tree_widget.model()
+        selection = self.tree_widget.selectionModel()
+        selection.clearSelection()
+        for element, path in self._iter_nodes():
+            if element in self.expanded_elements or element in self.selected_elements:
+                # 元素对象未变
+                expanded = element in self.expanded_elements
+                selected = element in self.selected_elements
+            elif self.element_id:
+                # 重新解析后的新元素按稳定ID匹配
+                element_id = self.element_id(element)
+                expanded = element_id in self.expanded_ids
+                selected = element_id in self.selected_ids
+            else:
+                expanded = path in self.expanded_paths
+                selected = path in self.selected_paths
+            
+            index = model.cached_index(element)
+            if self.tree_widget.isExpanded(index) != expanded:
+                self.tree_widget.setExpanded(index, expanded)
+            if expanded:
+                # 让模型读取子节点，使其在遍历中被恢复
+                model.rowCount(index)
+            if selected:
+                selection.select(index, QItemSelectionModel.Select | QItemSelectionModel.Rows)
         
         # 最后恢复滚动位置
         scrollbar = self.tree_widget.verticalScrollBar()
         if scrollbar:
             scrollbar.setValue(self.scroll_position)
-            
+        
         # 强制刷新视图
         self.tree_widget.viewport().update()
-    
-    def _restore_expanded_state(self, parent_item):
-        """
-        递归恢复展开状态，而不是先收起所有节点
-        
-        Args:
-            parent_item: 父节点，如果为None则表示根节点
-        """
-        items = []
-        if parent_item is None:
-            # 获取顶层项目
-            for i in range(self.tree_widget.topLevelItemCount()):
-                items.append(self.tree_widget.topLevelItem(i))
-        else:
-            # 获取子项目
-            for i in range(parent_item.childCount()):
-                items.append(parent_item.child(i))
-        
-        # 遍历所有项目
-        for item in items:
-            path = self._get_item_path(item)
-            should_expand = path in self.expanded_paths
-            
-            # 如果该项在保存的展开路径中，则展开它
-            if should_expand:
-                item.setExpanded(True)
-            else:
-                item.setExpanded(False)
-            
-            # 递归处理子项目
-            self._restore_expanded_state(item)
-    
-    def _collapse_all(self, parent_item):
-        """
-        递归收起所有节点
-        
-        Args:
-            parent_item: 父节点，如果为None则表示根节点
-        """
-        items = []
-        if parent_item is None:
-            # 获取顶层项目
-            for i in range(self.tree_widget.topLevelItemCount()):
-                items.append(self.tree_widget.topLevelItem(i))
-        else:
-            # 获取子项目
-            for i in range(parent_item.childCount()):
-                items.append(parent_item.child(i))
-        
-        # 遍历所有项目
-        for item in items:
-            # 递归处理子项目
-            self._collapse_all(item)
-            
-            # 收起节点
-            item.setExpanded(False)
-    
-    def _find_item_by_path(self, path):
-        """
-        根据路径查找树节点
-        
-        Args:
-            path: 节点路径元组
-            
-        Returns:
-            找到的树节点，如果未找到则返回None
-        """
-        if not path:
-            return None
-        
-        # 从根节点开始查找
-        current_items = []
-        for i in range(self.tree_widget.topLevelItemCount()):
-            current_items.append(self.tree_widget.topLevelItem(i))
-        
-        # 逐级查找
-        for level, path_text in enumerate(path):
-            found = False
-            
-            # 检查当前级别的所有项目
-            for item in current_items:
-                item_text = item.text(0)
-                
-                # 如果有元素属性，使用更详细的比较
-                if hasattr(item, 'element'):
-                    element = item.element
-                    if isinstance(element, etree._Comment):
-                        # 对于注释节点，需要特殊处理
-                        current_comment = element.text.strip()
-                        path_comment = path_text
-                        # 如果路径文本以注释标记开始，去除它们
-                        if path_text.startswith('<!--') and path_text.endswith('-->'):
-                            path_comment = path_text[4:-3].strip()
-                        # 直接比较注释内容
-                        if current_comment != path_comment:
-                            continue
-                    else:
-                        # 处理普通元素
-                        tag_part = path_text.split('[')[0].split('#')[0]
-                        
-                        # 检查标签是否匹配
-                        if element.tag != tag_part:
-                            continue
-                        
-                        # 如果有唯一ID，优先使用ID匹配
-                        if '#' in path_text and hasattr(element, 'unique_id'):
-                            id_part = path_text.split('#')[1]
-                            if element.unique_id != id_part:
-                                continue
-                        
-                        # 检查属性是否匹配
-                        if '[' in path_text:
-                            attrs_part = path_text.split('[')[1].strip(']').split(',')
-                            match = True
-                            for attr in attrs_part:
-                                if '=' in attr:
-                                    key, value = attr.split('=')
-                                    if element.get(key) != value:
-                                        match = False
-                                        break
-                            if not match:
-                                continue
-                
-                # 如果是普通文本比较
-                elif item_text != path_text:
-                    continue
-                
-                # 找到匹配项
-                if level == len(path) - 1:
-                    # 如果是最后一级，返回该项
-                    return item
-                else:
-                    # 如果不是最后一级，继续查找下一级
-                    current_items = []
-                    for i in range(item.childCount()):
-                        current_items.append(item.child(i))
-                    found = True
-                    break
-            
-            if not found:
-                # 如果当前级别未找到匹配项，则返回None
-                return None
-        
-        return None 
\ No newline at end of file
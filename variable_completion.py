@@ -0,0 +1,226 @@
+import bisect
+import heapq
+
+# 匹配方式的等级：前缀匹配 > 包含匹配 > 子序列匹配（按顺序出现查询中的所有字符）
+_PREFIX = 3
+_SUBSTRING = 2
+_SUBSEQUENCE = 1
+
+# 计算邻近程度时向上查看的祖先层数，以及最多检查的节点数
+_PROXIMITY_LEVELS = 3
+_PROXIMITY_BUDGET = 2000
+
+def _is_subsequence(query, text):
+    """query中的字符是否按顺序出现在text中"""
+    position = 0
+    for char in query:
+        position = text.find(char, position) + 1
+        if not position:
+            return False
+    return True
+
+class VariableCompletion:
+    """
+    #var/@var引用的补全：返回按匹配方式、与编辑中元素的邻近程度和使用次数排序的前N个变量名
+    
+    变量名来自DocumentIndex.variable_names，只在索引的变量集合变化（variables_version改变）后
+    重新生成以下结构：
+        按小写排序的变量名数组，前缀匹配的变量名是其中连续的一段，用二分查找确定
+        按使用次数的静态排名和区间最大值的稀疏表，在任意一段中依次取出排名最高的变量名
+        字符 -> 包含该字符的变量名位置，子序列匹配只检查包含查询中最少见字符的变量名
+    查询时前缀匹配的数量足够时只取该段中排名最高的limit个和邻近的变量名排序，与变量总数无关；
+    不足时再按包含和子序列匹配补充，继续输入（查询变长）时只在上一次的候选中筛选。
+    同一种匹配方式中，离编辑中元素近的变量（在元素本身、父元素或祖父元素的子树中出现）优先，
+    其次是在文档中出现次数多的变量。
+    """
+    def __init__(self, limit=50):
+        """
+        Args:
+            limit: 每次查询返回的最大数量
+        """
+        self.limit = limit
+        self.document_index = None
+        self._version = None
+        self._names = []  # 按小写排序的变量名
+        self._lowered = []  # 对应的小写变量名
+        self._positions = {}  # 变量名 -> 在数组中的位置
+        self._rank = []  # 生成数组时的排名，使用次数多、较短的变量名排名高
+        self._table = []  # 稀疏表，_table[j][i]为从i开始的2**j个位置中排名最高的位置
+        self._buckets = {}  # 字符 -> 包含该字符的变量名位置
+        # 上一次筛选子序列匹配的查询和候选位置
+        self._last_query = None
+        self._last_candidates = None
+        # 变量名 -> 与编辑中元素的邻近程度（越大越近）
+        self._proximity = {}
+    
+    def set_document_index(self, document_index):
+        """使用另一个文档索引，已生成的数组作废"""
+        if document_index is not self.document_index:
+            self.document_index = document_index
+            self._version = None
+    
+    def set_context(self, element):
+        """
+        设置正在编辑的元素，计算各变量与它的邻近程度
+        
+        从元素本身开始逐层向上，在各个祖先的子树中出现的变量获得相应的邻近程度，
+        层数越少越大；最多检查_PROXIMITY_BUDGET个节点。
+        
+        Args:
+            element: 正在编辑的元素，为None时不考虑邻近程度
+        """
+        self._proximity = {}
+        index = self.document_index
+        if element is None or index is None:
+            return
+        
+        budget = _PROXIMITY_BUDGET
+        scope = None
+        node = element
+        for level in range(_PROXIMITY_LEVELS):
+            if node is None or budget <= 0:
+                break
+            weight = _PROXIMITY_LEVELS - level
+            # 只检查这一层新增的节点：祖先本身及其除上一层以外的子树
+            if scope is None:
+                subtrees = [node]
+            else:
+                subtrees = [child for child in node if child is not scope]
+                self._add_proximity(index.node_variables(node), weight)
+                budget -= 1
+            for subtree in subtrees:
+                for current in subtree.iter():
+                    self._add_proximity(index.node_variables(current), weight)
+                    budget -= 1
+                    if budget <= 0:
+                        break
+                if budget <= 0:
+                    break
+            scope = node
+            node = node.getparent()
+    
+    def _add_proximity(self, names, weight):
+        for name in names:
+            if self._proximity.get(name, 0) < weight:
+                self._proximity[name] = weight
+    
+    def _refresh(self):
+        """索引的变量集合变化后重新生成排序的数组、稀疏表和字符索引"""
+        index = self.document_index
+        version = index.variables_version if index is not None else None
+        if version == self._version:
+            return
+        self._version = version
+        counts = index.variable_names if index is not None else {}
+        names = sorted(counts, key=str.lower)
+        self._names = names
+        self._lowered = [name.lower() for name in names]
+        self._positions = {name: i for i, name in enumerate(names)}
+        self._last_query = None
+        self._last_candidates = None
+        
+        order = sorted(range(len(names)), key=lambda i: (-counts[names[i]], len(names[i]), i))
+        rank = [0] * len(names)
+        for position, i in enumerate(order):
+            rank[i] = len(names) - position
+        self._rank = rank
+        
+        table = [list(range(len(names)))]
+        width = 1
+        while width * 2 <= len(names):
+            previous = table[-1]
+            table.append([a if rank[a] > rank[b] else b for a, b in zip(previous, previous[width:])])
+            width *= 2
+        self._table = table
+        
+        buckets = {}
+        for i, lowered in enumerate(self._lowered):
+            for char in set(lowered):
+                bucket = buckets.get(char)
+                if bucket is None:
+                    buckets[char] = [i]
+                else:
+                    bucket.append(i)
+        self._buckets = buckets
+    
+    def _best(self, start, end):
+        """[start, end)中排名最高的位置"""
+        level = (end - start).bit_length() - 1
+        row = self._table[level]
+        a = row[start]
+        b = row[end - (1 << level)]
+        return a if self._rank[a] > self._rank[b] else b
+    
+    def _ranked_range(self, start, end, limit):
+        """按排名从高到低依次取出[start, end)中的limit个位置"""
+        result = []
+        if start >= end:
+            return result
+        best = self._best(start, end)
+        heap = [(-self._rank[best], best, start, end)]
+        while heap and len(result) < limit:
+            _, best, start, end = heapq.heappop(heap)
+            result.append(best)
+            for sub_start, sub_end in ((start, best), (best + 1, end)):
+                if sub_start < sub_end:
+                    sub_best = self._best(sub_start, sub_end)
+                    heapq.heappush(heap, (-self._rank[sub_best], sub_best, sub_start, sub_end))
+        return result
+    
+    def complete(self, query, limit=None):
+        """
+        查找与查询匹配的变量名
+        
+        Args:
+            query: 引用符号（#或@）之后已输入的文本，不区分大小写
+            limit: 返回的最大数量，默认为self.limit
+        
+        Returns:
+            按排名排列的变量名列表（不含引用符号）
+        """
+        self._refresh()
+        limit = self.limit if limit is None else limit
+        query = query.lower()
+        lowered = self._lowered
+        
+        # 前缀匹配的变量名在排序数组中是连续的一段；
+        # 其中排名最高的limit个加上邻近的变量就包含了最终结果
+        start = bisect.bisect_left(lowered, query)
+        end = bisect.bisect_left(lowered, query + '\uffff', start)
+        prefixed = set(self._ranked_range(start, end, limit))
+        for name in self._proximity:
+            i = self._positions.get(name)
+            if i is not None and start <= i < end:
+                prefixed.add(i)
+        ranked = self._top(((i, _PREFIX) for i in prefixed), limit)
+        if len(ranked) >= limit or not query:
+            return [self._names[i] for i, _ in ranked]
+        
+        # 继续输入时候选只会减少，只需在上一次的候选中筛选；
+        # 否则只检查包含查询中最少见字符的变量名
+        if self._last_query is not None and query.startswith(self._last_query):
+            candidates = self._last_candidates
+        else:
+            buckets = [self._buckets.get(char, ()) for char in set(query)]
+            candidates = min(buckets, key=len)
+        candidates = [i for i in candidates if _is_subsequence(query, lowered[i])]
+        self._last_query = query
+        self._last_candidates = candidates
+        
+        others = ((i, _SUBSTRING if query in lowered[i] else _SUBSEQUENCE)
+                  for i in candidates if not start <= i < end)
+        ranked.extend(self._top(others, limit - len(ranked)))
+        return [self._names[i] for i, _ in ranked]
+    
+    def _score(self, item):
+        """排序键：匹配方式、邻近程度、使用次数，然后是较短、字母顺序靠前的变量名"""
+        i, tier = item
+        name = self._names[i]
+        return (tier, self._proximity.get(name, 0), self.document_index.variable_names.get(name, 0),
+                -len(name), -i)
+    
+    def _top(self, scored, limit):
+        """[(位置, 匹配方式)]中得分最高的limit个"""
+        if limit <= 0:
+            return []
+        return heapq.nlargest(limit, scored, key=self._score)
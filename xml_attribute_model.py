@@ -0,0 +1,247 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QEvent, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (QApplication, QStyle, QStyleOptionButton, QStyledItemDelegate,
+                             QTableView)
+
+# 属性表的列：属性名、属性值、属性注释、删除按钮
+NAME_COLUMN = 0
+VALUE_COLUMN = 1
+COMMENT_COLUMN = 2
+DELETE_COLUMN = 3
+
+# 最后一行（添加新属性）的属性名列为空时显示的提示
+ADD_ROW_PLACEHOLDER = "<添加新属性>"
+
+class AttributeTableModel(QAbstractTableModel):
+    """
+    属性表的数据模型：一行一个属性，可编辑时最后一行用于添加新属性
+    
+    每行保存[属性名, 属性值, 注释]文本。切换元素或元素的属性变化后调用set_element，
+    只为内容变化的行发出dataChanged，行数不同时在末尾插入或删除行，视图不会被重置。
+    用户编辑单元格后先保存文本，再发出cellChanged(行, 列)，由使用者把修改写入文档。
+    """
+    # 用户修改了单元格文本，参数为行号和列号
+    cellChanged = pyqtSignal(int, int)
+    
+    def __init__(self, parent=None):
+        super(AttributeTableModel, self).__init__(parent)
+        self.headers = ['属性', '值', '注释', '']
+        self.element = None
+        self.editable = True
+        self.placeholder_color = QColor(128, 128, 128)
+        self._rows = []
+    
+    def set_element(self, element, comments=None, editable=True):
+        """
+        显示元素的属性
+        
+        Args:
+            element: 元素，为None时清空属性表
+            comments: {属性名: 注释}，可以为None
+            editable: 为False时只读显示属性名和属性值，没有添加行和删除按钮
+        """
+        self.element = element
+        rows = []
+        if element is not None:
+            for name, value in element.attrib.items():
+                comment = comments.get(name, "") if comments and editable else ""
+                rows.append([name, value, comment])
+            if editable:
+                rows.append(["", "", ""])
+        
+        if editable != self.editable:
+            # 可编辑状态决定了所有行的标志和删除按钮
+            self.editable = editable
+            self._replace_rows(rows, changed_all=True)
+        else:
+            self._replace_rows(rows)
+    
+    def clear(self):
+        """清空属性表"""
+        self.set_element(None, editable=self.editable)
+    
+    def _replace_rows(self, rows, changed_all=False):
+        """换成新的行内容，只通知视图变化的部分"""
+        old_rows = self._rows
+        count = len(rows)
+        old_count = len(old_rows)
+        if count < old_count:
+            self.beginRemoveRows(QModelIndex(), count, old_count - 1)
+            self._rows = old_rows[:count]
+            self.endRemoveRows()
+        elif count > old_count:
+            self.beginInsertRows(QModelIndex(), old_count, count - 1)
+            self._rows = old_rows + rows[old_count:]
+            self.endInsertRows()
+        
+        changed = [row for row in range(min(count, old_count))
+                   if changed_all or old_rows[row] != rows[row]]
+        self._rows = rows
+        if changed:
+            self.dataChanged.emit(self.index(changed[0], 0),
+                                  self.index(changed[-1], len(self.headers) - 1))
+    
+    def is_add_row(self, row):
+        """是否为最后一行（添加新属性）"""
+        return self.editable and row == len(self._rows) - 1
+    
+    def is_attribute_row(self, row):
+        """是否为显示已有属性的行"""
+        return 0 <= row < len(self._rows) and not self.is_add_row(row)
+    
+    def text(self, row, column):
+        """获取单元格文本，添加行的属性名为空时返回空字符串"""
+        if 0 <= row < len(self._rows) and column < DELETE_COLUMN:
+            return self._rows[row][column]
+        return ""
+    
+    def set_text(self, row, column, text):
+        """修改单元格文本（例如恢复无效的输入），不发出cellChanged"""
+        if 0 <= row < len(self._rows) and column < DELETE_COLUMN:
+            self._rows[row][column] = text
+            index = self.index(row, column)
+            self.dataChanged.emit(index, index)
+    
+    # ---- QAbstractTableModel接口 ----
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section] if section < len(self.headers) else None
+        return str(section + 1)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.column() >= DELETE_COLUMN:
+            return None
+        row = index.row()
+        column = index.column()
+        text = self._rows[row][column]
+        
+        if role == Qt.DisplayRole:
+            if column == NAME_COLUMN and not text and self.is_add_row(row):
+                return ADD_ROW_PLACEHOLDER
+            return text
+        if role == Qt.EditRole:
+            return text
+        if role == Qt.ForegroundRole and column == NAME_COLUMN and not text and self.is_add_row(row):
+            return self.placeholder_color
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self.editable and index.column() < DELETE_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+    
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole or not self.flags(index) & Qt.ItemIsEditable:
+            return False
+        row = index.row()
+        column = index.column()
+        text = str(value)
+        if self._rows[row][column] == text:
+            return True
+        
+        self._rows[row][column] = text
+        self.dataChanged.emit(index, index)
+        self.cellChanged.emit(row, column)
+        return True
+
+class AttributeDeleteDelegate(QStyledItemDelegate):
+    """
+    在删除列中绘制"X"按钮的代理，点击后发出deleteRequested(行号)
+    
+    按钮只是绘制出来的，不为每一行创建QPushButton，切换元素时不需要创建和销毁控件。
+    """
+    deleteRequested = pyqtSignal(int)
+    
+    def __init__(self, parent=None):
+        super(AttributeDeleteDelegate, self).__init__(parent)
+        self._pressed_row = -1
+    
+    def _can_delete(self, index):
+        model = index.model()
+        return isinstance(model, AttributeTableModel) and model.is_attribute_row(index.row())
+    
+    def paint(self, painter, option, index):
+        super(AttributeDeleteDelegate, self).paint(painter, option, index)
+        if not self._can_delete(index):
+            return
+        
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(1, 1, -1, -1)
+        button.text = "X"
+        button.state = QStyle.State_Enabled
+        if index.row() == self._pressed_row:
+            button.state |= QStyle.State_Sunken
+        else:
+            button.state |= QStyle.State_Raised
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+    
+    def editorEvent(self, event, model, option, index):
+        if not self._can_delete(index):
+            return False
+        
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+            self._pressed_row = index.row()
+            self._update_cell(option)
+            return True
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pressed_row = self._pressed_row
+            self._pressed_row = -1
+            self._update_cell(option)
+            if pressed_row == index.row() and option.rect.contains(event.pos()):
+                self.deleteRequested.emit(index.row())
+            return True
+        if event.type() == QEvent.MouseButtonDblClick:
+            # 双击删除按钮不开始编辑
+            return True
+        return False
+    
+    def _update_cell(self, option):
+        """按下和松开时重绘按钮"""
+        if option.widget is not None:
+            option.widget.viewport().update(option.rect)
+
+class AttributeTableView(QTableView):
+    """
+    显示AttributeTableModel的属性表视图
+    
+    删除列由AttributeDeleteDelegate绘制，点击时发出deleteRequested(行号)；
+    双击单元格时先发出cellDoubleClicked(行号, 列号)，再开始编辑。
+    """
+    deleteRequested = pyqtSignal(int)
+    cellDoubleClicked = pyqtSignal(int, int)
+    
+    def __init__(self, parent=None):
+        super(AttributeTableView, self).__init__(parent)
+        self.delete_delegate = AttributeDeleteDelegate(self)
+        self.delete_delegate.deleteRequested.connect(self.deleteRequested)
+        self.setItemDelegateForColumn(DELETE_COLUMN, self.delete_delegate)
+        self.doubleClicked.connect(lambda index: self.cellDoubleClicked.emit(index.row(), index.column()))
+    
+    def row_at(self, position):
+        """获取视图坐标处的行号，没有行时返回-1"""
+        index = self.indexAt(position)
+        return index.row() if index.isValid() else -1
+    
+    def edit_cell(self, row, column):
+        """选中并开始编辑单元格"""
+        index = self.model().index(row, column)
+        if index.isValid():
+            self.setCurrentIndex(index)
+            self.edit(index)
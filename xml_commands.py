@@ -0,0 +1,457 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+
+# 每个命令和节点的固定开销估计（字节），用于撤销栈的内存预算
+_COMMAND_OVERHEAD = 200
+_NODE_OVERHEAD = 100
+
+def estimate_node_size(node):
+    """
+    估计节点子树占用的内存，代价与子树大小成正比
+    
+    Args:
+        node: 元素或注释节点
+    """
+    total = 0
+    for current in node.iter():
+        total += _NODE_OVERHEAD + len(current.text or '') + len(current.tail or '')
+        if isinstance(current.tag, str):
+            total += len(current.tag)
+            for key, value in current.attrib.items():
+                total += len(key) + len(value)
+    return total
+
+class XmlCommand(ABC):
+    """
+    可撤销的XML编辑命令基类
+    
+    子类必须实现redo和undo（缺少时构造命令即报TypeError），并通过以下属性告诉界面需要刷新的范围：
+        parents: 子节点列表发生变化的父元素
+        nodes: 自身标签、属性或文本发生变化的节点
+        subtrees: 被插入或删除的节点（连同子孙），执行或撤销后可能在文档中也可能不在
+        replacements: (旧节点, 新节点) 对，新节点是旧节点子树重新解析后的副本，
+            执行后新节点在文档中，撤销后旧节点在文档中
+        code_patchable: 是否只改变了nodes的开始标签（注释为整个节点），
+            为True时代码视图可以只替换这些标签
+        document_replaced: 是否替换了整个文档
+    """
+    text = ""
+    code_patchable = False
+    document_replaced = False
+    
+    def __init__(self):
+        self.parents = []
+        self.nodes = []
+        self.subtrees = []
+        self.replacements = []
+    
+    @abstractmethod
+    def redo(self):
+        """执行（或重新执行）命令"""
+    
+    @abstractmethod
+    def undo(self):
+        """撤销命令，恢复执行前的状态"""
+    
+    def size(self):
+        """命令保存的数据量估计（字节）"""
+        return _COMMAND_OVERHEAD
+
+class InsertNodeCommand(XmlCommand):
+    """在父元素的指定位置插入节点"""
+    text = "插入"
+    
+    def __init__(self, parent, index, node):
+        super().__init__()
+        self.parent = parent
+        self.index = index
+        self.node = node
+        self.parents = [parent]
+        self.subtrees = [node]
+    
+    def redo(self):
+        self.parent.insert(self.index, self.node)
+    
+    def undo(self):
+        self.parent.remove(self.node)
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + estimate_node_size(self.node)
+
+class RemoveNodeCommand(XmlCommand):
+    """从父元素中删除节点（节点的尾部文本随节点一起删除）"""
+    text = "删除"
+    
+    def __init__(self, node):
+        super().__init__()
+        self.node = node
+        self.parent = node.getparent()
+        self.index = self.parent.index(node)
+        self.parents = [self.parent]
+        self.subtrees = [node]
+    
+    def redo(self):
+        self.parent.remove(self.node)
+    
+    def undo(self):
+        self.parent.insert(self.index, self.node)
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + estimate_node_size(self.node)
+
+class MoveNodeCommand(XmlCommand):
+    """把节点移动到新的父元素下"""
+    text = "移动"
+    
+    def __init__(self, node, new_parent, index, tail=None):
+        """
+        Args:
+            node: 要移动的节点
+            new_parent: 目标父元素
+            index: 节点从原位置移除后，在目标父元素中的插入位置
+            tail: 移动后节点的尾部文本，为None时保持不变
+        """
+        super().__init__()
+        self.node = node
+        self.old_parent = node.getparent()
+        self.old_index = self.old_parent.index(node)
+        self.old_tail = node.tail
+        self.new_parent = new_parent
+        self.new_index = index
+        self.new_tail = node.tail if tail is None else tail
+        self.parents = [self.old_parent, new_parent]
+    
+    def redo(self):
+        self.old_parent.remove(self.node)
+        self.node.tail = self.new_tail
+        self.new_parent.insert(self.new_index, self.node)
+    
+    def undo(self):
+        self.new_parent.remove(self.node)
+        self.node.tail = self.old_tail
+        self.old_parent.insert(self.old_index, self.node)
+
+class ReplaceNodeCommand(XmlCommand):
+    """用重新解析得到的节点替换文档中的一个节点（节点的尾部文本保持不变）"""
+    text = "应用代码更改"
+    
+    def __init__(self, old_node, new_node):
+        super().__init__()
+        self.old_node = old_node
+        self.new_node = new_node
+        self.parent = old_node.getparent()
+        self.index = self.parent.index(old_node)
+        new_node.tail = old_node.tail
+        self.parents = [self.parent]
+        self.subtrees = [old_node, new_node]
+        self.replacements = [(old_node, new_node)]
+    
+    def redo(self):
+        self.parent.replace(self.old_node, self.new_node)
+    
+    def undo(self):
+        self.parent.replace(self.new_node, self.old_node)
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + estimate_node_size(self.old_node) + estimate_node_size(self.new_node)
+
+class SetAttributesCommand(XmlCommand):
+    """按给定顺序替换元素的全部属性"""
+    text = "修改属性"
+    code_patchable = True
+    
+    def __init__(self, element, attributes):
+        """
+        Args:
+            element: 目标元素
+            attributes: (属性名, 属性值)列表，决定属性的顺序
+        """
+        super().__init__()
+        self.element = element
+        self.old_attributes = list(element.attrib.items())
+        self.new_attributes = list(attributes)
+        self.nodes = [element]
+    
+    def _apply(self, attributes):
+        self.element.attrib.clear()
+        for key, value in attributes:
+            self.element.set(key, value)
+    
+    def redo(self):
+        self._apply(self.new_attributes)
+    
+    def undo(self):
+        self._apply(self.old_attributes)
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + sum(len(key) + len(value)
+                                       for key, value in self.old_attributes + self.new_attributes)
+
+class SetAttributeCommand(SetAttributesCommand):
+    """设置或删除单个属性，保持其余属性的顺序"""
+    
+    def __init__(self, element, name, value):
+        """
+        Args:
+            element: 目标元素
+            name: 属性名
+            value: 新属性值，为None时删除该属性
+        """
+        attributes = []
+        found = False
+        for key, old_value in element.attrib.items():
+            if key == name:
+                found = True
+                if value is not None:
+                    attributes.append((key, value))
+            else:
+                attributes.append((key, old_value))
+        if not found and value is not None:
+            attributes.append((name, value))
+        super().__init__(element, attributes)
+
+class SetCommentTextCommand(XmlCommand):
+    """修改注释节点的文本"""
+    text = "修改注释"
+    code_patchable = True
+    
+    def __init__(self, comment, text):
+        super().__init__()
+        self.comment = comment
+        self.old_text = comment.text
+        self.new_text = text
+        self.nodes = [comment]
+    
+    def redo(self):
+        self.comment.text = self.new_text
+    
+    def undo(self):
+        self.comment.text = self.old_text
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + len(self.old_text or '') + len(self.new_text or '')
+
+class RenameElementCommand(XmlCommand):
+    """修改元素的标签名，元素本身和子元素保持不变"""
+    text = "重命名"
+    
+    def __init__(self, element, new_tag):
+        super().__init__()
+        self.element = element
+        self.old_tag = element.tag
+        self.old_text = element.text
+        self.new_tag = new_tag
+        self.nodes = [element]
+    
+    def redo(self):
+        self.element.tag = self.new_tag
+        # 确保空元素使用<Tag></Tag>格式
+        if len(self.element) == 0 and not self.element.text:
+            self.element.text = ""
+    
+    def undo(self):
+        self.element.tag = self.old_tag
+        self.element.text = self.old_text
+
+class ReplaceDocumentCommand(XmlCommand):
+    """用新解析的文档替换整个文档（例如应用代码视图中的修改）"""
+    text = "应用代码更改"
+    document_replaced = True
+    
+    def __init__(self, holder, new_tree, size_hint=0):
+        """
+        Args:
+            holder: 拥有tree和root属性的对象（主窗口）
+            new_tree: 新的ElementTree
+            size_hint: 文档文本长度，用于估计保存旧文档的内存
+        """
+        super().__init__()
+        self.holder = holder
+        self.old_tree = holder.tree
+        self.new_tree = new_tree
+        self.size_hint = size_hint
+    
+    def _apply(self, tree):
+        self.holder.tree = tree
+        self.holder.root = tree.getroot() if tree is not None else None
+    
+    def redo(self):
+        self._apply(self.new_tree)
+    
+    def undo(self):
+        self._apply(self.old_tree)
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + self.size_hint * 2
+
+class MacroCommand(XmlCommand):
+    """把多个命令组合为一次撤销操作"""
+    
+    def __init__(self, text, commands=None):
+        super().__init__()
+        self.text = text
+        self.commands = []
+        for command in commands or []:
+            self.add(command)
+    
+    @property
+    def code_patchable(self):
+        return all(command.code_patchable for command in self.commands)
+    
+    @property
+    def document_replaced(self):
+        return any(command.document_replaced for command in self.commands)
+    
+    def add(self, command):
+        self.commands.append(command)
+        for parent in command.parents:
+            if parent not in self.parents:
+                self.parents.append(parent)
+        for node in command.nodes:
+            if node not in self.nodes:
+                self.nodes.append(node)
+        for node in command.subtrees:
+            if node not in self.subtrees:
+                self.subtrees.append(node)
+        self.replacements.extend(command.replacements)
+    
+    def redo(self):
+        for command in self.commands:
+            command.redo()
+    
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+    
+    def size(self):
+        return _COMMAND_OVERHEAD + sum(command.size() for command in self.commands)
+
+class UndoStack:
+    """
+    基于命令的撤销/重做栈
+    
+    只记录每次编辑的操作和逆操作，撤销的代价与修改的规模成正比。
+    步数超过max_steps或保存的数据超过memory_budget时，丢弃最早的记录
+    （始终保留最近的一步）。
+    每个命令执行、撤销或重做后依次调用listeners中的回调（参数为该命令），
+    用于同步依赖文档内容的数据（如文档索引）。
+    """
+    def __init__(self, max_steps=200, memory_budget=32 * 1024 * 1024):
+        """
+        Args:
+            max_steps: 最多保留的撤销步数
+            memory_budget: 撤销和重做记录允许占用的内存估计（字节）
+        """
+        self.max_steps = max_steps
+        self.memory_budget = memory_budget
+        self.memory_usage = 0
+        self._undo = deque()
+        self._redo = []
+        self._macros = []
+        self.listeners = []
+    
+    def _notify(self, command):
+        for listener in self.listeners:
+            listener(command)
+    
+    def push(self, command):
+        """执行命令并记录到撤销栈，位于宏中时记录到当前宏"""
+        command.redo()
+        self._notify(command)
+        if self._macros:
+            self._macros[-1].add(command)
+        else:
+            self._record(command)
+        return command
+    
+    def apply(self, command):
+        """
+        执行命令但不记录，并清空撤销和重做记录
+        
+        用于不属于编辑历史的修改（如其他程序修改文件后重新加载）：
+        这样的修改不能被撤销，而之前的记录引用的节点可能已被替换，也不能再撤销或重做。
+        """
+        command.redo()
+        self._notify(command)
+        self.clear()
+        return command
+    
+    def begin_macro(self, text):
+        """开始组合命令，之后push的命令合并为一次撤销操作"""
+        self._macros.append(MacroCommand(text))
+    
+    def end_macro(self):
+        """结束组合命令，返回组合后的命令（没有任何命令时返回None）"""
+        macro = self._macros.pop()
+        if not macro.commands:
+            return None
+        if self._macros:
+            self._macros[-1].add(macro)
+        else:
+            self._record(macro)
+        return macro
+    
+    @contextmanager
+    def macro(self, text):
+        """以with语句组合命令，出错时已执行的部分仍然可以撤销"""
+        self.begin_macro(text)
+        try:
+            yield
+        finally:
+            self.end_macro()
+    
+    def _record(self, command):
+        command.cost = command.size()
+        self._undo.append(command)
+        self.memory_usage += command.cost
+        
+        # 新的编辑使重做记录失效
+        for old in self._redo:
+            self.memory_usage -= old.cost
+        self._redo = []
+        
+        self._trim()
+    
+    def _trim(self):
+        """丢弃超出步数或内存预算的最早记录"""
+        while len(self._undo) > 1 and (len(self._undo) > self.max_steps or
+                                       self.memory_usage > self.memory_budget):
+            old = self._undo.popleft()
+            self.memory_usage -= old.cost
+    
+    def can_undo(self):
+        return bool(self._undo)
+    
+    def can_redo(self):
+        return bool(self._redo)
+    
+    def undo(self):
+        """撤销最近的命令，返回被撤销的命令，没有可撤销的命令时返回None"""
+        if not self._undo:
+            return None
+        command = self._undo.pop()
+        command.undo()
+        self._notify(command)
+        self._redo.append(command)
+        return command
+    
+    def redo(self):
+        """重做最近撤销的命令，返回该命令，没有可重做的命令时返回None"""
+        if not self._redo:
+            return None
+        command = self._redo.pop()
+        command.redo()
+        self._notify(command)
+        self._undo.append(command)
+        return command
+    
+    def clear(self):
+        """清空撤销和重做记录（例如打开新文件时）"""
+        self._undo.clear()
+        self._redo = []
+        self._macros = []
+        self.memory_usage = 0
+    
+    def __len__(self):
+        return len(self._undo)
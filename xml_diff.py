@@ -0,0 +1,67 @@
+from lxml import etree
+
+def _same_node(old, new):
+    """
+    两个节点自身（不含子节点和尾部文本）是否相同
+    
+    比较节点类型、标签、属性（包括顺序）、文本和命名空间声明。
+    """
+    if type(old) is not type(new) or old.tag != new.tag or old.text != new.text:
+        return False
+    if old.items() != new.items():
+        return False
+    if isinstance(old.tag, str) and old.nsmap != new.nsmap:
+        return False
+    return True
+
+def _top_level_nodes(tree):
+    """根元素之前和之后的注释、处理指令的序列化文本"""
+    root = tree.getroot()
+    before = [etree.tostring(node, encoding='unicode', with_tail=False)
+              for node in root.itersiblings(preceding=True)]
+    after = [etree.tostring(node, encoding='unicode', with_tail=False)
+             for node in root.itersiblings()]
+    return before, after
+
+def changed_subtrees(old_tree, new_tree):
+    """
+    比较两个文档，找出需要替换的最小子树
+    
+    从根元素开始同时遍历两棵树：节点自身相同时继续比较它们的子节点，不同时整个替换。
+    某个元素的子节点数量不同，或子节点的尾部文本（子节点之间的空白）不同时，
+    替换该元素本身，因为替换节点时保留原来的尾部文本。
+    
+    Args:
+        old_tree: 当前文档的ElementTree
+        new_tree: 新解析的ElementTree
+    
+    Returns:
+        [(旧节点, 新节点)]，各个旧节点互不包含，两个文档相同时为空列表；
+        根元素本身、文档类型声明或根元素之外的注释和处理指令不同时返回None，需要替换整个文档
+    """
+    old_root = old_tree.getroot()
+    new_root = new_tree.getroot()
+    if old_tree.docinfo.doctype != new_tree.docinfo.doctype:
+        return None
+    if not _same_node(old_root, new_root) or _top_level_nodes(old_tree) != _top_level_nodes(new_tree):
+        return None
+    
+    pairs = []
+    stack = [(old_root, new_root)]
+    while stack:
+        old, new = stack.pop()
+        if len(old) != len(new) or any(a.tail != b.tail for a, b in zip(old, new)):
+            if old is old_root:
+                return None
+            pairs.append((old, new))
+            continue
+        
+        children = []
+        for old_child, new_child in zip(old, new):
+            if not _same_node(old_child, new_child):
+                pairs.append((old_child, new_child))
+            elif len(old_child) or len(new_child):
+                children.append((old_child, new_child))
+        # 逆序入栈，保证按文档顺序比较
+        stack.extend(reversed(children))
+    return pairs
@@ -1,29 +1,56 @@
 import sys
 import os
+import bisect
 import copy
 import json
 import re
 import io
+from contextlib import contextmanager
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                           QTreeWidget, QTreeWidgetItem, QSplitter, QTextEdit, QTableWidget, 
-                           QTableWidgetItem, QPushButton, QMenu, QAction, QMessageBox,
+                           QSplitter, QTextEdit, QPlainTextEdit, 
+                           QPushButton, QMenu, QAction, QMessageBox,
                            QInputDialog, QFileDialog, QLabel, QHeaderView, QAbstractItemView,
                            QToolBar, QLineEdit, QDialog, QScrollArea, QCheckBox, QListWidget,
                            QDialogButtonBox, QListWidgetItem, QGridLayout, QTabWidget,
                            QCompleter, QStyledItemDelegate, QAbstractItemView)
 from PyQt5.QtCore import (Qt, QMimeData, QModelIndex, QSize, QTimer, QStringListModel,
                          QFileSystemWatcher)
-from PyQt5.QtGui import (QDrag, QFont, QColor, QSyntaxHighlighter, QTextCharFormat, 
+from PyQt5.QtGui import (QDrag, QFont, QColor, QTextCharFormat, 
                         QPixmap, QTextCursor, QIcon, QTextFormat)
 from lxml import etree
-from xml_tree_editor import XMLTreeWidget, DraggableTreeItem
+from xml_tree_editor import XMLTreeEditorView
 from xml_snippet_library import XMLSnippetLibrary
 from tree_state_manager import TreeStateManager
+from xml_highlighter import ViewportXMLHighlighter
+from xml_source_map import (XMLSourceMap, DirtyRange, SyncedText, contains_astral, find_reparse_region,
+                            serialize_start_tag, serialize_subtree)
+from xml_loader import XMLLoadThread, XMLOutlineThread
+from xml_validator import XMLValidationThread, syntax_errors
+from xml_tree_model import XmlOutlineModel, XmlTreeModel, XmlTreeView
+from xml_attribute_model import AttributeTableModel, AttributeTableView
+from document_index import DocumentIndex
+from variable_completion import VariableCompletion
+from element_ids import ElementIdRegistry
+from tree_column_plan import TreeColumnPlan
+from file_writer import SidecarWriter, atomic_write, content_digest, write_json
+from xml_diff import changed_subtrees
+from xml_commands import (UndoStack, InsertNodeCommand, RemoveNodeCommand,
+                          SetAttributeCommand, SetAttributesCommand, SetCommentTextCommand,
+                          RenameElementCommand, ReplaceDocumentCommand, ReplaceNodeCommand,
+                          MacroCommand)
+
+# QTextCursor.selectedText()中的段落分隔符等按toPlainText()的规则转换
+_PLAIN_TEXT_TABLE = {0x2029: '\n', 0x2028: '\n', 0xfdd0: '\n', 0xfdd1: '\n', 0xa0: ' '}
 
 class GlobalAttributes:
-    def __init__(self):
+    def __init__(self, writer=None):
+        """
+        Args:
+            writer: 可选，SidecarWriter，指定时注释文件在后台写入，内容未变化时不写入
+        """
         self.feature_comments = {}  # 功能注释: {element_name: comment}
         self.attribute_comments = {}  # 属性注释: {attribute_name: comment}
+        self.writer = writer
         
         # 加载已保存的注释
         self.load_comments()
@@ -42,49 +69,11 @@ class GlobalAttributes:
     
     def save_comments(self):
         try:
-            with open('feature_comments.json', 'w', encoding='utf-8') as f:
-                json.dump(self.feature_comments, f, ensure_ascii=False, indent=2)
-            
-            with open('attribute_comments.json', 'w', encoding='utf-8') as f:
-                json.dump(self.attribute_comments, f, ensure_ascii=False, indent=2)
+            write_json('feature_comments.json', self.feature_comments, self.writer)
+            write_json('attribute_comments.json', self.attribute_comments, self.writer)
         except Exception as e:
             print(f"保存注释失败: {e}")
 
-class XMLHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
-        super(XMLHighlighter, self).__init__(parent)
-        
-        self.highlighting_rules = []
-        
-        # XML标签
-        tag_format = QTextCharFormat()
-        tag_format.setForeground(QColor("#00008B"))  # 深蓝色
-        # 高亮<tag></tag>
-        self.highlighting_rules.append((re.compile(r"<[^>]*>"), tag_format))
-        
-        # 属性
-        attr_format = QTextCharFormat()
-        attr_format.setForeground(QColor("#8B0000"))  # 深红色
-        # 高亮属性名（name=value中的name部分）
-        self.highlighting_rules.append((re.compile(r"\s+([a-zA-Z_][a-zA-Z0-9_\-]*)="), attr_format))
-        
-        # 属性值
-        attr_value_format = QTextCharFormat()
-        attr_value_format.setForeground(QColor("#006400"))  # 深绿色
-        # 高亮属性值（name="value"中的"value"部分）
-        self.highlighting_rules.append((re.compile(r"=\"([^\"]*)\"|='([^']*)'"), attr_value_format))
-        
-        # 注释
-        comment_format = QTextCharFormat()
-        comment_format.setForeground(QColor("#808080"))  # 灰色
-        # 高亮注释
-        self.highlighting_rules.append((re.compile(r"<!--[^<]*-->"), comment_format))
-    
-    def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            for match in pattern.finditer(text):
-                self.setFormat(match.start(), match.end() - match.start(), format)
-
 class AttributeCompleterDelegate(QStyledItemDelegate):
     """
     表格单元格编辑器代理，提供自动补全功能
@@ -198,20 +187,24 @@ class AttributeCompleter:
         # 加载自定义属性
         self.load_custom_attributes()
         
-        # 属性值字典，键为属性名，值为该属性的所有可能值列表
-        self.attribute_values = {}
+        # 属性值和引用变量来自随编辑增量更新的文档索引
+        self.document_index = None
         
-        # 初始化引用变量集合
-        self.referenced_vars = set()
+        # 属性名 -> [值集合的版本, 属性值列表, 对应的小写值]，按小写排序，版本变化时才重新生成
+        self._value_lists = {}
+        # #var/@var引用的排序补全
+        self.variable_completion = VariableCompletion()
         
-        # 创建属性名补全器（使用默认QCompleter就足够了）
-        self.attr_completer = QCompleter(self.get_attribute_list())
+        # 创建属性名补全器（使用默认QCompleter就足够了），模型只在自定义属性变化时更新
+        self._attr_model = QStringListModel(self.get_attribute_list())
+        self.attr_completer = QCompleter(self._attr_model)
         self.attr_completer.setCaseSensitivity(Qt.CaseInsensitive)
         self.attr_completer.setCompletionMode(QCompleter.PopupCompletion)
         self.attr_completer.setFilterMode(Qt.MatchStartsWith)
         
-        # 创建属性值补全器（使用自定义CustomCompleter）
+        # 创建属性值补全器（使用自定义CustomCompleter），引用变量由variable_completion排序
         self.value_completer = CustomCompleter([])
+        self.value_completer.set_variable_completion(self.variable_completion)
         
         # 当前正在编辑的属性名
         self.current_attribute = ""
@@ -248,7 +241,7 @@ class AttributeCompleter:
             self.custom_attributes.sort()
             self.save_custom_attributes()
             # 更新属性补全器
-            self.attr_completer.setModel(QStringListModel(self.get_attribute_list()))
+            self._attr_model.setStringList(self.get_attribute_list())
             return True
         return False
     
@@ -260,7 +253,7 @@ class AttributeCompleter:
             self.custom_attributes.remove(attribute)
             self.save_custom_attributes()
             # 更新属性补全器
-            self.attr_completer.setModel(QStringListModel(self.get_attribute_list()))
+            self._attr_model.setStringList(self.get_attribute_list())
             return True
         return False
     
@@ -268,14 +261,21 @@ class AttributeCompleter:
         """
         获取完整的属性名列表（预定义+自定义）
         """
-        # 打印当前的属性列表
-        print(f"预定义属性: {len(self.predefined_attributes)}, 自定义属性: {len(self.custom_attributes)}")
-        
-        # 合并预定义和自定义属性列表
-        combined = sorted(set(self.predefined_attributes + self.custom_attributes))
-        print(f"合并后的属性总数: {len(combined)}")
-        
-        return combined
+        return sorted(set(self.predefined_attributes + self.custom_attributes))
+    
+    @property
+    def attribute_values(self):
+        """属性值字典 {属性名: {属性值: {元素: 次数}}}，来自文档索引"""
+        if self.document_index is None:
+            return {}
+        return self.document_index.attribute_values
+    
+    @property
+    def referenced_vars(self):
+        """引用变量 {变量名: 次数}，来自文档索引"""
+        if self.document_index is None:
+            return {}
+        return self.document_index.variable_names
     
     def extract_attribute_values(self, xml_root):
         """
@@ -284,77 +284,63 @@ class AttributeCompleter:
         Args:
             xml_root: XML文档的根元素
         """
-        self.attribute_values = {}
-        self.referenced_vars = set()  # 存储所有被引用的变量名
-        
-        def process_element(element):
-            # 遍历元素的所有属性
-            for attr_name, attr_value in element.attrib.items():
-                # 保存完整的属性值
-                if attr_name not in self.attribute_values:
-                    self.attribute_values[attr_name] = set()
-                self.attribute_values[attr_name].add(attr_value)
-                
-                # 提取name属性的值（供引用使用）
-                if attr_name == "name":
-                    self.referenced_vars.add(attr_value)
-                
-                # 从属性值中提取所有引用的变量名
-                # 提取#引用
-                if "#" in attr_value:
-                    var_refs = re.findall(r'#([a-zA-Z0-9_]+)', attr_value)
-                    for var_name in var_refs:
-                        self.referenced_vars.add(var_name)
-                
-                # 提取@引用
-                if "@" in attr_value:
-                    var_refs = re.findall(r'@([a-zA-Z0-9_]+)', attr_value)
-                    for var_name in var_refs:
-                        self.referenced_vars.add(var_name)
-            
-            # 递归处理子元素
-            for child in element:
-                process_element(child)
-        
-        # 从根元素开始递归处理
+        self.set_document_index(DocumentIndex(xml_root))
         if xml_root is not None:
-            process_element(xml_root)
             print(f"从XML中提取了{len(self.referenced_vars)}个引用变量")
     
-    def update_value_completer(self, attribute_name):
+    def set_document_index(self, document_index):
+        """
+        使用文档索引中的属性值和引用变量
+        
+        索引随编辑增量更新，这里只保存索引本身，不需要在每次编辑后重新提取。
+        换用另一个索引（打开了新文件）时缓存的补全列表全部作废。
+        
+        Args:
+            document_index: DocumentIndex对象
+        """
+        if document_index is self.document_index:
+            return
+        self.document_index = document_index
+        self.variable_completion.set_document_index(document_index)
+        for entry in self._value_lists.values():
+            entry[0] = None
+    
+    def get_values(self, attribute_name):
+        """
+        获取属性在文档中的所有值，按小写排序
+        
+        只有索引中该属性的值集合变化后才重新生成列表。
+        
+        Args:
+            attribute_name: 属性名
+        
+        Returns:
+            (属性值列表, 对应的小写值列表)，调用者不应修改
+        """
+        index = self.document_index
+        value_version = index.value_versions.get(attribute_name, 0) if index is not None else 0
+        
+        entry = self._value_lists.get(attribute_name)
+        if entry is None:
+            entry = self._value_lists[attribute_name] = [None, [], []]
+        if entry[0] != value_version:
+            values = sorted(self.attribute_values.get(attribute_name, ()), key=str.lower)
+            entry[1] = values
+            entry[2] = [value.lower() for value in values]
+            entry[0] = value_version
+        return entry[1], entry[2]
+    
+    def update_value_completer(self, attribute_name, element=None):
         """
-        根据当前属性名更新值补全器
+        根据当前属性名和元素更新值补全器
         
         Args:
             attribute_name: 当前编辑的属性名
+            element: 当前编辑的元素，离它近的引用变量排在前面
         """
         self.current_attribute = attribute_name
-        values = list(self.attribute_values.get(attribute_name, set()))
-        
-        # 对于所有属性，添加引用变量(#和@前缀)
-        hash_values = []
-        at_values = []
-        if hasattr(self, 'referenced_vars'):
-            hash_values = ["#" + v for v in self.referenced_vars]
-            at_values = ["@" + v for v in self.referenced_vars]
-            print(f"更新补全数据: 添加{len(hash_values)}个#变量, {len(at_values)}个@变量")
-            if hash_values:
-                print(f"样例变量: {', '.join(sorted(hash_values)[:5])}")
-        
-        # 合并所有可能的值
-        values.extend(hash_values)
-        values.extend(at_values)
-        
-        # 确保值是唯一的并排序
-        unique_values = sorted(set(values))
-        
-        # 更新补全器模型
-        if isinstance(self.value_completer, CustomCompleter):
-            self.value_completer.setModel(QStringListModel(unique_values))
-        else:
-            # 向后兼容处理
-            model = QStringListModel(unique_values)
-            self.value_completer.setModel(model)
+        self.variable_completion.set_context(element)
+        self.value_completer.set_values(*self.get_values(attribute_name))
     
     def get_attr_completer(self):
         """
@@ -460,12 +446,27 @@ class AttributeManagementDialog(QDialog):
                 QMessageBox.warning(self, "错误", f"无法删除属性 '{attr}'")
 
 class FileTabs:
-    def __init__(self):
+    def __init__(self, writer=None):
+        """
+        Args:
+            writer: 可选，SidecarWriter，指定时.comments文件在后台写入，内容未变化时不写入
+        """
+        self.writer = writer
         self.file_comments = {}  # 作用注释: {file_path: {element_unique_id: comment}}
         # 旧版本兼容：注释路径映射缓存
         self.comment_path_map = {}
         # 路径到ID的映射，用于向后兼容旧版本的注释文件
         self.path_to_id_map = {}
+        # 当前文档中元素的稳定ID
+        self.element_ids = ElementIdRegistry()
+    
+    def bind_document(self, root):
+        """打开新文档时为其元素分配ID，需在读取注释之前调用"""
+        self.element_ids.rebuild(root)
+    
+    def reconcile_document(self, root):
+        """文档被重新解析后，把原来的元素ID转移到新文档的对应元素上"""
+        self.element_ids.reconcile(root)
     
     def load_file_comments(self, file_path):
         comment_file = file_path + ".comments"
@@ -498,9 +499,22 @@ class FileTabs:
             
         comment_file = file_path + ".comments"
         try:
+            # 元素ID换算为元素当前位置的规范ID，下次打开文件时才能匹配；
+            # 已不在文档中的元素保留原来的键
+            comments = {}
+            translated = {}
+            for key, comment in self.file_comments[file_path].items():
+                canonical = None
+                if key.startswith("uuid:"):
+                    canonical = self.element_ids.canonical_key(key[5:])
+                if canonical is None:
+                    comments[key] = comment
+                else:
+                    translated["uuid:" + canonical] = comment
+            comments.update(translated)
+            
             # 保存新格式的注释（基于唯一ID）
-            with open(comment_file, 'w', encoding='utf-8') as f:
-                json.dump(self.file_comments[file_path], f, ensure_ascii=False, indent=2)
+            write_json(comment_file, comments, self.writer)
         except Exception as e:
             print(f"保存文件注释失败: {e}")
     
@@ -571,7 +585,7 @@ class FileTabs:
         return ""
     
     def _get_element_id(self, element):
-        """安全地获取元素的唯一ID，如果不存在则创建
+        """获取元素的稳定ID，如果不存在则创建
         
         参数：
             element: 元素对象
@@ -579,16 +593,7 @@ class FileTabs:
         返回：
             唯一ID字符串
         """
-        try:
-            if not hasattr(element, 'unique_id'):
-                # 动态添加一个唯一ID属性
-                import uuid
-                setattr(element, 'unique_id', str(uuid.uuid4()))
-            return element.unique_id
-        except (AttributeError, TypeError):
-            # 如果不能设置属性（例如lxml.etree._Element不允许），
-            # 则使用元素的内存地址作为唯一标识
-            return str(id(element))
+        return self.element_ids.id_of(element)
     
     # 以下方法保留用于兼容旧版本
     def apply_path_mappings(self, file_path):
@@ -797,23 +802,75 @@ class XMLEditorWindow(QMainWindow):
         self.search_type_combo = None
         self.case_sensitive_checkbox = None
         
+        # 注释、列宽等附属文件在后台写入，内容未变化的文件不重复写入
+        self.sidecar_writer = SidecarWriter()
+        
         # 创建全局属性管理器
-        self.global_attrs = GlobalAttributes()
+        self.global_attrs = GlobalAttributes(self.sidecar_writer)
         
         # 创建文件标签管理器
-        self.file_tabs = FileTabs()
+        self.file_tabs = FileTabs(self.sidecar_writer)
         
-        # 当前打开的文件和当前选中的树节点
+        # 当前打开的文件和结构树中当前选中的元素
         self.current_file = None
-        self.current_tree_item = None
-        
-        # 树项目和元素映射
-        self.tree_items = {}  # 存储 element 到 TreeItem 的映射
-        self.path_elements = {}  # 存储 element path 到 element 的映射
-        
-        # 撤销栈
-        self.undo_stack = []
-        self.max_undo_steps = 20  # 最大撤销步数
+        self.current_element = None
+        
+        # 代码视图中各节点的位置映射，用于局部更新代码视图
+        self.source_map = None
+        
+        # 大文件模式下的只读大纲（XMLOutline），为None时是普通编辑模式
+        self.outline = None
+        # 大纲模式下超过此大小（字节）的节点只预览开始标签，不整体解析
+        self.outline_preview_limit = 4 * 1024 * 1024
+        # 程序更新代码视图时置为True，避免被当作用户编辑
+        self.updating_code_view = False
+        # 与XML树同步时的代码文本（位置映射对应的文本）及此后用户修改的范围
+        self.code_synced_text = SyncedText()
+        self.code_dirty = DirtyRange()
+        
+        # 撤销栈：记录每次编辑的命令及其逆操作，支持撤销和重做
+        self.max_undo_steps = 200  # 最大撤销步数
+        self.undo_memory_budget = 32 * 1024 * 1024  # 撤销记录的内存预算（字节）
+        self.undo_stack = UndoStack(self.max_undo_steps, self.undo_memory_budget)
+        
+        # 全局搜索在输入停止一段时间后才执行，避免每个按键都搜索一次
+        self.text_search_delay = 200  # 毫秒
+        self.text_search_timer = QTimer(self)
+        self.text_search_timer.setSingleShot(True)
+        self.text_search_timer.timeout.connect(self.on_text_search_changed)
+        
+        # 属性搜索同样在输入停止后才执行
+        self.attr_search_timer = QTimer(self)
+        self.attr_search_timer.setSingleShot(True)
+        self.attr_search_timer.timeout.connect(self.search_by_attribute)
+        
+        # 代码视图停止输入一段时间后在后台检查XML格式，错误以波浪下划线标出
+        self.validation_delay = 500  # 毫秒
+        self.validation_timer = QTimer(self)
+        self.validation_timer.setSingleShot(True)
+        self.validation_timer.timeout.connect(self.start_code_validation)
+        self.validation_generation = 0
+        self.validation_thread = XMLValidationThread(self)
+        self.validation_thread.validated.connect(self.on_code_validated)
+        self.validation_thread.start()
+        
+        # 代码视图的附加格式：搜索/定位高亮和格式错误标记分别保存，合并后设置
+        self.code_highlight_selections = []
+        self.validation_selections = []
+        
+        # 当前的搜索结果（按结果顺序的{元素: None}），结构树模型只在显示到它们时读取高亮状态
+        self.search_result_elements = {}
+        # 结果不超过这个数量时展开所有结果的祖先，否则只展开第一个结果的祖先
+        self.search_expand_limit = 200
+        
+        # 批量编辑的嵌套层数，以及期间树视图被重建前保存的视图状态
+        self.batch_depth = 0
+        self.batch_tree_state = None
+        
+        # 文档索引：搜索和自动补全从这里查询，随撤销栈中的命令增量更新
+        self.document_index = DocumentIndex()
+        self.undo_stack.listeners.append(self.update_document_index)
+        self.undo_stack.listeners.append(self.update_element_ids)
         
         # 创建属性自动补全管理器
         self.attr_completer = AttributeCompleter()
@@ -830,7 +887,18 @@ class XMLEditorWindow(QMainWindow):
         # 文件监视器
         self.file_watcher = QFileSystemWatcher(self)
         self.file_watcher.fileChanged.connect(self.on_file_changed)
-        self.last_modified_time = 0
+        # 文件内容（统一换行符后）的哈希，内容与之相同的变化通知（例如自己保存引起的）被忽略
+        self.file_content_hash = None
+        # 短时间内的多次变化通知（编辑器保存时常见）合并为一次处理
+        self.file_change_delay = 300  # 毫秒
+        self.file_change_timer = QTimer(self)
+        self.file_change_timer.setSingleShot(True)
+        self.file_change_timer.timeout.connect(self.reload_changed_file)
+        # 外部修改涉及的子树超过这个数量时完整更新代码视图
+        self.max_code_patches = 50
+        
+        # 后台加载文件的线程，同一时间只加载一个文件
+        self.load_thread = None
         
         # 树和属性表的列宽
         self.column_widths = {
@@ -851,6 +919,7 @@ class XMLEditorWindow(QMainWindow):
             }
         }
         self.load_tree_columns()
+        self.update_tree_column_plan()
         
         # 保存展开状态用的数据结构
         self.expanded_paths = {}
@@ -876,6 +945,11 @@ class XMLEditorWindow(QMainWindow):
         open_action.triggered.connect(self.openFile)
         file_menu.addAction(open_action)
         
+        # 以只读大纲模式打开超大文件
+        open_large_action = QAction('以大文件模式打开（只读大纲）...', self)
+        open_large_action.triggered.connect(self.openLargeFile)
+        file_menu.addAction(open_large_action)
+        
         # 保存文件动作
         save_action = QAction('保存', self)
         save_action.setShortcut('Ctrl+S')
@@ -891,6 +965,12 @@ class XMLEditorWindow(QMainWindow):
         undo_action.triggered.connect(self.undo_last_action)
         edit_menu.addAction(undo_action)
         
+        # 重做动作
+        redo_action = QAction('重做', self)
+        redo_action.setShortcut('Ctrl+Y')
+        redo_action.triggered.connect(self.redo_last_action)
+        edit_menu.addAction(redo_action)
+        
         # 创建工具栏
         self.toolbar = QToolBar("主工具栏")
         self.addToolBar(self.toolbar)
@@ -908,7 +988,8 @@ class XMLEditorWindow(QMainWindow):
         self.text_search_input = QLineEdit()
         self.text_search_input.setPlaceholderText("输入文本搜索内容...")
         self.text_search_input.setFixedWidth(200)
-        self.text_search_input.textChanged.connect(self.on_text_search_changed)
+        self.text_search_input.textChanged.connect(self.schedule_text_search)
+        self.text_search_input.returnPressed.connect(self.on_text_search_changed)
         search_layout.addWidget(QLabel("全局搜索:"))
         search_layout.addWidget(self.text_search_input)
         
@@ -935,7 +1016,7 @@ class XMLEditorWindow(QMainWindow):
         self.attr_name_input = QLineEdit()
         self.attr_name_input.setPlaceholderText("输入属性名...")
         self.attr_name_input.setFixedWidth(150)
-        self.attr_name_input.textChanged.connect(self.search_by_attribute)
+        self.attr_name_input.textChanged.connect(self.schedule_attribute_search)
         search_layout.addWidget(QLabel("属性搜索:"))
         search_layout.addWidget(self.attr_name_input)
         
@@ -943,7 +1024,7 @@ class XMLEditorWindow(QMainWindow):
         self.attr_value_input = QLineEdit()
         self.attr_value_input.setPlaceholderText("输入属性值...")
         self.attr_value_input.setFixedWidth(150)
-        self.attr_value_input.textChanged.connect(self.search_by_attribute)
+        self.attr_value_input.textChanged.connect(self.schedule_attribute_search)
         search_layout.addWidget(QLabel("属性值:"))
         search_layout.addWidget(self.attr_value_input)
         
@@ -1039,14 +1120,14 @@ class XMLEditorWindow(QMainWindow):
         
         tree_layout.addLayout(buttons_layout)
         
-        # 使用自定义树控件
-        self.tree_widget = XMLTreeWidget()
+        # 结构树：模型直接读取lxml树，视图处理拖放
+        self.tree_model = XmlTreeModel(self)
+        self.tree_model.set_column_plan(self.tree_column_plan, self.global_attrs.feature_comments,
+                                        self.get_usage_comment)
+        self.tree_model.tagEdited.connect(self.on_tree_item_renamed)
+        self.tree_widget = XMLTreeEditorView()
         self.tree_widget.set_main_window(self)
-        
-        # 使用自定义列配置设置树视图的列
-        visible_columns = self.get_visible_columns()
-        self.tree_widget.setColumnCount(len(visible_columns))
-        self.tree_widget.setHeaderLabels(visible_columns)
+        self.tree_widget.setModel(self.tree_model)
         
         # 设置列宽调整模式，允许用户手动调整
         self.tree_widget.header().setSectionResizeMode(QHeaderView.Interactive)
@@ -1058,16 +1139,27 @@ class XMLEditorWindow(QMainWindow):
         
         # 允许最后一个列自动拉伸
         self.tree_widget.header().setStretchLastSection(True)
-        self.tree_widget.itemClicked.connect(self.on_tree_item_clicked)
-        self.tree_widget.itemDoubleClicked.connect(self.on_tree_item_double_clicked)
+        self.tree_widget.clicked.connect(self.on_tree_item_clicked)
+        self.tree_widget.doubleClicked.connect(self.on_tree_item_double_clicked)
         self.tree_widget.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree_widget.customContextMenuRequested.connect(self.show_tree_context_menu)
         tree_layout.addWidget(self.tree_widget)
         
+        # 大文件模式下代替结构树显示只读大纲，双击节点时才解析该节点
+        self.outline_view = XmlTreeView()
+        self.outline_view.setDragEnabled(False)
+        self.outline_view.setAcceptDrops(False)
+        self.outline_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.outline_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.outline_view.setContextMenuPolicy(Qt.NoContextMenu)
+        self.outline_view.activated.connect(self.open_outline_node)
+        self.outline_view.setVisible(False)
+        tree_layout.addWidget(self.outline_view)
+        
         # 添加注释显示开关
         self.show_comments_action = QAction('显示XML注释', self)
         self.show_comments_action.setCheckable(True)
-        self.show_comments_action.setChecked(self.tree_widget.show_comments)
+        self.show_comments_action.setChecked(self.tree_model.show_comments)
         self.show_comments_action.triggered.connect(self.toggle_comments)
         view_menu.addAction(self.show_comments_action)
         
@@ -1098,9 +1190,10 @@ class XMLEditorWindow(QMainWindow):
         attr_label = QLabel("属性视图")
         attr_layout.addWidget(attr_label)
         
-        self.attr_table = QTableWidget()
-        self.attr_table.setColumnCount(4)  # 增加一列用于删除按钮
-        self.attr_table.setHorizontalHeaderLabels(['属性', '值', '注释', ''])
+        # 属性表由模型提供数据，删除按钮由代理绘制，切换元素时只更新变化的行
+        self.attr_model = AttributeTableModel(self)
+        self.attr_table = AttributeTableView()
+        self.attr_table.setModel(self.attr_model)
         # 设置属性表列宽调整模式
         self.attr_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         # 应用保存的列宽设置
@@ -1114,7 +1207,8 @@ class XMLEditorWindow(QMainWindow):
         self.attr_table.horizontalHeader().setStretchLastSection(False)
         self.attr_table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.attr_table.customContextMenuRequested.connect(self.show_attr_context_menu)
-        self.attr_table.cellChanged.connect(self.on_attr_changed)
+        self.attr_model.cellChanged.connect(self.on_attr_changed)
+        self.attr_table.deleteRequested.connect(self.delete_attribute)
         
         # 设置属性表的自动补全
         self.setup_attr_table_completer()
@@ -1140,16 +1234,16 @@ class XMLEditorWindow(QMainWindow):
         code_label = QLabel("源代码视图")
         code_layout.addWidget(code_label)
         
-        # 创建代码编辑器
-        self.code_edit = QTextEdit()
+        # 创建代码编辑器，QPlainTextEdit只布局可见的行，适合显示很大的文档
+        self.code_edit = QPlainTextEdit()
         self.code_edit.setReadOnly(False)  # 允许编辑
         
         # 设置代码编辑器的样式，确保在非焦点状态下也显示高亮
         self.code_edit.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: white;
             }
-            QTextEdit:!focus {
+            QPlainTextEdit:!focus {
                 selection-background-color: yellow;
                 selection-color: black;
             }
@@ -1159,9 +1253,11 @@ class XMLEditorWindow(QMainWindow):
         self.code_has_changes = False
         # 连接文本变更信号
         self.code_edit.textChanged.connect(self.on_code_text_changed)
+        # 记录用户修改的范围，应用更改时只重新解析包含修改的元素
+        self.code_edit.document().contentsChange.connect(self.on_code_contents_change)
         
-        # 创建XML语法高亮器
-        self.highlighter = XMLHighlighter(self.code_edit.document())
+        # 创建XML语法高亮器，先高亮可见的行，其余的行在空闲时处理
+        self.highlighter = ViewportXMLHighlighter(self.code_edit)
         
         code_layout.addWidget(self.code_edit)
         
@@ -1171,6 +1267,13 @@ class XMLEditorWindow(QMainWindow):
         self.save_code_btn.setEnabled(False)  # 初始禁用
         code_layout.addWidget(self.save_code_btn)
         
+        # 代码格式错误提示
+        self.code_error_label = QLabel()
+        self.code_error_label.setStyleSheet("color: #D00000;")
+        self.code_error_label.setWordWrap(True)
+        self.code_error_label.setVisible(False)
+        code_layout.addWidget(self.code_error_label)
+        
         # 添加到分割器
         splitter.addWidget(tree_widget)
         splitter.addWidget(attr_widget)
@@ -1218,9 +1321,9 @@ class XMLEditorWindow(QMainWindow):
             # 获取当前代码视图中的内容
             xml_content = self.code_edit.toPlainText()
             
-            # 直接写入到文件，保留所有格式
-            with open(self.current_file, 'w', encoding='utf-8') as f:
-                f.write(xml_content)
+            # 写入临时文件后替换原文件，保留所有格式，写入中途出错不会截断原文件
+            atomic_write(self.current_file, xml_content)
+            self.file_content_hash = content_digest(xml_content.encode('utf-8'))
             
             # 保存注释和其他设置
             self.global_attrs.save_comments()
@@ -1239,6 +1342,10 @@ class XMLEditorWindow(QMainWindow):
     
     def saveFile(self):
         """带确认对话框的保存文件方法"""
+        if self.outline is not None:
+            self.statusBar().showMessage('大文件模式为只读，无法保存', 3000)
+            return
+        
         if not self.current_file:
             file_path, _ = QFileDialog.getSaveFileName(self, '保存XML文件', '', 'XML文件 (*.xml);;所有文件 (*)')
             if not file_path:
@@ -1260,9 +1367,9 @@ class XMLEditorWindow(QMainWindow):
             # 获取当前代码视图中的内容
             xml_content = self.code_edit.toPlainText()
             
-            # 直接写入到文件，保留所有格式
-            with open(self.current_file, 'w', encoding='utf-8') as f:
-                f.write(xml_content)
+            # 写入临时文件后替换原文件，保留所有格式，写入中途出错不会截断原文件
+            atomic_write(self.current_file, xml_content)
+            self.file_content_hash = content_digest(xml_content.encode('utf-8'))
             
             # 保存注释和其他设置
             self.global_attrs.save_comments()
@@ -1289,144 +1396,333 @@ class XMLEditorWindow(QMainWindow):
             # 格式化失败时返回原始字符串
             return xml_str
     
+    @contextmanager
+    def batch_edit(self, text=None):
+        """
+        批量编辑：暂停树视图重绘，执行修改后一次性同步视图状态并重绘
+        
+        期间树视图如果被完整重建，重建前的展开、选中和滚动状态在批量编辑结束时
+        一次性恢复（文档被重新解析时按元素的稳定ID匹配）。可以嵌套，
+        只在最外层结束时恢复和重绘。
+        
+        Args:
+            text: 撤销记录的名称，提供时期间push的命令合并为一次撤销操作
+        """
+        self.batch_depth += 1
+        if self.batch_depth == 1:
+            self.batch_tree_state = None
+            self.tree_widget.setUpdatesEnabled(False)
+        try:
+            if text:
+                with self.undo_stack.macro(text):
+                    yield
+            else:
+                yield
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                try:
+                    if self.batch_tree_state is not None:
+                        self.batch_tree_state.restore_state()
+                finally:
+                    self.batch_tree_state = None
+                    self.tree_widget.setUpdatesEnabled(True)
+    
     def update_tree_widget(self, save_expand_state=False):
-        """更新树视图并迁移旧版本注释"""
-        # 保存当前展开状态
-        expand_states = {}
-        if save_expand_state:
-            expand_states = self.save_tree_expand_states()
-            
-        self.tree_widget.clear()
-        self.tree_items = {}
-        self.path_elements = {}
+        """重新显示整个文档的结构树并迁移旧版本注释
+        
+        Args:
+            save_expand_state: 为True时重新显示后恢复之前的展开、选中和滚动状态
+                （文档被重新解析时按元素的稳定ID匹配）
+        """
+        tree_state = None
+        if self.tree_model.root is not None:
+            if self.batch_depth:
+                # 批量编辑中只在第一次重建前保存视图状态，结束时一次性恢复
+                if self.batch_tree_state is None:
+                    self.batch_tree_state = TreeStateManager(
+                        self.tree_widget, self.file_tabs.element_ids.id_of).save_state()
+            elif save_expand_state:
+                tree_state = TreeStateManager(
+                    self.tree_widget, self.file_tabs.element_ids.id_of).save_state()
+        
+        # 模型在视图展开节点时才读取其子节点，所有组默认收起，只展开根元素
+        self.tree_model.set_root(self.root)
         
         if self.root is not None:
-            root_item = self.add_element_to_tree(self.root, None)
-            
-            # 不再自动展开所有节点
-            # self.tree_widget.expandAll()
-            
-            # 收起所有组，展开顶层
-            if root_item:
-                root_item.setExpanded(True)  # 展开根节点
-                self.collapse_all_groups(root_item)
+            self.tree_widget.expand(self.tree_model.index_for_node(self.root))
             
-            # 迁移旧版本的基于路径的注释到基于ID的注释
-            self.file_tabs.migrate_path_to_id(self.current_file, self.path_elements)
+            # 迁移旧版本的基于路径的注释到基于ID的注释，只在有待迁移的注释时计算路径
+            if self.file_tabs.path_to_id_map.get(self.current_file):
+                path_elements = {self.get_element_path(node): node
+                                 for node in self.root.iter() if self.tree_model.is_tree_node(node)}
+                self.file_tabs.migrate_path_to_id(self.current_file, path_elements)
             
             # 恢复之前的展开状态
-            if save_expand_state and expand_states:
-                self.restore_tree_expand_states(expand_states)
-    
-    def get_element_path(self, element):
-        """获取元素的XPath路径"""
-        return self.tree.getpath(element)
+            if tree_state is not None:
+                tree_state.restore_state()
     
-    def add_element_to_tree(self, element, parent_item):
-        base_dir = os.path.dirname(self.current_file) if self.current_file else None
-        
-        # 处理注释节点
-        if isinstance(element, etree._Comment):
-            if not self.tree_widget.show_comments:
-                return None
-            
-            if parent_item is None:
-                item = DraggableTreeItem(self.tree_widget, element, base_dir)
-            else:
-                item = DraggableTreeItem(parent_item, element, base_dir)
-            
-            # 设置注释文本（去掉<!-- -->标记）
-            comment_text = element.text.strip()
-            item.setText(0, comment_text)
-            item.setForeground(0, self.tree_widget.comment_color)
-            
-            # 存储映射关系
-            self.tree_items[element] = item
-            path = self.get_element_path(element)
-            self.path_elements[path] = element
-            
-            return item
-        
-        # 处理普通元素节点
-        if parent_item is None:
-            item = DraggableTreeItem(self.tree_widget, element, base_dir)
-        else:
-            item = DraggableTreeItem(parent_item, element, base_dir)
+    def update_tree_items(self, parents):
+        """增量更新结构树：只同步子节点发生变化的父元素下的行
         
-        # 存储映射关系
-        self.tree_items[element] = item
-        path = self.get_element_path(element)
-        self.path_elements[path] = element
+        插入、删除和移动都归结为"父元素的子节点列表变化"。模型比较缓存的子节点列表
+        和文档，发出插入、删除和移动行的信号，视图保留其余行以及被移动行的子树和展开状态。
+        视图尚未展开过的父元素没有缓存，展开时直接按最新结构读取。
         
-        # 获取可见列
-        visible_columns = self.get_visible_columns()
-        
-        # 设置功能注释和作用注释（可见性取决于配置）
-        if '功能注释' in visible_columns:
-            col_position = visible_columns.index('功能注释')
-            tag = element.tag
-            if tag in self.global_attrs.feature_comments:
-                item.setText(col_position, self.global_attrs.feature_comments[tag])
-        
-        if '作用注释' in visible_columns:
-            col_position = visible_columns.index('作用注释')
-            comment = self.file_tabs.get_comment(self.current_file, element)
-            if comment:
-                item.setText(col_position, comment)
-        
-        # 设置Name值（如果可见）
-        if 'Name值' in visible_columns:
-            col_position = visible_columns.index('Name值')
-            if "name" in element.attrib:
-                item.setText(col_position, element.attrib["name"])
-        
-        # 设置所有自定义列的值
-        for attr_name in self.tree_columns['custom']:
-            if attr_name in visible_columns:
-                col_position = visible_columns.index(attr_name)
-                
-                # 处理可能以"值"结尾的自定义列
-                real_attr_name = attr_name
-                if attr_name.endswith("值"):
-                    real_attr_name = attr_name[:-1]
-                
-                # 特殊处理Name值，确保使用小写的name
-                if real_attr_name.lower() == "name":
-                    real_attr_name = "name"
-                
-                if real_attr_name in element.attrib:
-                    item.setText(col_position, element.attrib[real_attr_name])
+        Args:
+            parents: 子节点发生变化的父元素列表（可包含已脱离文档的元素）
+        """
+        if self.root is None:
+            return
         
-        # 递归添加子元素和注释
-        for child in element:
-            if isinstance(child.tag, str) or isinstance(child, etree._Comment):  # 处理元素节点和注释节点
-                self.add_element_to_tree(child, item)
+        if self.tree_model.root is not self.root:
+            # 根元素已被替换，只能整体重新显示
+            self.update_tree_widget(save_expand_state=True)
+            return
         
-        return item
+        self.tree_model.sync_children(parents)
+    
+    def get_element_path(self, element):
+        """获取元素的XPath路径"""
+        return self.tree.getpath(element)
+    
+    def serialize_document(self):
+        """代码视图中显示的文档文本"""
+        # 使用参数配置保持原始格式，包括自闭合标签
+        return etree.tostring(self.tree, 
+                              encoding='utf-8', 
+                              xml_declaration=True,
+                              pretty_print=True,
+                              with_tail=True,
+                              method='xml',
+                              ).decode('utf-8')
     
     def update_code_view(self):
         if self.tree is not None:
             try:
-                # 使用参数配置保持原始格式，包括自闭合标签
-                xml_str = etree.tostring(self.tree, 
-                                       encoding='utf-8', 
-                                       xml_declaration=True,
-                                       pretty_print=True,
-                                       with_tail=True,
-                                       method='xml',
-                                       ).decode('utf-8')
+                xml_str = self.serialize_document()
+                
+                # 设置到代码视图，保持原来的滚动位置
+                vbar = self.code_edit.verticalScrollBar()
+                current_scroll = vbar.value() if vbar else 0
+                self.updating_code_view = True
+                try:
+                    self.code_edit.setPlainText(xml_str)
+                finally:
+                    self.updating_code_view = False
+                if vbar:
+                    vbar.setValue(current_scroll)
+                self.code_synced_text.reset(xml_str)
                 
-                # 设置到代码视图
-                self.code_edit.setText(xml_str)
+                # 重建节点位置映射
+                try:
+                    self.source_map = XMLSourceMap(xml_str, self.root)
+                except ValueError as e:
+                    print(f"建立代码位置映射失败: {e}")
+                    self.source_map = None
                 
             except Exception as e:
                 print(f"更新代码视图失败: {e}")
                 import traceback
                 traceback.print_exc()
     
-    def on_tree_item_clicked(self, item):
-        self.current_tree_item = item
-        element = item.element
+    def update_code_view_for_element(self, node):
+        """节点自身（属性或注释文本）变化后，只替换代码视图中对应的文本
+        
+        通过位置映射找到节点开始标签所在的范围，用光标编辑替换，
+        保留代码视图的撤销历史和滚动位置，语法高亮也只重新处理受影响的行。
+        无法局部更新时退回到完整更新。
+        
+        Args:
+            node: 属性或文本发生变化的元素或注释节点
+        """
+        if not self._patch_code_view(node):
+            self.update_code_view()
+    
+    def _patch_code_view(self, node):
+        """尝试用光标编辑替换节点开始标签的文本，成功返回True"""
+        if self.source_map is None or node not in self.source_map or self.code_has_changes:
+            return False
+        
+        new_text = serialize_start_tag(node)
+        if new_text is None or contains_astral(new_text):
+            return False
+        
+        start, end = self.source_map.tag_span(node)
+        document = self.code_edit.document()
+        if end >= document.characterCount():
+            return False
+        
+        cursor = QTextCursor(document)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        old_text = cursor.selectedText()
+        if not old_text.startswith('<') or not old_text.endswith('>'):
+            # 映射已与文本不一致
+            self.source_map = None
+            return False
+        if old_text == new_text:
+            return True
+        
+        self.updating_code_view = True
+        try:
+            cursor.beginEditBlock()
+            cursor.insertText(new_text)
+            cursor.endEditBlock()
+        finally:
+            self.updating_code_view = False
+        
+        self.source_map.update_tag(node, len(new_text))
+        self.code_synced_text.replace(start, end, new_text)
+        return True
+    
+    def update_code_view_for_subtrees(self, replacements):
+        """若干子树被替换后，只替换代码视图中这些子树的文本
+        
+        无法局部更新时退回到完整更新。
+        
+        Args:
+            replacements: [(旧节点, 新节点)]，新节点已在文档中
+        """
+        if not self._patch_code_subtrees(replacements):
+            self.update_code_view()
+    
+    def _patch_code_subtrees(self, replacements):
+        """尝试单独序列化各个新子树，用光标编辑替换旧子树在代码视图中的文本，成功返回True
+        
+        只序列化新子树、只扫描旧子树所在的一段文本，代价与文档大小无关。
+        替换节点时保留原来的尾部文本，子树之外的文本不变；
+        新子树无法单独序列化（见serialize_subtree）时返回False。
+        """
+        if (self.source_map is None or self.code_has_changes or not replacements
+                or len(replacements) > self.max_code_patches):
+            return False
+        if any(old_node not in self.source_map for old_node, new_node in replacements):
+            return False
+        
+        document = self.code_edit.document()
+        if len(self.code_synced_text) != document.characterCount() - 1:
+            return False
+        
+        # 按文档顺序计算各个旧子树在同步时文本中的范围和新子树的文本
+        regions = []
+        for old_node, new_node in sorted(replacements, key=lambda pair: self.source_map.index[pair[0]]):
+            start, end = self.source_map.tag_span(old_node)
+            if isinstance(old_node.tag, str):
+                end = self.code_synced_text.element_end(start)
+            text = serialize_subtree(new_node)
+            if end is None or text is None:
+                return False
+            regions.append((old_node, new_node, start, end, text))
+        
+        # 从后向前替换，前面子树的位置不受影响
+        self.updating_code_view = True
+        try:
+            cursor = QTextCursor(document)
+            cursor.beginEditBlock()
+            for old_node, new_node, start, end, text in reversed(regions):
+                cursor.setPosition(start)
+                cursor.setPosition(end, QTextCursor.KeepAnchor)
+                cursor.insertText(text)
+            cursor.endEditBlock()
+        finally:
+            self.updating_code_view = False
+        for old_node, new_node, start, end, text in reversed(regions):
+            self.code_synced_text.replace(start, end, text)
+        
+        # 按文档顺序更新位置映射，每次只扫描一个新子树，前面子树的长度变化计入起始位置
+        try:
+            delta = 0
+            for old_node, new_node, start, end, text in regions:
+                self.source_map.replace_subtree(old_node, new_node, text, start + delta,
+                                                len(text) - (end - start))
+                delta += len(text) - (end - start)
+        except ValueError as e:
+            print(f"更新代码位置映射失败: {e}")
+            self.source_map = None
+        return True
+    
+    def update_code_view_for_elements(self, elements):
+        """若干元素的子节点或标签名在原地变化后，只替换代码视图中这些元素的子树的文本
+        
+        用于撤销和重做插入、删除、移动等命令，代价与变化的子树大小有关，与文档大小无关。
+        无法局部更新时退回到完整更新。
+        
+        Args:
+            elements: 子节点或标签名变化的元素，仍在文档中
+        """
+        if not self._patch_code_elements(elements):
+            self.update_code_view()
+    
+    def _patch_code_elements(self, elements):
+        """尝试单独序列化各个元素的子树，用光标编辑替换它们在代码视图中的文本，成功返回True
+        
+        只处理最外层的元素。子树无法单独序列化（见serialize_subtree）时返回False。
+        """
+        if self.source_map is None or self.code_has_changes or not elements:
+            return False
+        
+        # 找出最外层的元素，它们必须在映射中且不是根元素
+        elements = set(elements)
+        outermost = []
+        for element in elements:
+            if not isinstance(element.tag, str) or element not in self.source_map or element.nsmap:
+                return False
+            nested = False
+            node = element
+            while node.getparent() is not None:
+                node = node.getparent()
+                nested = nested or node in elements
+            if node is not self.root or element is self.root:
+                return False
+            if not nested:
+                outermost.append(element)
+        if len(outermost) > self.max_code_patches:
+            return False
+        
+        document = self.code_edit.document()
+        if len(self.code_synced_text) != document.characterCount() - 1:
+            return False
+        
+        # 计算各个子树在同步时文本中的范围和新文本
+        regions = []
+        for element in outermost:
+            start = self.source_map.tag_span(element)[0]
+            end = self.code_synced_text.element_end(start)
+            text = serialize_subtree(element)
+            if end is None or text is None:
+                return False
+            regions.append((start, end, element, text))
+        
+        # 从后向前替换，前面子树的位置不受影响
+        regions.sort(key=lambda region: region[0], reverse=True)
+        self.updating_code_view = True
+        try:
+            cursor = QTextCursor(document)
+            cursor.beginEditBlock()
+            for start, end, element, text in regions:
+                cursor.setPosition(start)
+                cursor.setPosition(end, QTextCursor.KeepAnchor)
+                cursor.insertText(text)
+            cursor.endEditBlock()
+        finally:
+            self.updating_code_view = False
+        
+        for start, end, element, text in regions:
+            self.code_synced_text.replace(start, end, text)
+        try:
+            for start, end, element, text in regions:
+                self.source_map.replace_children(element, text, start, end)
+        except ValueError as e:
+            print(f"更新代码位置映射失败: {e}")
+            self.source_map = None
+        return True
+    
+    def on_tree_item_clicked(self, index):
+        element = self.tree_model.node_from_index(index)
+        if element is None:
+            return
+        self.current_element = element
         
         # 更新属性表
         self.update_attr_table(element)
@@ -1435,10 +1731,6 @@ class XMLEditorWindow(QMainWindow):
         self.highlight_element_in_code(element)
     
     def update_attr_table(self, element):
-        self.attr_table.blockSignals(True)  # 阻止信号避免递归调用
-        
-        self.attr_table.setRowCount(0)
-        
         # 根据元素类型决定是否显示图片预览
         if element.tag == "Image" and "src" in element.attrib and self.current_file:
             # 显示图片预览
@@ -1463,196 +1755,108 @@ class XMLEditorWindow(QMainWindow):
             # 隐藏图片预览
             self.image_preview.setVisible(False)
         
-        for i, (attr, value) in enumerate(element.attrib.items()):
-            self.attr_table.insertRow(i)
-            
-            # 属性名
-            attr_item = QTableWidgetItem(attr)
-            self.attr_table.setItem(i, 0, attr_item)
-            
-            # 属性值
-            value_item = QTableWidgetItem(value)
-            self.attr_table.setItem(i, 1, value_item)
-            
-            # 属性注释
-            comment = ""
-            if attr in self.global_attrs.attribute_comments:
-                comment = self.global_attrs.attribute_comments[attr]
-            comment_item = QTableWidgetItem(comment)
-            self.attr_table.setItem(i, 2, comment_item)
-            
-            # 添加删除按钮
-            delete_btn = QPushButton("X")
-            delete_btn.clicked.connect(lambda _, row=i: self.delete_attribute(row))
-            self.attr_table.setCellWidget(i, 3, delete_btn)
-        
-        # 添加一个空行用于添加新属性
-        row = self.attr_table.rowCount()
-        self.attr_table.insertRow(row)
-        new_attr = QTableWidgetItem("<添加新属性>")
-        new_attr.setForeground(QColor(128, 128, 128))
-        self.attr_table.setItem(row, 0, new_attr)
-        
-        self.attr_table.blockSignals(False)
+        # 模型只为变化的行通知视图，不重新创建单元格
+        self.attr_model.set_element(element, self.global_attrs.attribute_comments)
     
     def on_attr_changed(self, row, col):
-        if not self.current_tree_item:
+        if self.current_element is None:
             return
         
-        element = self.current_tree_item.element
+        element = self.current_element
         
         # 检查是否是最后一行（添加新属性）
-        if row == self.attr_table.rowCount() - 1:
-            attr_item = self.attr_table.item(row, 0)
-            if attr_item and attr_item.text() != "<添加新属性>":
+        if self.attr_model.is_add_row(row):
+            if col == 0:
                 # 用户在最后一行输入了新属性
-                attr_name = attr_item.text().strip()
+                attr_name = self.attr_model.text(row, 0).strip()
                 
                 # 检查属性名是否为空
                 if not attr_name:
                     QMessageBox.warning(self, "错误", "属性名不能为空")
                     # 恢复默认文本
-                    attr_item.setText("<添加新属性>")
+                    self.attr_model.set_text(row, 0, "")
                     return
                 
-                attr_value = ""
-                value_item = self.attr_table.item(row, 1)
-                if value_item:
-                    attr_value = value_item.text()
+                attr_value = self.attr_model.text(row, 1)
                 
                 # 添加新属性
-                element.set(attr_name, attr_value)
+                self.undo_stack.push(SetAttributeCommand(element, attr_name, attr_value))
                 
                 # 更新注释
-                comment_item = self.attr_table.item(row, 2)
-                if comment_item and comment_item.text():
-                    self.global_attrs.attribute_comments[attr_name] = comment_item.text()
+                comment = self.attr_model.text(row, 2)
+                if comment:
+                    self.global_attrs.attribute_comments[attr_name] = comment
                 
-                # 刷新UI
-                self.update_attr_table(element)
-                self.update_code_view()
-                # 刷新树结构列显示
-                self.refresh_tree_columns()
+                # 只刷新该元素的树项目、代码和属性表
+                self.refresh_element(element)
                 return
         
         # 处理现有属性的更改
-        if col < 2 and row < self.attr_table.rowCount() - 1:
-            attr_item = self.attr_table.item(row, 0)
-            value_item = self.attr_table.item(row, 1)
+        if col < 2 and self.attr_model.is_attribute_row(row):
+            attr_name = self.attr_model.text(row, 0).strip()
+            attr_value = self.attr_model.text(row, 1)
+            
+            # 检查属性名是否为空
+            if not attr_name:
+                QMessageBox.warning(self, "错误", "属性名不能为空")
+                # 恢复原属性名
+                old_attrs = list(element.attrib.keys())
+                if row < len(old_attrs):
+                    self.attr_model.set_text(row, 0, old_attrs[row])
+                return
             
-            if attr_item and value_item:
-                attr_name = attr_item.text().strip()
-                attr_value = value_item.text()
+            # 获取所有属性及其顺序
+            old_attrs = list(element.attrib.keys())
+            
+            if row < len(old_attrs):
+                old_attr = old_attrs[row]
                 
-                # 检查属性名是否为空
-                if not attr_name:
-                    QMessageBox.warning(self, "错误", "属性名不能为空")
-                    # 恢复原属性名
-                    old_attrs = list(element.attrib.keys())
-                    if row < len(old_attrs):
-                        attr_item.setText(old_attrs[row])
-                    return
+                # 如果只是修改属性值，并且属性名没变
+                if old_attr == attr_name:
+                    # 直接设置新值，保持顺序不变
+                    if element.get(attr_name) != attr_value:
+                        self.undo_stack.push(SetAttributeCommand(element, attr_name, attr_value))
+                else:
+                    # 属性名也变了，在原位置替换为新属性，其余属性保持顺序
+                    new_attrs = []
+                    for i, attr in enumerate(old_attrs):
+                        if i == row:
+                            new_attrs.append((attr_name, attr_value))  # 在原位置插入新属性名
+                        elif attr != attr_name:
+                            new_attrs.append((attr, element.attrib[attr]))  # 保留其他属性
+                    self.undo_stack.push(SetAttributesCommand(element, new_attrs))
                 
-                # 获取所有属性及其顺序
-                old_attrs = list(element.attrib.keys())
+                # 将新属性名添加到自定义属性列表
+                # （属性值补全数据来自文档索引，已由撤销栈的监听器随命令更新）
+                if self.autocomplete_enabled:
+                    self.attr_completer.add_custom_attribute(attr_name)
                 
-                if row < len(old_attrs):
-                    old_attr = old_attrs[row]
-                    
-                    # 如果只是修改属性值，并且属性名没变
-                    if old_attr == attr_name:
-                        # 直接设置新值，保持顺序不变
-                        element.set(attr_name, attr_value)
-                    else:
-                        # 属性名也变了，需要重建所有属性来保持顺序
-                        
-                        # 保存所有属性值
-                        attr_values = {}
-                        for attr in old_attrs:
-                            attr_values[attr] = element.attrib[attr]
-                        
-                        # 更新修改的属性
-                        attr_values.pop(old_attr, None)  # 删除旧属性
-                        attr_values[attr_name] = attr_value  # 添加新属性
-                        
-                        # 创建新的有序属性列表
-                        new_attrs = []
-                        for i, attr in enumerate(old_attrs):
-                            if i == row:
-                                new_attrs.append(attr_name)  # 在原位置插入新属性名
-                            elif attr != old_attr:
-                                new_attrs.append(attr)  # 保留其他属性
-                        
-                        # 清空所有属性
-                        for attr in list(element.attrib.keys()):
-                            del element.attrib[attr]
-                        
-                        # 按新顺序重新添加所有属性
-                        for attr in new_attrs:
-                            element.set(attr, attr_values[attr])
-                    
-                    # 将新属性名添加到自定义属性列表
-                    if self.autocomplete_enabled:
-                        self.attr_completer.add_custom_attribute(attr_name)
-                    
-                    # 更新属性值自动补全数据
-                    if self.autocomplete_enabled:
-                        # 更新自动补全数据
-                        self.update_completers_from_xml()
-                    
-                    # 更新UI
-                    self.update_attr_table(element)
-                    self.update_code_view()
-                    # 刷新树结构列显示
-                    self.refresh_tree_columns()
+                # 只刷新该元素的树项目、代码和属性表
+                self.refresh_element(element)
         
         # 处理注释的更改
-        if col == 2 and row < self.attr_table.rowCount() - 1:
-            attr_item = self.attr_table.item(row, 0)
-            comment_item = self.attr_table.item(row, 2)
+        if col == 2 and self.attr_model.is_attribute_row(row):
+            attr_name = self.attr_model.text(row, 0)
+            comment = self.attr_model.text(row, 2)
             
-            if attr_item and comment_item:
-                attr_name = attr_item.text()
-                comment = comment_item.text()
-                
-                # 更新属性注释
-                self.global_attrs.attribute_comments[attr_name] = comment
+            # 更新属性注释
+            self.global_attrs.attribute_comments[attr_name] = comment
     
     def delete_attribute(self, row):
-        if not self.current_tree_item:
+        if self.current_element is None:
             return
         
-        element = self.current_tree_item.element
-        attr_item = self.attr_table.item(row, 0)
+        element = self.current_element
         
-        if attr_item:
-            attr_name = attr_item.text()
+        if self.attr_model.is_attribute_row(row):
+            attr_name = self.attr_model.text(row, 0)
             
-            # 检查属性是否存在
+            # 检查属性是否存在，删除时保持其余属性的顺序
             if attr_name in element.attrib:
-                # 获取所有属性及其顺序
-                old_attrs = list(element.attrib.keys())
-                
-                # 保存所有属性值
-                attr_values = {}
-                for attr in old_attrs:
-                    if attr != attr_name:  # 排除要删除的属性
-                        attr_values[attr] = element.attrib[attr]
-                
-                # 清空所有属性
-                for attr in list(element.attrib.keys()):
-                    del element.attrib[attr]
-                
-                # 按原顺序重新添加所有属性（除了被删除的）
-                for attr in old_attrs:
-                    if attr != attr_name:
-                        element.set(attr, attr_values[attr])
+                self.undo_stack.push(SetAttributeCommand(element, attr_name, None))
             
-            # 更新UI
-            self.update_attr_table(element)
-            self.update_code_view()
-            # 刷新树结构列显示
-            self.refresh_tree_columns()
+            # 只刷新该元素的树项目、代码和属性表
+            self.refresh_element(element)
     
     def highlight_element_in_code(self, element):
         """在代码视图中高亮显示选中的元素或注释
@@ -1664,17 +1868,28 @@ class XMLEditorWindow(QMainWindow):
             return
             
         try:
-            # 获取元素的完整文本表示
+            # 优先通过位置映射直接定位元素的开始标签，不会误选文本相同的其他元素
+            span = self.source_map.tag_span(element) if self.source_map is not None else None
+            if span is not None and self.code_has_changes:
+                # 代码视图被手动编辑过，换算到当前文本中（位于修改范围内时无法换算）
+                span = self.code_dirty.map_span(*span)
+            if span is not None and span[1] < self.code_edit.document().characterCount():
+                self._highlight_code_range(*span)
+                return
+            
+            # 没有可用的位置映射时（例如代码视图被手动编辑过），退回到文本查找
             if isinstance(element, etree._Comment):
                 # 对于注释节点，使用完整的注释文本
                 search_text = f"<!--{element.text}-->"
             else:
-                # 对于普通元素，获取其完整的开始标签文本
-                search_text = etree.tostring(element, encoding='utf-8', with_tail=False).decode('utf-8')
-                # 只保留开始标签部分
-                end_pos = search_text.find('>')
-                if end_pos != -1:
-                    search_text = search_text[:end_pos + 1]
+                # 对于普通元素，获取其开始标签文本
+                search_text = serialize_start_tag(element)
+                if search_text is None:
+                    search_text = etree.tostring(element, encoding='utf-8', with_tail=False).decode('utf-8')
+                    # 只保留开始标签部分
+                    end_pos = search_text.find('>')
+                    if end_pos != -1:
+                        search_text = search_text[:end_pos + 1]
             
             # 在代码中查找并高亮
             self._find_and_highlight_text(search_text)
@@ -1684,6 +1899,45 @@ class XMLEditorWindow(QMainWindow):
             import traceback
             traceback.print_exc()
     
+    def set_code_highlights(self, selections):
+        """设置代码视图中的搜索或定位高亮，保留格式错误标记"""
+        self.code_highlight_selections = list(selections)
+        self.code_edit.setExtraSelections(self.code_highlight_selections + self.validation_selections)
+    
+    def _create_highlight_selection(self, cursor):
+        """创建代码视图中的黄色高亮选择"""
+        selection = QTextEdit.ExtraSelection()
+        
+        # 设置高亮格式
+        format = QTextCharFormat()
+        format.setBackground(QColor(255, 255, 0))  # 黄色背景
+        format.setForeground(QColor(0, 0, 0))      # 黑色文字
+        selection.format = format
+        
+        # 设置选择范围
+        selection.cursor = QTextCursor(cursor)
+        return selection
+    
+    def _highlight_code_range(self, start, end):
+        """高亮代码视图中指定范围的文本并滚动到该位置
+        
+        Args:
+            start: 起始字符位置
+            end: 结束字符位置
+        """
+        # 清除所有已有的高亮
+        self.clear_search_highlighting()
+        
+        cursor = QTextCursor(self.code_edit.document())
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.set_code_highlights([self._create_highlight_selection(cursor)])
+        
+        # 将光标移到元素开始处并滚动到可见位置
+        cursor.setPosition(start)
+        self.code_edit.setTextCursor(cursor)
+        self.code_edit.ensureCursorVisible()
+    
     def _find_and_highlight_text(self, search_text):
         """在代码中查找并高亮指定的文本
         
@@ -1714,17 +1968,7 @@ class XMLEditorWindow(QMainWindow):
                     break
                 
                 # 创建高亮选择
-                selection = QTextEdit.ExtraSelection()
-                
-                # 设置高亮格式
-                format = QTextCharFormat()
-                format.setBackground(QColor(255, 255, 0))  # 黄色背景
-                format.setForeground(QColor(0, 0, 0))      # 黑色文字
-                selection.format = format
-                
-                # 设置选择范围
-                selection.cursor = QTextCursor(cursor)
-                extra_selections.append(selection)
+                extra_selections.append(self._create_highlight_selection(cursor))
                 
                 # 记录第一个匹配位置
                 if first_match is None:
@@ -1737,7 +1981,7 @@ class XMLEditorWindow(QMainWindow):
                 current_scroll = vbar.value() if vbar else 0
                 
                 # 应用高亮
-                self.code_edit.setExtraSelections(extra_selections)
+                self.set_code_highlights(extra_selections)
                 
                 # 如果找到了匹配项，滚动到第一个匹配处
                 if first_match:
@@ -1760,7 +2004,7 @@ class XMLEditorWindow(QMainWindow):
             return
         
         # 清除所有高亮
-        self.code_edit.setExtraSelections([])
+        self.set_code_highlights([])
         
         # 重置光标位置，但不改变滚动位置
         cursor = self.code_edit.textCursor()
@@ -1770,9 +2014,9 @@ class XMLEditorWindow(QMainWindow):
     def show_tree_context_menu(self, position):
         """显示树节点的右键菜单"""
         menu = QMenu()
-        item = self.tree_widget.itemAt(position)
+        node = self.tree_widget.node_at(position)
         
-        if item:
+        if node is not None:
             # 剪切动作
             cut_action = QAction('剪切', self)
             cut_action.setShortcut('Ctrl+X')
@@ -1795,14 +2039,14 @@ class XMLEditorWindow(QMainWindow):
             
             # 添加编辑选项（重命名）
             rename_action = QAction("编辑元素名称", self)
-            rename_action.triggered.connect(lambda: self.start_rename_element(item))
+            rename_action.triggered.connect(lambda: self.start_rename_element(node))
             menu.addAction(rename_action)
             
             menu.addSeparator()
             
             # 添加源代码注释
             add_comment_action = QAction("添加源代码注释", self)
-            add_comment_action.triggered.connect(lambda: self.add_source_comment(item))
+            add_comment_action.triggered.connect(lambda: self.add_source_comment(node))
             menu.addAction(add_comment_action)
             
             menu.addSeparator()
@@ -1823,11 +2067,11 @@ class XMLEditorWindow(QMainWindow):
             menu.addSeparator()
             
             add_feature_comment = QAction("添加功能注释", self)
-            add_feature_comment.triggered.connect(lambda: self.add_feature_comment(item))
+            add_feature_comment.triggered.connect(lambda: self.add_feature_comment(node))
             menu.addAction(add_feature_comment)
             
             add_usage_comment = QAction("添加作用注释", self)
-            add_usage_comment.triggered.connect(lambda: self.add_usage_comment(item))
+            add_usage_comment.triggered.connect(lambda: self.add_usage_comment(node))
             menu.addAction(add_usage_comment)
         
         menu.exec_(self.tree_widget.viewport().mapToGlobal(position))
@@ -1842,38 +2086,31 @@ class XMLEditorWindow(QMainWindow):
         menu.addAction(add_attr_action)
         
         # 获取当前选中的单元格
-        current_item = self.attr_table.itemAt(position)
-        if current_item:
-            row = self.attr_table.row(current_item)
-            if row < self.attr_table.rowCount() - 1:  # 不是最后一行（添加属性行）
-                menu.addSeparator()
-                
-                # 删除属性动作
-                delete_attr_action = QAction("删除属性", self)
-                delete_attr_action.triggered.connect(lambda: self.delete_attribute(row))
-                menu.addAction(delete_attr_action)
+        row = self.attr_table.row_at(position)
+        if self.attr_model.is_attribute_row(row):  # 不是最后一行（添加属性行）
+            menu.addSeparator()
+            
+            # 删除属性动作
+            delete_attr_action = QAction("删除属性", self)
+            delete_attr_action.triggered.connect(lambda: self.delete_attribute(row))
+            menu.addAction(delete_attr_action)
         
         menu.exec_(self.attr_table.viewport().mapToGlobal(position))
 
-    def add_source_comment(self, item):
-        """在选中项上方添加源代码注释
+    def add_source_comment(self, element):
+        """在选中节点上方添加源代码注释
         
         Args:
-            item: 选中的树项目
+            element: 选中的元素或注释节点
         """
-        if not item or not hasattr(item, 'element'):
+        if element is None:
             return
             
-        # 获取当前元素
-        element = item.element
         parent = element.getparent()
         
         if parent is None:
             QMessageBox.warning(self, '错误', '不能在根元素上方添加注释')
             return
-            
-        # 创建状态管理器并保存当前状态
-        tree_state = TreeStateManager(self.tree_widget).save_state()
         
         # 获取注释文本
         comment_text, ok = QInputDialog.getText(self, "添加源代码注释", "请输入注释内容:")
@@ -1884,33 +2121,27 @@ class XMLEditorWindow(QMainWindow):
             # 获取当前元素在父元素中的位置
             index = parent.index(element)
             
-            # 在当前元素之前插入注释
-            parent.insert(index, comment)
-            
             # 确保注释后有换行
             comment.tail = "\n"
             
-            # 更新UI
-            self.update_tree_widget(save_expand_state=False)
-            self.update_code_view()
-            
-            # 延迟恢复树状态
-            QTimer.singleShot(100, lambda: tree_state.restore_state())
+            with self.batch_edit():
+                # 在当前元素之前插入注释
+                self.undo_stack.push(InsertNodeCommand(parent, index, comment))
+                
+                # 更新UI（只插入新注释对应的树项目）
+                self.update_tree_items([parent])
+                self.update_code_view()
     
     def paste_elements(self):
         """粘贴XML元素"""
         if not self.clipboard_elements:
             return
             
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
-            return
-            
-        target_item = selected_items[0]
-        if not hasattr(target_item, 'element'):
+        selected_nodes = self.tree_widget.selected_nodes()
+        if not selected_nodes:
             return
             
-        target_element = target_item.element
+        target_element = selected_nodes[0]
         parent_element = target_element.getparent()
         
         if parent_element is None:
@@ -1918,51 +2149,43 @@ class XMLEditorWindow(QMainWindow):
             return
             
         try:
-            # 在执行操作前保存当前状态
-            self.save_undo_state()
-            
-            # 创建状态管理器并保存当前状态
-            tree_state = TreeStateManager(self.tree_widget).save_state()
-            
             # 获取目标元素在父元素中的位置
             target_index = parent_element.index(target_element)
             
-            # 遍历剪贴板中的元素
-            for i, content in enumerate(self.clipboard_elements):
-                try:
-                    if self.clipboard_types[i] == 'comment':
-                        # 创建新的注释节点
-                        new_node = etree.Comment(content)
-                        # 确保注释后有换行符
-                        new_node.tail = "\n"
-                    else:
-                        # 解析XML字符串，确保使用正确的解析器设置
-                        parser = etree.XMLParser(remove_blank_text=False,
-                                              remove_comments=False,
-                                              remove_pis=False,
-                                              strip_cdata=False)
+            # 遍历剪贴板中的元素，所有插入合并为一次撤销操作，界面只在最后重绘一次
+            with self.batch_edit('粘贴'):
+                for i, content in enumerate(self.clipboard_elements):
+                    try:
+                        if self.clipboard_types[i] == 'comment':
+                            # 创建新的注释节点
+                            new_node = etree.Comment(content)
+                            # 确保注释后有换行符
+                            new_node.tail = "\n"
+                        else:
+                            # 解析XML字符串，确保使用正确的解析器设置
+                            parser = etree.XMLParser(remove_blank_text=False,
+                                                  remove_comments=False,
+                                                  remove_pis=False,
+                                                  strip_cdata=False)
+                            
+                            # 使用BytesIO来解析XML字符串
+                            new_node = etree.fromstring(content.encode('utf-8'), parser)
+                            
+                            # 确保元素有正确的换行符
+                            if new_node.tail is None:
+                                new_node.tail = "\n"
                         
-                        # 使用BytesIO来解析XML字符串
-                        new_node = etree.fromstring(content.encode('utf-8'), parser)
+                        # 在目标元素后面插入新节点
+                        self.undo_stack.push(InsertNodeCommand(parent_element, target_index + 1, new_node))
+                        target_index += 1  # 更新插入位置，确保多个元素按顺序插入
                         
-                        # 确保元素有正确的换行符
-                        if new_node.tail is None:
-                            new_node.tail = "\n"
-                    
-                    # 在目标元素后面插入新节点
-                    parent_element.insert(target_index + 1, new_node)
-                    target_index += 1  # 更新插入位置，确保多个元素按顺序插入
-                    
-                except Exception as e:
-                    print(f"解析XML片段失败: {e}")
-                    raise
-            
-            # 更新UI
-            self.update_tree_widget(save_expand_state=False)
-            self.update_code_view()
-            
-            # 使用延迟调用恢复状态
-            QTimer.singleShot(100, lambda: tree_state.restore_state())
+                    except Exception as e:
+                        print(f"解析XML片段失败: {e}")
+                        raise
+                
+                # 更新UI（只插入粘贴的元素对应的树项目和代码文本）
+                self.update_tree_items([parent_element])
+                self.update_code_view_for_elements([parent_element])
             
             # 如果是剪切模式，清空剪贴板
             if self.cut_mode:
@@ -1987,6 +2210,8 @@ class XMLEditorWindow(QMainWindow):
                 self.paste_elements()
             elif event.key() == Qt.Key_Z:  # Ctrl+Z
                 self.undo_last_action()
+            elif event.key() == Qt.Key_Y:  # Ctrl+Y
+                self.redo_last_action()
             else:
                 super().keyPressEvent(event)
         else:
@@ -2003,59 +2228,50 @@ class XMLEditorWindow(QMainWindow):
 
     def copy_elements(self):
         """复制选中的XML元素"""
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
+        selected_nodes = self.tree_widget.selected_nodes()
+        if not selected_nodes:
             return
             
         self.clipboard_elements = []
         self.clipboard_types = []  # 记录每个复制元素的类型
         self.cut_mode = False
         
-        for item in selected_items:
-            if hasattr(item, 'element'):
-                element = item.element
-                if isinstance(element, etree._Comment):
-                    # 对于注释节点，直接保存注释文本
-                    self.clipboard_elements.append(element.text)
-                    self.clipboard_types.append('comment')
-                else:
-                    # 对于普通元素，使用tostring方法
-                    xml_str = etree.tostring(element, 
-                                          encoding='utf-8',
-                                          xml_declaration=False,
-                                          pretty_print=True,
-                                          with_tail=True).decode('utf-8')
-                    self.clipboard_elements.append(xml_str)
-                    self.clipboard_types.append('element')
+        for element in selected_nodes:
+            if isinstance(element, etree._Comment):
+                # 对于注释节点，直接保存注释文本
+                self.clipboard_elements.append(element.text)
+                self.clipboard_types.append('comment')
+            else:
+                # 对于普通元素，使用tostring方法
+                xml_str = etree.tostring(element, 
+                                      encoding='utf-8',
+                                      xml_declaration=False,
+                                      pretty_print=True,
+                                      with_tail=True).decode('utf-8')
+                self.clipboard_elements.append(xml_str)
+                self.clipboard_types.append('element')
     
     def delete_elements(self):
         """删除选中的XML元素，保持树视图状态"""
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
+        selected_nodes = self.tree_widget.selected_nodes()
+        if not selected_nodes:
             return
         
         try:
-            # 在执行操作前保存当前状态
-            self.save_undo_state()
-            
-            # 创建状态管理器并保存当前状态
-            tree_state = TreeStateManager(self.tree_widget).save_state()
-            
-            # 执行删除操作
-            for item in selected_items:
-                element = item.element
-                parent = element.getparent()
+            # 执行删除操作，所有删除合并为一次撤销操作，界面只在最后重绘一次
+            parents = []
+            with self.batch_edit('删除'):
+                for element in selected_nodes:
+                    parent = element.getparent()
+                    
+                    if parent is not None:
+                        self.undo_stack.push(RemoveNodeCommand(element))
+                        parents.append(parent)
                 
-                if parent is not None:
-                    parent.remove(element)
-            
-            # 更新UI
-            self.update_tree_widget(save_expand_state=False)
-            self.update_code_view()
-            
-            # 使用延迟调用恢复状态，确保UI已完全更新
-            QTimer.singleShot(100, lambda: tree_state.restore_state())
-            
+                # 更新UI（只移除被删除元素对应的树项目和代码文本）
+                self.update_tree_items(parents)
+                self.update_code_view_for_elements(parents)
+        
         except Exception as e:
             QMessageBox.critical(self, '错误', f'删除XML元素失败: {str(e)}')
             print(f"删除XML元素失败: {e}")
@@ -2063,16 +2279,14 @@ class XMLEditorWindow(QMainWindow):
             traceback.print_exc()
     
     def goto_element_in_code(self):
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
+        selected_nodes = self.tree_widget.selected_nodes()
+        if not selected_nodes:
             return
         
         # 高亮第一个选中元素
-        element = selected_items[0].element
-        self.highlight_element_in_code(element)
+        self.highlight_element_in_code(selected_nodes[0])
     
-    def add_feature_comment(self, item):
-        element = item.element
+    def add_feature_comment(self, element):
         tag = element.tag
         
         current_comment = ""
@@ -2088,13 +2302,10 @@ class XMLEditorWindow(QMainWindow):
             # 保存全局功能注释
             self.global_attrs.feature_comments[tag] = comment
             
-            # 更新所有相同标签的树项
-            for i in range(self.tree_widget.topLevelItemCount()):
-                self.update_comment_recursive(self.tree_widget.topLevelItem(i), tag, comment, 1)
+            # 重新读取已显示节点的各列，相同标签的节点都显示新注释
+            self.tree_model.refresh_columns()
     
-    def add_usage_comment(self, item):
-        element = item.element
-        
+    def add_usage_comment(self, element):
         # 获取当前注释
         current_comment = self.file_tabs.get_comment(self.current_file, element)
         
@@ -2107,19 +2318,11 @@ class XMLEditorWindow(QMainWindow):
             # 保存作用注释
             self.file_tabs.add_comment(self.current_file, element, comment)
             
-            # 更新当前项
-            item.setText(2, comment)
-    
-    def update_comment_recursive(self, item, tag, comment, col):
-        if item.text(0) == tag:
-            item.setText(col, comment)
-        
-        # 递归更新所有子项
-        for i in range(item.childCount()):
-            self.update_comment_recursive(item.child(i), tag, comment, col)
+            # 更新当前节点
+            self.tree_model.node_changed(element)
     
     def add_attribute(self):
-        if not self.current_tree_item:
+        if self.current_element is None:
             return
         
         # 确保自动补全器已更新
@@ -2127,22 +2330,109 @@ class XMLEditorWindow(QMainWindow):
             self.update_completers_from_xml()
         
         # 更新属性表，最后一行已经是用于添加新属性的行
-        self.attr_table.setCurrentCell(self.attr_table.rowCount() - 1, 0)
-        self.attr_table.editItem(self.attr_table.currentItem())
+        self.attr_table.edit_cell(self.attr_model.rowCount() - 1, 0)
     
     def on_code_text_changed(self):
         """当代码编辑器内容变更时调用"""
+        if self.updating_code_view:
+            # 由XML树生成的文本总是格式正确的
+            self.clear_validation_errors()
+            return
+        
+        # 停止输入validation_delay毫秒后再检查，连续输入只检查一次
+        self.validation_timer.start(self.validation_delay)
+        
+        # 位置映射仍对应同步时的文本，用户修改的范围由code_dirty记录
         self.code_has_changes = True
         self.save_code_btn.setEnabled(True)
     
+    def start_code_validation(self):
+        """把代码视图文本的副本交给后台线程检查"""
+        if not self.code_has_changes:
+            return
+        self.validation_generation += 1
+        self.validation_thread.submit(self.code_edit.toPlainText(), self.validation_generation)
+    
+    def on_code_validated(self, generation, errors):
+        """后台检查完成，只处理最新一次提交的结果"""
+        if generation != self.validation_generation:
+            return
+        self.set_validation_errors(errors)
+    
+    def clear_validation_errors(self):
+        """代码视图文本与XML树一致时清除格式错误标记，并丢弃尚未返回的检查结果"""
+        self.validation_timer.stop()
+        self.validation_generation += 1
+        if self.validation_selections or self.code_error_label.isVisible():
+            self.set_validation_errors([])
+    
+    def set_validation_errors(self, errors):
+        """在代码视图中用红色波浪下划线标出出错的行，并在代码视图下方显示错误信息
+        
+        Args:
+            errors: 错误列表 [(行号, 列号, 错误信息)]，为空时清除标记
+        """
+        document = self.code_edit.document()
+        error_format = QTextCharFormat()
+        error_format.setUnderlineStyle(QTextCharFormat.WaveUnderline)
+        error_format.setUnderlineColor(QColor(220, 0, 0))
+        
+        self.validation_selections = []
+        marked_lines = set()
+        for line, column, message in errors:
+            block = document.findBlockByNumber(max(line, 1) - 1)
+            if not block.isValid() or line in marked_lines:
+                continue
+            marked_lines.add(line)
+            
+            # 从出错的列标到行尾，列号超出行长度时标出整行
+            cursor = QTextCursor(block)
+            if 0 < column <= block.length():
+                cursor.setPosition(block.position() + column - 1)
+            cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            if not cursor.hasSelection():
+                cursor.movePosition(QTextCursor.StartOfBlock, QTextCursor.KeepAnchor)
+            
+            selection = QTextEdit.ExtraSelection()
+            selection.format = error_format
+            selection.cursor = cursor
+            self.validation_selections.append(selection)
+        
+        self.code_edit.setExtraSelections(self.code_highlight_selections + self.validation_selections)
+        
+        if errors:
+            line, column, message = errors[0]
+            text = f'第{line}行第{column}列: {message}'
+            if len(marked_lines) > 1:
+                text += f'（共{len(marked_lines)}行有错误）'
+            self.code_error_label.setText(text)
+        self.code_error_label.setVisible(bool(errors))
+    
+    def on_code_contents_change(self, position, removed, added):
+        """代码视图文本变化时记录修改范围，程序更新文本时重新开始记录"""
+        length = self.code_edit.document().characterCount() - 1
+        if self.updating_code_view:
+            self.code_dirty.reset(length)
+        else:
+            self.code_dirty.record(position, added, length)
+    
     def apply_code_changes(self):
-        """应用代码变更到XML树"""
+        """应用代码变更到XML树
+        
+        修改只涉及某个元素的子树时，只重新解析包含修改的最小元素，替换到现有的树中，
+        并只同步结构树中这一部分；修改跨越多个元素或无法单独解析时才重新解析整个文档。
+        """
         if not self.code_has_changes:
             return
             
         try:
-            # 创建状态管理器并保存当前状态
-            tree_state = TreeStateManager(self.tree_widget).save_state()
+            # 只读取修改所在的一段文本
+            if self.apply_code_region():
+                self.clear_validation_errors()
+                self.code_has_changes = False
+                self.save_code_btn.setEnabled(False)
+                self.statusBar().showMessage('代码更改已应用', 3000)
+                return
             
             # 获取编辑后的XML内容
             xml_content = self.code_edit.toPlainText()
@@ -2157,19 +2447,33 @@ class XMLEditorWindow(QMainWindow):
                                    strip_cdata=False)
             
             # 使用BytesIO和parser解析XML
-            updated_tree = etree.parse(io.BytesIO(xml_bytes), parser)
-            
-            # 更新树和根元素
-            self.tree = updated_tree
-            self.root = self.tree.getroot()
+            try:
+                updated_tree = etree.parse(io.BytesIO(xml_bytes), parser)
+            except etree.XMLSyntaxError as e:
+                # 格式错误在代码视图中标出，不弹出对话框
+                errors = syntax_errors(parser, e)
+                self.clear_validation_errors()
+                self.set_validation_errors(errors)
+                self.statusBar().showMessage(f'代码有格式错误，未应用: 第{errors[0][0]}行 {errors[0][2]}', 5000)
+                return
             
-            # 更新树视图，不保存展开状态（因为我们已经保存了）
-            self.update_tree_widget(save_expand_state=False)
+            # 在批量编辑中替换文档并重建树视图，结束时一次性恢复展开状态
+            with self.batch_edit():
+                # 更新树和根元素（作为一次可撤销的操作，撤销时恢复原来的文档）
+                self.undo_stack.push(ReplaceDocumentCommand(self, updated_tree, len(xml_content)))
+                self.update_tree_widget(save_expand_state=False)
             
-            # 使用延迟调用恢复状态，确保UI已完全更新
-            QTimer.singleShot(100, lambda: tree_state.restore_state())
+            # 当前文本即为新文档的文本，重建位置映射
+            self.code_synced_text.reset(xml_content)
+            self.code_dirty.reset(len(xml_content))
+            try:
+                self.source_map = XMLSourceMap(xml_content, self.root)
+            except ValueError as e:
+                print(f"建立代码位置映射失败: {e}")
+                self.source_map = None
             
             # 重置更改标志
+            self.clear_validation_errors()
             self.code_has_changes = False
             self.save_code_btn.setEnabled(False)
             
@@ -2182,88 +2486,122 @@ class XMLEditorWindow(QMainWindow):
             import traceback
             traceback.print_exc()
     
+    def code_text(self, start, end):
+        """代码视图中[start, end)的文本，只读取这一段，换行符等与toPlainText()相同
+        
+        Args:
+            start: 起始位置
+            end: 结束位置，超出文本末尾时截断
+        """
+        document = self.code_edit.document()
+        cursor = QTextCursor(document)
+        cursor.setPosition(start)
+        cursor.setPosition(min(end, document.characterCount() - 1), QTextCursor.KeepAnchor)
+        return cursor.selectedText().translate(_PLAIN_TEXT_TABLE)
+    
+    def apply_code_region(self):
+        """只重新解析包含全部修改的最小元素并替换到树中
+        
+        只从代码视图读取修改范围和该元素所在的文本，代价与文档大小无关。
+        
+        Returns:
+            成功应用返回True；修改跨越多个元素或该元素无法单独解析时返回False，需要完整解析
+        """
+        region = find_reparse_region(self.source_map, self.code_synced_text, self.code_text, self.code_dirty)
+        if region is None:
+            return False
+        old_node, start, end = region
+        fragment = self.code_text(start, end)
+        
+        parser = etree.XMLParser(remove_blank_text=False,
+                                 remove_comments=False,
+                                 remove_pis=False,
+                                 strip_cdata=False)
+        try:
+            new_node = etree.fromstring(fragment.encode('utf-8'), parser)
+        except etree.XMLSyntaxError:
+            # 例如使用了祖先元素上声明的命名空间前缀，交给完整解析处理（包括报告语法错误）
+            return False
+        
+        self.push_replace_command(ReplaceNodeCommand(old_node, new_node))
+        
+        # 位置映射只重新扫描新子树，其后的节点整体平移；同步时的文本只替换这一段
+        delta = self.code_dirty.length - self.code_dirty.synced_length
+        try:
+            self.source_map.replace_subtree(old_node, new_node, fragment, start, delta)
+        except ValueError as e:
+            print(f"更新代码位置映射失败: {e}")
+            self.source_map = None
+        self.code_synced_text.replace(start, end - delta, fragment)
+        self.code_dirty.reset(self.code_dirty.length)
+        return True
+    
+    def push_replace_command(self, command, record=True):
+        """执行替换子树的命令，只同步结构树中受影响的部分
+        
+        被替换子树中展开和选中的元素在替换后恢复到新子树中对应的元素。
+        
+        Args:
+            command: ReplaceNodeCommand，或由多个ReplaceNodeCommand组成的MacroCommand
+            record: 为False时不记录到撤销栈，并清空编辑历史（见UndoStack.apply）
+        """
+        # 记录被替换子树中展开和选中的元素
+        element_ids = self.file_tabs.element_ids
+        old_nodes = set()
+        expanded_ids = set()
+        for old_node, new_node in command.replacements:
+            old_nodes.add(old_node)
+            for node in old_node.iter():
+                index = self.tree_model.cached_index(node)
+                if index.isValid() and self.tree_widget.isExpanded(index):
+                    expanded_ids.add(element_ids.id_of(node))
+        selected_id = None
+        if self.current_element is not None:
+            current = self.current_element
+            while current is not None and current not in old_nodes:
+                current = current.getparent()
+            if current is not None:
+                selected_id = element_ids.id_of(self.current_element)
+        
+        with self.batch_edit():
+            if record:
+                self.undo_stack.push(command)
+            else:
+                self.undo_stack.apply(command)
+            self.update_tree_items(command.parents)
+            for old_node, new_node in command.replacements:
+                for node in new_node.iter():
+                    if element_ids.id_of(node) in expanded_ids:
+                        index = self.tree_model.index_for_node(node)
+                        if index.isValid():
+                            self.tree_widget.expand(index)
+        
+        if selected_id is not None:
+            element = element_ids.element_of(selected_id)
+            if element is not None and not self.tree_model.index_for_node(element).isValid():
+                element = None
+            self.current_element = element
+            if element is not None:
+                self.tree_widget.select_node(element)
+                self.update_attr_table(element)
+            else:
+                self.attr_model.clear()
+    
     def refresh_tree_comments(self):
         """刷新树节点的注释显示"""
         if not self.current_file:
             return
             
-        # 获取可见列
-        visible_columns = self.get_visible_columns()
-        
-        # 更新所有树节点的注释
-        for element, item in self.tree_items.items():
-            # 更新功能注释
-            tag = element.tag
-            if '功能注释' in visible_columns:
-                col_position = visible_columns.index('功能注释')
-                if tag in self.global_attrs.feature_comments:
-                    item.setText(col_position, self.global_attrs.feature_comments[tag])
-                else:
-                    item.setText(col_position, "")
-            
-            # 更新作用注释
-            if '作用注释' in visible_columns:
-                col_position = visible_columns.index('作用注释')
-                comment = self.file_tabs.get_comment(self.current_file, element)
-                item.setText(col_position, comment if comment else "")
+        # 模型重新读取已显示节点除元素列以外的各列
+        self.tree_model.refresh_columns()
     
     def refresh_tree_columns(self):
         """强制刷新树视图的列显示和布局"""
         if not self.root:
             return
             
-        # 获取当前可见列
-        visible_columns = self.get_visible_columns()
-        
-        # 重置列设置
-        self.tree_widget.setColumnCount(len(visible_columns))
-        self.tree_widget.setHeaderLabels(visible_columns)
-        
-        # 刷新所有树节点的列值
-        for element, item in self.tree_items.items():
-            # 对每个元素重新设置所有列的值
-            tag = element.tag
-            
-            # 设置功能注释（如果可见）
-            if '功能注释' in visible_columns:
-                col_position = visible_columns.index('功能注释')
-                if tag in self.global_attrs.feature_comments:
-                    item.setText(col_position, self.global_attrs.feature_comments[tag])
-                else:
-                    item.setText(col_position, "")
-            
-            # 设置作用注释（如果可见）
-            if '作用注释' in visible_columns:
-                col_position = visible_columns.index('作用注释')
-                comment = self.file_tabs.get_comment(self.current_file, element)
-                item.setText(col_position, comment if comment else "")
-            
-            # 设置Name值（如果可见）
-            if 'Name值' in visible_columns:
-                col_position = visible_columns.index('Name值')
-                if "name" in element.attrib:
-                    item.setText(col_position, element.attrib["name"])
-                else:
-                    item.setText(col_position, "")
-            
-            # 设置所有自定义列的值
-            for attr_name in self.tree_columns['custom']:
-                if attr_name in visible_columns:
-                    col_position = visible_columns.index(attr_name)
-                    
-                    # 处理可能以"值"结尾的自定义列
-                    real_attr_name = attr_name
-                    if attr_name.endswith("值"):
-                        real_attr_name = attr_name[:-1]
-                    
-                    # 特殊处理Name值，确保使用小写的name
-                    if real_attr_name.lower() == "name":
-                        real_attr_name = "name"
-                    
-                    if real_attr_name in element.attrib:
-                        item.setText(col_position, element.attrib[real_attr_name])
-                    else:
-                        item.setText(col_position, "")
+        # 重新读取已显示节点的各列
+        self.tree_model.refresh_columns()
         
         # 应用保存的列宽
         for i, width in enumerate(self.column_widths['tree']):
@@ -2273,66 +2611,42 @@ class XMLEditorWindow(QMainWindow):
         # 刷新视图
         self.tree_widget.viewport().update()
     
-    def save_tree_expand_states(self):
-        """保存树节点的展开状态"""
-        expand_states = {}
+    def update_tree_column_plan(self):
+        """按当前列配置重新生成结构树的列方案，列配置变化后调用"""
+        self.tree_column_plan = TreeColumnPlan(self.get_visible_columns(), self.tree_columns['custom'])
+        if hasattr(self, 'tree_model'):
+            self.tree_model.set_column_plan(self.tree_column_plan, self.global_attrs.feature_comments,
+                                            self.get_usage_comment)
+    
+    def get_usage_comment(self, element):
+        """当前文件中元素的作用注释"""
+        return self.file_tabs.get_comment(self.current_file, element)
+    
+    def refresh_element(self, element):
+        """元素的属性变化后，只刷新与该元素有关的界面
         
-        # 为每个元素记录其展开状态
-        for element, item in self.tree_items.items():
-            if hasattr(element, 'unique_id'):
-                try:
-                    # 使用元素ID作为键
-                    element_id = element.unique_id
-                    expand_states[element_id] = item.isExpanded()
-                except (AttributeError, TypeError):
-                    # 使用元素对象的ID作为备选键
-                    expand_states[f"id_{id(element)}"] = item.isExpanded()
-            else:
-                # 使用元素对象的ID作为备选键
-                expand_states[f"id_{id(element)}"] = item.isExpanded()
+        更新它在结构树中的行、代码视图中它的开始标签，以及正在显示它时的属性表；
+        文档索引已由撤销栈的监听器按命令中的节点更新。代价与文档大小无关。
         
-        return expand_states
-    
-    def restore_tree_expand_states(self, expand_states):
-        """恢复树节点的展开状态"""
-        for element, item in self.tree_items.items():
-            try:
-                # 尝试使用元素ID查找展开状态
-                if hasattr(element, 'unique_id'):
-                    element_id = element.unique_id
-                    if element_id in expand_states:
-                        item.setExpanded(expand_states[element_id])
-                        continue
-                
-                # 备选方案：使用元素对象的ID
-                backup_id = f"id_{id(element)}"
-                if backup_id in expand_states:
-                    item.setExpanded(expand_states[backup_id])
-            except Exception:
-                # 忽略任何错误，保持默认状态
-                pass
+        Args:
+            element: 属性发生变化的元素
+        """
+        self.tree_model.node_changed(element)
+        self.update_code_view_for_element(element)
+        if self.current_element is element:
+            self.update_attr_table(element)
     
-    def collapse_all_groups(self, parent_item):
-        """递归收起所有Group元素"""
-        for i in range(parent_item.childCount()):
-            child = parent_item.child(i)
-            # 如果是Group元素，则收起
-            if hasattr(child, 'element') and child.element.tag == "Group":
-                child.setExpanded(False)
-            # 递归处理子节点
-            self.collapse_all_groups(child)
-    
-    def on_tree_item_double_clicked(self, item, column):
+    def on_tree_item_double_clicked(self, index):
         """处理树视图项的双击事件
         
         Args:
-            item: 被双击的QTreeWidgetItem
-            column: 被双击的列索引
+            index: 被双击的单元格对应的模型索引
         """
         # 获取元素
-        element = item.element
+        element = self.tree_model.node_from_index(index)
         if element is None:
             return
+        column = index.column()
         
         # 如果是注释节点且是第一列
         if isinstance(element, etree._Comment) and column == 0:
@@ -2345,7 +2659,7 @@ class XMLEditorWindow(QMainWindow):
             editor.setText(current_value)
             
             # 获取项目的矩形区域
-            rect = self.tree_widget.visualItemRect(item)
+            rect = self.tree_widget.visualRect(index)
             rect.setLeft(self.tree_widget.columnViewportPosition(column))
             rect.setWidth(self.tree_widget.columnWidth(column))
             
@@ -2358,20 +2672,24 @@ class XMLEditorWindow(QMainWindow):
             
             # 存储原始值和相关信息
             editor.original_value = current_value
-            editor.item = item
             editor.column = column
             editor.element = element
             
-            # 连接编辑完成信号
+            # 连接编辑完成信号（按回车后失去焦点时可能再次发出，只处理一次）
+            editor.finished = False
+            
             def finish_editing():
+                if editor.finished:
+                    return
+                editor.finished = True
                 new_value = editor.text()
                 if new_value != editor.original_value:
                     # 更新注释内容
-                    element.text = new_value
-                    item.setText(column, new_value)
+                    self.undo_stack.push(SetCommentTextCommand(element, new_value))
+                    self.tree_model.node_changed(element)
                     
                     # 更新代码视图
-                    self.update_code_view()
+                    self.update_code_view_for_element(element)
                     
                     # 标记为已修改
                     self.is_modified = True
@@ -2387,7 +2705,7 @@ class XMLEditorWindow(QMainWindow):
             return
         
         # 获取列标题名称
-        column_name = self.tree_widget.headerItem().text(column)
+        column_name = self.tree_model.headerData(column, Qt.Horizontal)
         
         # 创建一个编辑器
         editor = CustomLineEdit(self.tree_widget)
@@ -2428,14 +2746,14 @@ class XMLEditorWindow(QMainWindow):
         # 如果启用了自动完成，设置自动完成器（仅对属性编辑有效）
         if is_attr_edit and self.autocomplete_enabled and hasattr(self, 'attr_completer'):
             # 更新值自动完成列表
-            self.attr_completer.update_value_completer(attr_name)
+            self.attr_completer.update_value_completer(attr_name, element)
             # 获取值自动完成器
             value_completer = self.attr_completer.get_value_completer()
             # 设置编辑器的自动完成器
             editor.setCustomCompleter(value_completer)
         
         # 获取项目的矩形区域
-        rect = self.tree_widget.visualItemRect(item)
+        rect = self.tree_widget.visualRect(index)
         rect.setLeft(self.tree_widget.columnViewportPosition(column))
         rect.setWidth(self.tree_widget.columnWidth(column))
         
@@ -2448,7 +2766,6 @@ class XMLEditorWindow(QMainWindow):
         
         # 存储原始值和相关信息，用于后续处理
         editor.original_value = current_value
-        editor.item = item
         editor.column = column
         editor.column_name = column_name
         editor.is_attr_edit = is_attr_edit
@@ -2457,21 +2774,22 @@ class XMLEditorWindow(QMainWindow):
         else:
             editor.attr_name = column_name
         
-        # 连接编辑完成信号
+        # 连接编辑完成信号（按回车后失去焦点时可能再次发出，只处理一次）
+        editor.finished = False
+        
         def finish_editing():
+            if editor.finished:
+                return
+            editor.finished = True
             new_value = editor.text()
             if new_value != editor.original_value:
                 if editor.is_attr_edit:
-                    # 属性编辑：更新元素属性
-                    if new_value:
-                        element.set(editor.attr_name, new_value)
-                    else:
-                        # 如果值为空，删除该属性
-                        if editor.attr_name in element.attrib:
-                            del element.attrib[editor.attr_name]
+                    # 属性编辑：更新元素属性，如果值为空，删除该属性；值未变化时不产生撤销步骤
+                    if element.get(editor.attr_name) != (new_value or None):
+                        self.undo_stack.push(SetAttributeCommand(element, editor.attr_name, new_value or None))
                     
-                    # 更新代码视图
-                    self.update_code_view()
+                    # 只刷新该元素的树项目（同一属性可能显示在多列中）、代码和属性表
+                    self.refresh_element(element)
                 elif editor.column_name == "功能注释":
                     # 功能注释：更新全局属性管理器
                     tag = element.tag
@@ -2479,6 +2797,9 @@ class XMLEditorWindow(QMainWindow):
                     
                     # 保存功能注释
                     self.global_attrs.save_comments()
+                    
+                    # 相同标签的节点都显示新注释
+                    self.tree_model.refresh_columns()
                 elif editor.column_name in ["使用说明", "作用注释"]:
                     # 作用注释：更新文件标签管理器
                     if self.current_file:
@@ -2486,9 +2807,7 @@ class XMLEditorWindow(QMainWindow):
                         
                         # 保存作用注释
                         self.file_tabs.save_file_comments(self.current_file)
-                
-                # 更新树项目显示
-                item.setText(column, new_value)
+                        self.tree_model.node_changed(element)
                 
                 # 标记为已修改
                 self.is_modified = True
@@ -2512,11 +2831,8 @@ class XMLEditorWindow(QMainWindow):
         # 替换为自定义的方法
         editor.keyPressEvent = handle_key_press
         
-        # 连接完成编辑的信号
+        # 连接完成编辑的信号（按回车时也会发出editingFinished）
         editor.editingFinished.connect(finish_editing)
-        
-        # 连接按下Enter键的事件
-        editor.returnPressed.connect(finish_editing)
     
     # 添加新方法用于创建新组
     def add_new_group(self):
@@ -2525,13 +2841,12 @@ class XMLEditorWindow(QMainWindow):
             return
         
         # 获取当前选中的项
-        selected_items = self.tree_widget.selectedItems()
+        selected_nodes = self.tree_widget.selected_nodes()
         parent_element = self.root
         insert_index = 0
         
-        if selected_items:
-            selected_item = selected_items[0]
-            selected_element = selected_item.element
+        if selected_nodes:
+            selected_element = selected_nodes[0]
             
             # 确定插入位置：如果选中的是根元素，插入为其子元素，否则插入为同级元素
             if selected_element == self.root:
@@ -2557,24 +2872,18 @@ class XMLEditorWindow(QMainWindow):
         
         # 插入到指定位置
         if parent_element is not None:
-            if insert_index >= len(list(parent_element)):
-                parent_element.append(new_group)
-            else:
-                parent_element.insert(insert_index, new_group)
+            self.undo_stack.push(InsertNodeCommand(parent_element, insert_index, new_group))
             
-            # 更新UI
-            self.update_tree_widget(save_expand_state=True)
+            # 更新UI（只插入新组对应的树项目）
+            self.update_tree_items([parent_element])
             self.update_code_view()
             
             # 选中新创建的组
-            for element, item in self.tree_items.items():
-                if element == new_group:
-                    self.tree_widget.setCurrentItem(item)
-                    self.tree_widget.scrollToItem(item)
-                    
-                    # 允许用户直接编辑新组的名称
-                    self.start_rename_element(item)
-                    break
+            self.tree_widget.expand_to_node(new_group)
+            self.tree_widget.select_node(new_group)
+            
+            # 允许用户直接编辑新组的名称
+            self.start_rename_element(new_group)
     
     # 添加新方法用于创建新元素
     def add_new_element(self):
@@ -2599,13 +2908,12 @@ class XMLEditorWindow(QMainWindow):
             return
         
         # 获取当前选中的项
-        selected_items = self.tree_widget.selectedItems()
+        selected_nodes = self.tree_widget.selected_nodes()
         parent_element = self.root
         insert_index = 0
         
-        if selected_items:
-            selected_item = selected_items[0]
-            selected_element = selected_item.element
+        if selected_nodes:
+            selected_element = selected_nodes[0]
             
             # 确定插入位置：如果选中的是根元素，插入为其子元素，否则插入为同级元素
             if selected_element == self.root:
@@ -2631,154 +2939,67 @@ class XMLEditorWindow(QMainWindow):
         
         # 插入到指定位置
         if parent_element is not None:
-            if insert_index >= len(list(parent_element)):
-                parent_element.append(new_element)
-            else:
-                parent_element.insert(insert_index, new_element)
+            self.undo_stack.push(InsertNodeCommand(parent_element, insert_index, new_element))
             
-            # 更新UI
-            self.update_tree_widget(save_expand_state=True)
+            # 更新UI（只插入新元素对应的树项目）
+            self.update_tree_items([parent_element])
             self.update_code_view()
             
             # 选中新创建的元素
-            for element, item in self.tree_items.items():
-                if element == new_element:
-                    self.tree_widget.setCurrentItem(item)
-                    self.tree_widget.scrollToItem(item)
-                    
-                    # 直接显示属性表以便于添加属性
-                    self.on_tree_item_clicked(item)
-                    break
+            self.tree_widget.expand_to_node(new_element)
+            self.tree_widget.select_node(new_element)
+            
+            # 直接显示属性表以便于添加属性
+            self.on_tree_item_clicked(self.tree_model.index_for_node(new_element))
     
-    def start_rename_element(self, item):
-        """启动元素重命名操作"""
-        if not item:
+    def start_rename_element(self, element):
+        """启动元素重命名操作，编辑完成后模型发出tagEdited，由on_tree_item_renamed处理"""
+        if element is None or isinstance(element, etree._Comment):
             return
-            
-        # 断开任何现有的重命名处理程序连接
-        self.disconnect_rename_handler()
         
-        # 使项目可编辑
-        item.setFlags(item.flags() | Qt.ItemIsEditable)
-        
-        # 开始编辑
-        self.tree_widget.editItem(item, 0)
-        
-        # 连接编辑完成事件
-        self.tree_widget.itemChanged.connect(self.on_tree_item_renamed)
+        index = self.tree_model.index_for_node(element)
+        if index.isValid():
+            # 开始编辑元素列
+            self.tree_widget.edit(index)
     
-    def on_tree_item_renamed(self, item, column):
-        """处理树项目重命名事件"""
-        if not item or column != 0:
-            return
-            
-        # 获取新的标签名
-        new_tag = item.text(0)
+    def on_tree_item_renamed(self, element, new_tag):
+        """处理元素列中编辑完成的标签名
         
+        Args:
+            element: 被重命名的元素
+            new_tag: 输入的标签名
+        """
         # 验证新标签名是否合法
         try:
             # 先尝试创建一个临时元素验证名称合法性
             test_element = etree.Element(new_tag)
         except ValueError as e:
             QMessageBox.warning(self, '错误', f'无效的元素名称: {e}')
-            # 还原标签名
-            if hasattr(item, 'element'):
-                item.setText(0, item.element.tag)
-            # 断开信号连接
-            self.disconnect_rename_handler()
             return
         
-        # 检查元素是否存在
-        if hasattr(item, 'element'):
-            element = item.element
-            old_tag = element.tag
+        old_tag = element.tag
+        try:
+            if element.getparent() is None:
+                # 如果是根元素，不允许重命名
+                QMessageBox.warning(self, '错误', '不能重命名根元素')
+                return
             
-            try:
-                # 保存XML树的原始字符串表示，以便出错时恢复
-                original_xml = etree.tostring(self.tree, pretty_print=True, encoding='utf-8').decode('utf-8')
-                
-                # 保存父元素和位置
-                parent = element.getparent()
-                if parent is None:
-                    # 如果是根元素，不允许重命名
-                    QMessageBox.warning(self, '错误', '不能重命名根元素')
-                    item.setText(0, old_tag)
-                    self.disconnect_rename_handler()
-                    return
-                
-                index = parent.index(element)
-                
-                # 创建具有相同属性和子元素的新元素
-                new_element = etree.Element(new_tag)
-                
-                # 复制所有属性
-                for key, value in element.attrib.items():
-                    new_element.set(key, value)
-                
-                # 保存子元素的引用
-                children = list(element)
-                
-                # 复制所有子元素到新元素
-                for child in children:
-                    element.remove(child)
-                    new_element.append(child)
-                
-                # 如果原元素有文本，也复制过来
-                if element.text:
-                    new_element.text = element.text
-                
-                # 如果原元素有尾部文本，也复制过来
-                if element.tail:
-                    new_element.tail = element.tail
-                
-                # 从父元素中移除原元素
-                parent.remove(element)
-                
-                # 在相同位置插入新元素
-                parent.insert(index, new_element)
-                
-                # 确保空元素使用<Tag></Tag>格式
-                if len(new_element) == 0 and not new_element.text:
-                    new_element.text = ""
-                
-                # 更新UI
-                self.update_tree_widget(save_expand_state=True)
-                self.update_code_view()
-                
-                # 选中重命名后的元素
-                for e, i in self.tree_items.items():
-                    if e == new_element:
-                        self.tree_widget.setCurrentItem(i)
-                        break
+            if new_tag != old_tag:
+                # 直接修改标签名，元素的属性、子元素和注释映射保持不变
+                self.undo_stack.push(RenameElementCommand(element, new_tag))
             
-            except Exception as e:
-                # 出错时恢复原始XML
-                try:
-                    parser = etree.XMLParser(remove_blank_text=False, 
-                                          remove_comments=False,
-                                          remove_pis=False,
-                                          strip_cdata=False)
-                    self.tree = etree.parse(io.StringIO(original_xml), parser)
-                    self.root = self.tree.getroot()
-                    self.update_tree_widget(save_expand_state=True)
-                    self.update_code_view()
-                except Exception as restore_err:
-                    print(f"恢复原始XML失败: {restore_err}")
-                
-                QMessageBox.critical(self, '错误', f'重命名元素时出错: {str(e)}')
-                item.setText(0, old_tag)
+            # 更新UI：结构树中该行的文本和代码视图
+            self.tree_model.node_changed(element)
+            self.update_code_view()
+            
+            # 选中重命名后的元素
+            self.tree_widget.select_node(element)
         
-        # 断开信号连接，避免重复处理
-        self.disconnect_rename_handler()
-    
-    def disconnect_rename_handler(self):
-        """安全断开重命名处理程序的信号连接"""
-        try:
-            # 尝试断开信号连接
-            self.tree_widget.itemChanged.disconnect(self.on_tree_item_renamed)
-        except (TypeError, RuntimeError):
-            # 忽略信号未连接或其他断开错误
-            pass
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'重命名元素时出错: {str(e)}')
+            print(f"重命名元素时出错: {e}")
+            import traceback
+            traceback.print_exc()
     
     def load_column_widths(self):
         """从文件加载列宽设置"""
@@ -2806,8 +3027,7 @@ class XMLEditorWindow(QMainWindow):
                     self.column_widths['attr'].append(self.attr_table.horizontalHeader().sectionSize(i))
             
             # 保存到文件
-            with open('column_widths.json', 'w', encoding='utf-8') as f:
-                json.dump(self.column_widths, f, ensure_ascii=False, indent=2)
+            write_json('column_widths.json', self.column_widths, self.sidecar_writer)
         except Exception as e:
             print(f"保存列宽设置失败: {e}")
     
@@ -2839,14 +3059,14 @@ class XMLEditorWindow(QMainWindow):
             # 保存树视图列宽度
             if hasattr(self, 'tree_widget'):
                 column_widths = []
-                for i in range(self.tree_widget.columnCount()):
+                for i in range(self.tree_widget.header().count()):
                     column_widths.append(self.tree_widget.columnWidth(i))
                 settings['tree_column_widths'] = column_widths
             
             # 保存属性表列宽度
             if hasattr(self, 'attr_table'):
                 attr_column_widths = []
-                for i in range(self.attr_table.columnCount()):
+                for i in range(self.attr_model.columnCount()):
                     attr_column_widths.append(self.attr_table.columnWidth(i))
                 settings['attr_column_widths'] = attr_column_widths
             
@@ -2893,14 +3113,14 @@ class XMLEditorWindow(QMainWindow):
             if 'tree_column_widths' in settings and hasattr(self, 'tree_widget'):
                 widths = settings['tree_column_widths']
                 for i, width in enumerate(widths):
-                    if i < self.tree_widget.columnCount():
+                    if i < self.tree_widget.header().count():
                         self.tree_widget.setColumnWidth(i, width)
                         
             # 恢复属性表列宽度
             if 'attr_column_widths' in settings and hasattr(self, 'attr_table'):
                 widths = settings['attr_column_widths']
                 for i, width in enumerate(widths):
-                    if i < self.attr_table.columnCount():
+                    if i < self.attr_model.columnCount():
                         self.attr_table.setColumnWidth(i, width)
                         
             print("布局设置已加载")
@@ -2913,6 +3133,9 @@ class XMLEditorWindow(QMainWindow):
         """
         try:
             self.save_layout_settings()
+            self.validation_thread.stop()
+            # 等待附属文件全部写入
+            self.sidecar_writer.stop()
             
             # 执行原有的关闭操作
             super(XMLEditorWindow, self).closeEvent(event)
@@ -2994,17 +3217,22 @@ class XMLEditorWindow(QMainWindow):
             # 保存配置到文件
             self.save_tree_columns()
             
-            # 更新树视图
-            visible_columns = self.get_visible_columns()
-            self.tree_widget.setColumnCount(len(visible_columns))
-            self.tree_widget.setHeaderLabels(visible_columns)
+            # 列配置变化后重新生成列方案
+            self.update_tree_column_plan()
             
             # 使用新的刷新方法来更新列显示，而不是重新加载整个树
             if hasattr(self, 'root') and self.root is not None:
                 self.refresh_tree_columns()
     
+    def schedule_attribute_search(self):
+        """属性搜索框内容变化时重新计时，停止输入后再搜索"""
+        self.attr_search_timer.start(self.text_search_delay)
+    
     def search_by_attribute(self):
         """根据属性名和值搜索元素"""
+        # 立即搜索时（回车或点击搜索按钮）取消尚未执行的延迟搜索
+        self.attr_search_timer.stop()
+        
         attr_name = self.attr_name_input.text().strip()
         attr_value = self.attr_value_input.text().strip()
         
@@ -3014,153 +3242,54 @@ class XMLEditorWindow(QMainWindow):
             
         found_elements = []
         if self.root is not None:
-            self.find_elements_by_attribute(self.root, attr_name, attr_value, found_elements)
+            found_elements = self.document_index.find_by_attribute(attr_name, attr_value)
         
         self.highlight_search_results(found_elements)
     
-    def find_elements_by_attribute(self, element, attr_name, attr_value=None, found_elements=None):
-        """递归查找具有指定属性的元素"""
-        if found_elements is None:
-            found_elements = []
-        
-        # 检查当前元素的属性
-        if attr_name:
-            if attr_name in element.attrib:
-                if not attr_value or attr_value.lower() in element.attrib[attr_name].lower():
-                    found_elements.append(element)
-        elif attr_value:
-            # 如果只指定了属性值，检查所有属性
-            for value in element.attrib.values():
-                if attr_value.lower() in value.lower():
-                    found_elements.append(element)
-                    break
-        
-        # 递归检查子元素
-        for child in element:
-            self.find_elements_by_attribute(child, attr_name, attr_value, found_elements)
-        
-        return found_elements
-    
     def highlight_search_results(self, elements):
         """
         高亮显示搜索结果
         
+        模型只通知高亮状态发生变化且已显示的行，其余结果在显示到时才读取高亮状态。
+        结果不超过search_expand_limit个时展开所有结果的祖先，否则只展开第一个结果的祖先，
+        以免为大量结果读取整棵树。
+        
         Args:
             elements: 要高亮的元素列表
         """
-        if not hasattr(self, 'tree_items'):
-            return
-            
-        # 清除所有现有高亮
-        self.clear_all_highlighting()
-            
-        # 保存搜索结果
-        self.search_result_elements = []
-        valid_items = []
-        
-        if elements:  # 只在有搜索结果时进行高亮
-            # 标记匹配项并展开其父节点
-            for element in elements:
-                # 跳过无效元素
-                if element not in self.tree_items:
-                    continue
-                    
-                tree_item = self.tree_items.get(element)
-                if tree_item:
-                    # 添加到有效结果列表
-                    self.search_result_elements.append(element)
-                    valid_items.append(tree_item)
-                    
-                    # 设置背景色以高亮显示
-                    tree_item.setBackground(0, QColor(255, 255, 0, 100))  # 浅黄色背景
-                    
-                    # 确保项目可见（展开所有父节点）
-                    self.ensure_item_visible(tree_item)
-            
-            # 如果有结果，选中第一个
-            if valid_items:
-                first_item = valid_items[0]
-                self.tree_widget.setCurrentItem(first_item)
-                self.tree_widget.scrollToItem(first_item)
+        # 清除代码视图中的高亮
+        self.set_code_highlights([])
+        
+        # 保存搜索结果（按结果顺序的{元素: None}）
+        new_elements = dict.fromkeys(elements)
+        self.search_result_elements = new_elements
+        self.tree_model.set_highlighted(new_elements)
+        
+        if len(new_elements) <= self.search_expand_limit:
+            for element in new_elements:
+                self.tree_widget.expand_to_node(element)
+        
+        # 选中第一个结果
+        for element in new_elements:
+            if self.tree_model.index_for_node(element).isValid():
+                self.tree_widget.expand_to_node(element)
+                self.tree_widget.select_node(element)
+                break
     
     def clear_all_highlighting(self):
         """清除所有高亮显示"""
         # 清除代码视图中的高亮
-        self.code_edit.setExtraSelections([])  # 使用空列表清除所有高亮
+        self.set_code_highlights([])  # 使用空列表清除所有高亮
         
         # 清除树视图中的高亮
-        root = self.tree_widget.invisibleRootItem()
-        self._clear_item_highlighting(root)
-    
-    def _clear_item_highlighting(self, item):
-        """递归清除树项目的高亮"""
-        # 清除当前项目的背景色
-        item.setBackground(0, QColor(Qt.transparent))
-        
-        # 递归处理子项目
-        for i in range(item.childCount()):
-            self._clear_item_highlighting(item.child(i))
-    
-    def find_tree_item_by_element(self, target_element):
-        """
-        根据元素查找对应的树项目
-        
-        Args:
-            target_element: 目标元素
-            
-        Returns:
-            找到的树项目，如果未找到则返回None
-        """
-        # 从根节点开始遍历
-        for i in range(self.tree_widget.topLevelItemCount()):
-            item = self.tree_widget.topLevelItem(i)
-            found_item = self._find_item_recursive(item, target_element)
-            if found_item:
-                return found_item
-        
-        return None
-    
-    def _find_item_recursive(self, item, target_element):
-        """
-        递归查找元素对应的树项目
-        
-        Args:
-            item: 当前树项目
-            target_element: 目标元素
-            
-        Returns:
-            找到的树项目，如果未找到则返回None
-        """
-        # 检查当前项目是否对应目标元素
-        if hasattr(item, 'element') and item.element is target_element:
-            return item
-        
-        # 递归检查所有子项目
-        for i in range(item.childCount()):
-            child_item = item.child(i)
-            found = self._find_item_recursive(child_item, target_element)
-            if found:
-                return found
-        
-        return None
-    
-    def ensure_item_visible(self, item):
-        """
-        确保树项目可见（展开所有父节点）
-        
-        Args:
-            item: 要显示的树项目
-        """
-        # 展开所有父节点
-        parent = item.parent()
-        while parent:
-            parent.setExpanded(True)
-            parent = parent.parent()
+        self.search_result_elements = {}
+        self.tree_model.set_highlighted(())
     
     def clear_attribute_search(self):
         """清除属性搜索"""
         self.attr_name_input.clear()
         self.attr_value_input.clear()
+        self.highlight_search_results([])
         self.clear_search_highlighting()
     
     def toggle_autocomplete(self):
@@ -3204,12 +3333,9 @@ class XMLEditorWindow(QMainWindow):
         从当前XML更新自动补全数据
         """
         if hasattr(self, 'root') and self.root is not None:
-            # 提取属性值数据
-            self.attr_completer.extract_attribute_values(self.root)
-            
-            # 更新属性名补全器模型以反映最新的属性列表
-            attr_list = self.attr_completer.get_attribute_list()
-            self.attr_completer.attr_completer.setModel(QStringListModel(attr_list))
+            # 属性值数据来自随编辑更新的文档索引，不需要重新遍历文档；
+            # 属性名补全器的模型在自定义属性变化时已经更新
+            self.attr_completer.set_document_index(self.document_index)
 
     def on_attr_table_cell_activated(self, row, column):
         """
@@ -3232,33 +3358,23 @@ class XMLEditorWindow(QMainWindow):
                 return
                 
             # 确保行列索引有效
-            if row < 0 or column < 0 or row >= self.attr_table.rowCount() or column >= self.attr_table.columnCount():
-                print(f"行列索引越界: row={row}, column={column}, rowCount={self.attr_table.rowCount()}, columnCount={self.attr_table.columnCount()}")
+            row_count = self.attr_model.rowCount()
+            column_count = self.attr_model.columnCount()
+            if row < 0 or column < 0 or row >= row_count or column >= column_count:
+                print(f"行列索引越界: row={row}, column={column}, rowCount={row_count}, columnCount={column_count}")
                 return
             
-            # 确保最新的XML数据被提取到补全器中
-            if hasattr(self, 'root') and self.root is not None:
-                try:
-                    self.update_completers_from_xml()
-                except Exception as e:
-                    print(f"更新补全数据时发生错误: {e}")
-            
             # 如果是属性值列，并且已经有属性名
-            if column == 1 and row < self.attr_table.rowCount():
+            if column == 1:
                 try:
-                    attr_name_item = self.attr_table.item(row, 0)
-                    if attr_name_item and attr_name_item.text():
-                        attr_name = attr_name_item.text()
+                    attr_name = self.attr_model.text(row, 0)
+                    if attr_name:
                         print(f"正在为属性 '{attr_name}' 设置补全")
                         
-                        # 更新属性值补全器，使用当前编辑的属性名
-                        self.attr_completer.update_value_completer(attr_name)
-                        
-                        # 重新设置补全器到编辑器
-                        try:
-                            self.setup_attr_table_completer()
-                        except Exception as e:
-                            print(f"设置属性表补全器时发生错误: {e}")
+                        # 更新属性值补全器，使用当前编辑的属性名；
+                        # 编辑代理持有同一个补全器，不需要重新创建
+                        element = self.current_element
+                        self.attr_completer.update_value_completer(attr_name, element)
                 except Exception as e:
                     print(f"处理属性名时发生错误: {e}")
         except Exception as e:
@@ -3266,27 +3382,44 @@ class XMLEditorWindow(QMainWindow):
 
     def toggle_comments(self):
         """切换注释显示状态"""
-        self.tree_widget.show_comments = self.show_comments_action.isChecked()
-        self.update_tree_widget(save_expand_state=True)
+        # 模型逐个插入或删除已显示的注释行，其余行的展开和选中状态不变
+        self.tree_model.set_show_comments(self.show_comments_action.isChecked())
 
     def on_file_changed(self, path):
-        """处理文件变更事件"""
-        # 检查文件是否存在（可能被删除）
-        if not os.path.exists(path):
+        """处理文件变更事件
+        
+        原子替换文件（本程序和很多编辑器的保存方式）后监视会失效，需要重新添加路径。
+        变化通知延迟file_change_delay毫秒处理，期间的多次通知只处理一次。
+        """
+        if path != self.current_file:
             return
-            
-        # 获取文件的最后修改时间
-        current_time = os.path.getmtime(path)
+        if os.path.exists(path) and path not in self.file_watcher.files():
+            self.file_watcher.addPath(path)
+        self.file_change_timer.start(self.file_change_delay)
+    
+    def reload_changed_file(self):
+        """文件被修改后重新加载
         
-        # 防止重复触发
-        if current_time == self.last_modified_time:
+        内容与上次加载或保存时相同（例如本程序自己保存）时不做任何处理。
+        否则比较新旧文档，只替换发生变化的子树并同步结构树中对应的部分；
+        根元素本身或根元素之外的内容变化时才替换整个文档。
+        其他程序的修改不记录到撤销栈（撤销不应还原别人的修改），之前的编辑历史被清空。
+        """
+        path = self.current_file
+        if not path or self.outline is not None or not os.path.exists(path):
             return
-            
-        self.last_modified_time = current_time
+        if path not in self.file_watcher.files():
+            # 文件被删除后重新创建
+            self.file_watcher.addPath(path)
         
         try:
-            # 创建状态管理器并保存当前状态
-            tree_state = TreeStateManager(self.tree_widget).save_state()
+            with open(path, 'rb') as f:
+                data = f.read()
+            
+            # 与加载和保存时一致，直接对原始字节统一换行符后比较内容，不依赖文件编码
+            content_hash = content_digest(data)
+            if content_hash == self.file_content_hash:
+                return
             
             # 重新加载XML文件
             parser = etree.XMLParser(remove_blank_text=False, 
@@ -3294,18 +3427,28 @@ class XMLEditorWindow(QMainWindow):
                                    remove_pis=False,
                                    strip_cdata=False)
             
-            self.tree = etree.parse(path, parser)
-            self.root = self.tree.getroot()
-            
-            # 更新UI，不保存展开状态
-            self.update_tree_widget(save_expand_state=False)
-            self.update_code_view()
+            new_tree = etree.fromstring(data, parser).getroottree()
+            self.file_content_hash = content_hash
             
-            # 使用延迟调用恢复状态
-            QTimer.singleShot(100, lambda: tree_state.restore_state())
+            pairs = changed_subtrees(self.tree, new_tree) if self.tree is not None else None
+            if pairs is None:
+                # 在批量编辑中替换文档并重建界面，结束时一次性恢复展开状态
+                with self.batch_edit():
+                    self.undo_stack.apply(ReplaceDocumentCommand(self, new_tree, len(data)))
+                    self.update_tree_widget(save_expand_state=False)
+                    self.update_code_view()
+            elif pairs:
+                command = MacroCommand('重新加载文件', [ReplaceNodeCommand(old, new) for old, new in pairs])
+                self.push_replace_command(command, record=False)
+                self.update_code_view_for_subtrees(command.replacements)
+            else:
+                # 文档内容相同（例如只有格式变化），之前的编辑历史仍然有效
+                self.statusBar().showMessage('文件已更新', 3000)
+                return
             
-            # 显示提示消息
-            self.statusBar().showMessage('文件已更新', 3000)
+            # 文档与磁盘上的文件一致，之前的编辑历史已清空
+            self.is_modified = False
+            self.statusBar().showMessage('文件已被其他程序修改并重新加载，撤销记录已清空', 3000)
             
         except Exception as e:
             QMessageBox.warning(self, '警告', f'重新加载文件失败: {str(e)}')
@@ -3318,106 +3461,251 @@ class XMLEditorWindow(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, '打开XML文件', '', 'XML文件 (*.xml);;所有文件 (*)')
         
         if file_path:
-            try:
-                # 如果之前有监视的文件，先移除
-                if self.current_file and self.current_file in self.file_watcher.files():
-                    self.file_watcher.removePath(self.current_file)
-                
-                # 清除当前的搜索高亮等状态
-                if hasattr(self, 'search_result_elements'):
-                    self.clear_search_highlighting()
-                
-                # 创建保留空白和注释的解析器
-                parser = etree.XMLParser(remove_blank_text=False, 
-                                      remove_comments=False,
-                                      remove_pis=False,
-                                      strip_cdata=False)
-                
-                # 解析XML文件
-                self.tree = etree.parse(file_path, parser)
-                self.root = self.tree.getroot()
-                
-                # 保存原始文件内容以备后续比对
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    self.original_content = f.read()
-                
-                # 保存当前文件路径
-                self.current_file = file_path
-                
-                # 添加文件到监视器
-                self.file_watcher.addPath(file_path)
-                self.last_modified_time = os.path.getmtime(file_path)
-                
-                # 加载文件关联的注释
-                self.file_tabs.load_file_comments(file_path)
-                
-                # 更新UI，不保存展开状态
-                self.update_tree_widget(save_expand_state=False)
-                self.update_code_view()
-                
-                # 更新自动补全数据
-                if self.autocomplete_enabled:
-                    self.update_completers_from_xml()
-                
-                self.statusBar().showMessage(f'已加载文件: {file_path}')
-            except Exception as e:
-                error_msg = f'无法解析XML文件: {str(e)}'
-                print(error_msg)
-                import traceback
-                traceback.print_exc()  # 输出详细错误信息
-                QMessageBox.critical(self, '错误', error_msg)
-
-    def save_undo_state(self):
-        """保存当前状态到撤销栈"""
-        if not self.tree:
+            self.load_file(file_path)
+    
+    def load_file(self, file_path):
+        """在后台线程中加载XML文件，加载完成后再更新界面
+        
+        Args:
+            file_path: 要加载的文件路径
+        """
+        if self.load_thread is not None:
+            self.statusBar().showMessage('正在加载其他文件，请稍候', 2000)
             return
-            
+        
+        self.statusBar().showMessage(f'正在加载: {file_path}')
+        self.load_thread = XMLLoadThread(file_path, self)
+        self.load_thread.progress.connect(self.on_load_progress)
+        self.load_thread.loaded.connect(self.on_file_loaded)
+        self.load_thread.failed.connect(self.on_load_failed)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        self.load_thread.start()
+    
+    def on_load_progress(self, percent, stage):
+        """在状态栏显示加载进度"""
+        if self.load_thread is not None:
+            file_name = os.path.basename(self.load_thread.file_path)
+            self.statusBar().showMessage(f'正在加载 {file_name}: {stage} {percent}%')
+    
+    def on_load_thread_finished(self):
+        """加载线程结束后释放线程对象"""
+        if self.load_thread is not None:
+            self.load_thread.deleteLater()
+            self.load_thread = None
+    
+    def on_load_failed(self, file_path, message):
+        """后台加载失败时提示用户"""
+        error_msg = f'无法解析XML文件: {message}'
+        print(error_msg)
+        self.statusBar().showMessage(error_msg, 3000)
+        QMessageBox.critical(self, '错误', error_msg)
+    
+    def on_file_loaded(self, result):
+        """后台加载完成，用加载结果填充界面
+        
+        Args:
+            result: XMLLoadResult，包含解析好的树和属性索引
+        """
+        file_path = result.file_path
         try:
-            # 将当前XML转换为字符串，但不包含XML声明
-            xml_str = etree.tostring(self.root, 
-                                   encoding='utf-8',
-                                   xml_declaration=False,
-                                   pretty_print=True,
-                                   with_tail=True).decode('utf-8')
-            
-            # 将状态添加到撤销栈
-            self.undo_stack.append(xml_str)
-            
-            # 如果撤销栈太大，移除最早的状态
-            if len(self.undo_stack) > self.max_undo_steps:
-                self.undo_stack.pop(0)
-                
+            # 退出大文件模式
+            self.set_outline(None)
+            
+            # 如果之前有监视的文件，先移除
+            if self.current_file and self.current_file in self.file_watcher.files():
+                self.file_watcher.removePath(self.current_file)
+            
+            # 清除当前的搜索高亮等状态
+            if hasattr(self, 'search_result_elements'):
+                self.clear_search_highlighting()
+            
+            # 使用后台解析好的树
+            self.tree = result.tree
+            self.root = self.tree.getroot()
+            
+            # 新文件的编辑历史从头开始
+            self.undo_stack.clear()
+            self.document_index = result.document_index
+            
+            # 保存原始文件内容以备后续比对
+            self.original_content = result.original_content
+            
+            # 保存当前文件路径
+            self.current_file = file_path
+            
+            # 添加文件到监视器
+            self.file_watcher.addPath(file_path)
+            self.file_content_hash = result.content_hash
+            
+            # 为元素分配稳定ID，然后加载文件关联的注释
+            self.file_tabs.bind_document(self.root)
+            self.file_tabs.load_file_comments(file_path)
+            
+            # 更新UI，不保存展开状态
+            self.update_tree_widget(save_expand_state=False)
+            self.update_code_view()
+            
+            # 更新自动补全数据（文档索引已在后台建立）
+            if self.autocomplete_enabled:
+                self.attr_completer.set_document_index(self.document_index)
+            
+            self.statusBar().showMessage(f'已加载文件: {file_path}')
         except Exception as e:
-            print(f"保存撤销状态失败: {e}")
+            error_msg = f'无法加载XML文件: {str(e)}'
+            print(error_msg)
+            import traceback
+            traceback.print_exc()  # 输出详细错误信息
+            QMessageBox.critical(self, '错误', error_msg)
 
+    def openLargeFile(self):
+        """以只读大纲模式打开超大XML文件"""
+        file_path, _ = QFileDialog.getOpenFileName(self, '以大文件模式打开XML文件', '', 'XML文件 (*.xml);;所有文件 (*)')
+        
+        if file_path:
+            self.load_outline(file_path)
+    
+    def load_outline(self, file_path):
+        """在后台线程中为超大文件建立只读大纲
+        
+        文件以内存映射方式读取，不保存原始内容，也不建立完整的元素树，
+        内存占用只与节点数量有关。
+        
+        Args:
+            file_path: 要打开的文件路径
+        """
+        if self.load_thread is not None:
+            self.statusBar().showMessage('正在加载其他文件，请稍候', 2000)
+            return
+        
+        self.statusBar().showMessage(f'正在建立大纲: {file_path}')
+        self.load_thread = XMLOutlineThread(file_path, self)
+        self.load_thread.progress.connect(self.on_load_progress)
+        self.load_thread.loaded.connect(self.on_outline_loaded)
+        self.load_thread.failed.connect(self.on_load_failed)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        self.load_thread.start()
+    
+    def on_outline_loaded(self, outline):
+        """大纲建立完成，关闭当前文档并显示大纲
+        
+        Args:
+            outline: XMLOutline
+        """
+        try:
+            # 如果之前有监视的文件，先移除
+            if self.current_file and self.current_file in self.file_watcher.files():
+                self.file_watcher.removePath(self.current_file)
+            
+            # 清除当前的搜索高亮等状态
+            if hasattr(self, 'search_result_elements'):
+                self.clear_search_highlighting()
+            
+            # 大文件模式下没有可编辑的文档
+            self.tree = None
+            self.root = None
+            self.current_file = None
+            self.current_element = None
+            self.original_content = None
+            self.source_map = None
+            self.undo_stack.clear()
+            self.document_index.rebuild(None)
+            self.file_tabs.bind_document(None)
+            self.update_tree_widget()
+            
+            self.updating_code_view = True
+            try:
+                self.code_edit.clear()
+            finally:
+                self.updating_code_view = False
+            self.code_has_changes = False
+            self.attr_model.clear()
+            
+            self.set_outline(outline)
+            self.statusBar().showMessage(
+                f'已以只读大纲模式打开: {outline.file_path}（{len(outline)}个节点，双击节点查看内容）')
+        except Exception as e:
+            outline.close()
+            error_msg = f'无法显示大纲: {str(e)}'
+            print(error_msg)
+            import traceback
+            traceback.print_exc()
+            QMessageBox.critical(self, '错误', error_msg)
+    
+    def set_outline(self, outline):
+        """进入或退出大文件模式
+        
+        Args:
+            outline: 要显示的XMLOutline，为None时退出大文件模式，恢复普通结构树
+        """
+        if self.outline is not None:
+            self.outline_view.setModel(None)
+            self.outline.close()
+        self.outline = outline
+        
+        if outline is None:
+            self.outline_view.setVisible(False)
+            self.tree_widget.setVisible(True)
+            self.code_edit.setReadOnly(False)
+            return
+        
+        self.outline_view.setModel(XmlOutlineModel(outline, self.outline_view))
+        self.outline_view.expand(self.outline_view.model().index(0, 0))
+        self.tree_widget.setVisible(False)
+        self.outline_view.setVisible(True)
+        self.code_edit.setReadOnly(True)
+    
+    def open_outline_node(self, index):
+        """解析大纲中的节点，在代码视图和属性表中只读显示
+        
+        节点超过outline_preview_limit时只解析并显示它的开始标签。
+        
+        Args:
+            index: 大纲视图中被打开节点的索引
+        """
+        node = self.outline_view.model().node_from_index(index)
+        if node is None:
+            return
+        
+        outline = self.outline
+        size = outline.ends[node] - outline.starts[node]
+        try:
+            if size > self.outline_preview_limit:
+                element = outline.start_tag(node)
+                text = etree.tostring(element, encoding='unicode')
+                message = f'节点过大（{size}字节），只显示开始标签'
+            else:
+                element = outline.materialize(node)
+                text = outline.source_text(node)
+                message = f'字节 {outline.starts[node]} - {outline.ends[node]}'
+        except etree.XMLSyntaxError as e:
+            QMessageBox.warning(self, '警告', f'无法单独解析该节点: {str(e)}')
+            return
+        
+        self.updating_code_view = True
+        try:
+            self.code_edit.setPlainText(text)
+        finally:
+            self.updating_code_view = False
+        self.code_has_changes = False
+        
+        # 只读显示属性（注释节点没有属性）
+        self.attr_model.set_element(element, editable=False)
+        self.image_preview.setVisible(False)
+        
+        self.statusBar().showMessage(message)
+    
     def undo_last_action(self):
         """撤销上一次操作"""
-        if not self.undo_stack:
+        if not self.undo_stack.can_undo():
             self.statusBar().showMessage('没有可撤销的操作', 2000)
             return
             
         try:
-            # 获取上一个状态
-            previous_state = self.undo_stack.pop()
-            
-            # 添加XML声明
-            xml_content = f'<?xml version="1.0" encoding="utf-8"?>\n{previous_state}'
-            
-            # 创建解析器
-            parser = etree.XMLParser(remove_blank_text=False,
-                                   remove_comments=False,
-                                   remove_pis=False,
-                                   strip_cdata=False)
-            
-            # 解析上一个状态
-            self.tree = etree.parse(io.BytesIO(xml_content.encode('utf-8')), parser)
-            self.root = self.tree.getroot()
-            
-            # 更新UI
-            self.update_tree_widget(save_expand_state=True)
-            self.update_code_view()
-            
-            self.statusBar().showMessage('已撤销上一次操作', 2000)
+            with self.batch_edit():
+                command = self.undo_stack.undo()
+                self.refresh_after_command(command)
+            self.is_modified = True
+            self.statusBar().showMessage(f'已撤销: {command.text}', 2000)
             
         except Exception as e:
             QMessageBox.critical(self, '错误', f'撤销操作失败: {str(e)}')
@@ -3425,92 +3713,130 @@ class XMLEditorWindow(QMainWindow):
             import traceback
             traceback.print_exc()
 
+    def redo_last_action(self):
+        """重做上一次撤销的操作"""
+        if not self.undo_stack.can_redo():
+            self.statusBar().showMessage('没有可重做的操作', 2000)
+            return
+        
+        try:
+            with self.batch_edit():
+                command = self.undo_stack.redo()
+                self.refresh_after_command(command)
+            self.is_modified = True
+            self.statusBar().showMessage(f'已重做: {command.text}', 2000)
+        
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'重做操作失败: {str(e)}')
+            print(f"重做操作失败: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    def refresh_after_command(self, command):
+        """撤销或重做命令后，只刷新命令影响到的部分界面
+        
+        Args:
+            command: 被撤销或重做的命令
+        """
+        if command.document_replaced:
+            self.update_tree_widget(save_expand_state=True)
+            self.update_code_view()
+            return
+        
+        # 子节点变化的父元素只同步其子项目
+        if command.parents:
+            self.update_tree_items(command.parents)
+        
+        if command.code_patchable:
+            for node in command.nodes:
+                self.update_code_view_for_element(node)
+        else:
+            # 子节点变化的父元素和标签名可能变化的元素整体替换子树的文本，注释只替换自身
+            elements = list(command.parents)
+            comments = []
+            for node in command.nodes:
+                (elements if isinstance(node.tag, str) else comments).append(node)
+            if elements:
+                self.update_code_view_for_elements(elements)
+            for comment in comments:
+                self.update_code_view_for_element(comment)
+        
+        if command.nodes:
+            # 只通知视图重新读取属性、标签或注释文本变化的节点所在的行
+            for node in command.nodes:
+                self.tree_model.node_changed(node)
+            if self.current_element is not None and self.current_element in command.nodes:
+                self.update_attr_table(self.current_element)
+    
+    def update_document_index(self, command):
+        """命令执行、撤销或重做后增量更新文档索引
+        
+        Args:
+            command: 刚刚执行、撤销或重做的命令
+        """
+        if command.document_replaced:
+            self.document_index.rebuild(self.root)
+            return
+        
+        # 插入或删除的子树按其当前是否在文档中决定加入还是移出索引
+        for node in command.subtrees:
+            top = node
+            while top.getparent() is not None:
+                top = top.getparent()
+            if top is self.root:
+                self.document_index.add_subtree(node)
+            else:
+                self.document_index.remove_subtree(node)
+        
+        for node in command.nodes:
+            if node in self.document_index:
+                self.document_index.update_node(node)
+    
+    def schedule_text_search(self):
+        """全局搜索框内容变化时重新计时，停止输入text_search_delay毫秒后再搜索"""
+        self.text_search_timer.start(self.text_search_delay)
+    
+    def update_element_ids(self, command):
+        """命令执行、撤销或重做后维护元素的稳定ID
+        
+        Args:
+            command: 刚刚执行、撤销或重做的命令
+        """
+        if command.document_replaced:
+            # 重新解析的文档：作用注释、展开和选中状态通过ID重新关联到新元素
+            self.file_tabs.reconcile_document(self.root)
+            return
+        
+        # 重新解析的子树：ID从当前不在文档中的一方转移到在文档中的一方
+        for old_node, new_node in command.replacements:
+            if new_node.getparent() is None:
+                old_node, new_node = new_node, old_node
+            self.file_tabs.element_ids.transfer(old_node, new_node)
+        if command.parents or command.nodes:
+            self.file_tabs.element_ids.invalidate()
+    
     def on_text_search_changed(self):
         """处理全局文本搜索变化"""
+        # 立即搜索时（回车或切换搜索模式）取消尚未执行的延迟搜索
+        self.text_search_timer.stop()
         search_text = self.text_search_input.text().strip()
         if not search_text:
             self.clear_text_search()
             return
             
-        # 清除之前的高亮
-        self.clear_all_highlighting()
-            
         # 使用现有的搜索逻辑，但搜索所有属性和文本内容
         found_elements = []
         if self.root is not None:
-            if self.fuzzy_search:  # 模糊搜索
-                self._search_text_recursive_fuzzy(self.root, search_text.lower(), found_elements)
-            else:  # 全字匹配搜索
-                self._search_text_recursive_exact(self.root, search_text.lower(), found_elements)
+            # 模糊搜索为包含匹配，否则为全字匹配
+            found_elements = self.document_index.find_text(search_text, exact=not self.fuzzy_search)
         
         # 高亮显示搜索结果
         self.highlight_search_results(found_elements)
 
-    def _search_text_recursive_fuzzy(self, element, search_text, found_elements):
-        """递归模糊搜索文本内容"""
-        try:
-            # 检查是否是注释节点
-            if isinstance(element, etree._Comment):
-                if element.text and search_text in element.text.lower():
-                    found_elements.append(element)
-                return
-
-            # 检查元素的文本内容
-            if element.text and search_text in element.text.lower():
-                found_elements.append(element)
-                
-            # 检查元素的属性值
-            for value in element.attrib.values():
-                if search_text in str(value).lower():
-                    found_elements.append(element)
-                    break
-            
-            # 检查元素的标签名
-            if hasattr(element, 'tag') and isinstance(element.tag, str):
-                if search_text in element.tag.lower():
-                    found_elements.append(element)
-            
-            # 递归检查子元素
-            for child in element:
-                self._search_text_recursive_fuzzy(child, search_text, found_elements)
-                
-        except Exception as e:
-            print(f"搜索文本时出错: {e}")
-
-    def _search_text_recursive_exact(self, element, search_text, found_elements):
-        """递归全字匹配搜索文本内容"""
-        try:
-            # 检查是否是注释节点
-            if isinstance(element, etree._Comment):
-                if element.text and search_text == element.text.lower():
-                    found_elements.append(element)
-                return
-
-            # 检查元素的文本内容
-            if element.text and search_text == element.text.lower():
-                found_elements.append(element)
-                
-            # 检查元素的属性值
-            for value in element.attrib.values():
-                if search_text == str(value).lower():
-                    found_elements.append(element)
-                    break
-            
-            # 检查元素的标签名
-            if hasattr(element, 'tag') and isinstance(element.tag, str):
-                if search_text == element.tag.lower():
-                    found_elements.append(element)
-            
-            # 递归检查子元素
-            for child in element:
-                self._search_text_recursive_exact(child, search_text, found_elements)
-                
-        except Exception as e:
-            print(f"搜索文本时出错: {e}")
-
     def clear_text_search(self):
         """清除全局文本搜索"""
         self.text_search_input.clear()
+        self.highlight_search_results([])
         self.clear_search_highlighting()
 
     def search_in_tree(self):
@@ -3530,17 +3856,12 @@ class XMLEditorWindow(QMainWindow):
         # 查找匹配的元素
         found_elements = self.find_elements(search_text, search_type, case_sensitive)
         
-        # 高亮匹配的元素
-        highlight_color = QColor(255, 255, 0, 100)  # 浅黄色高亮
-        for item in found_elements:
-            item.setBackground(0, highlight_color)
+        # 高亮匹配的元素，并选中和滚动到第一个匹配项
+        self.highlight_search_results(found_elements)
             
         # 更新状态栏
         if found_elements:
             self.status_bar.showMessage(f"找到 {len(found_elements)} 个匹配项")
-            # 选中并滚动到第一个匹配项
-            self.tree_widget.setCurrentItem(found_elements[0])
-            self.tree_widget.scrollToItem(found_elements[0])
         else:
             self.status_bar.showMessage("未找到匹配项")
             
@@ -3553,11 +3874,14 @@ class XMLEditorWindow(QMainWindow):
     def find_elements(self, search_text, search_type, case_sensitive=False):
         """根据搜索条件查找元素"""
         elements = []
-        root = self.tree_widget.invisibleRootItem()
+        if self.root is None:
+            return elements
         
-        def search_recursive(item):
-            # 获取项目文本
-            item_text = item.text(0)
+        for node in self.root.iter():
+            if not self.tree_model.is_tree_node(node):
+                continue
+            # 获取节点在元素列中显示的文本
+            item_text = (node.text or "").strip() if isinstance(node, etree._Comment) else node.tag
             
             # 根据大小写敏感设置进行比较
             if not case_sensitive:
@@ -3570,25 +3894,17 @@ class XMLEditorWindow(QMainWindow):
             # 根据搜索类型进行匹配
             if search_type == "精确匹配":
                 if item_text_compare == search_text_compare:
-                    elements.append(item)
+                    elements.append(node)
             elif search_type == "包含":
                 if search_text_compare in item_text_compare:
-                    elements.append(item)
+                    elements.append(node)
             elif search_type == "正则表达式":
                 try:
                     if re.search(search_text, item_text, flags=0 if case_sensitive else re.IGNORECASE):
-                        elements.append(item)
+                        elements.append(node)
                 except re.error:
                     pass
             
-            # 递归搜索子项目
-            for i in range(item.childCount()):
-                search_recursive(item.child(i))
-        
-        # 从根节点开始递归搜索
-        for i in range(root.childCount()):
-            search_recursive(root.child(i))
-            
         return elements
 
     def toggle_search_mode(self):
@@ -3617,10 +3933,74 @@ class CustomCompleter(QCompleter):
         # 记录引用符号在表达式中的位置
         self.reference_start_pos = -1
         
+        # 引用变量的排序补全（VariableCompletion）和当前属性的值（按小写排序）
+        self.variable_completion = None
+        self._values = []
+        self._value_keys = []
+        self._matches = QStringListModel()
+        self._matched_text = None  # 生成当前补全列表的文本
+        
         # 当补全器弹窗关闭时清理引用位置
         if self.popup():
             self.popup().hideEvent = lambda e: self._clean_up(e)
     
+    def set_variable_completion(self, variable_completion):
+        """
+        使用VariableCompletion排序引用变量
+        
+        设置后补全列表由update_matches按排名生成，弹窗按顺序显示全部列表，不再由补全器按前缀过滤。
+        """
+        self.variable_completion = variable_completion
+        self._matched_text = None
+        self.setModel(self._matches)
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+    
+    def set_values(self, values, value_keys):
+        """
+        设置当前属性在文档中的值，以输入的引用文本开头的值（例如颜色值#ffffff）排在引用变量之后
+        
+        Args:
+            values: 按小写排序的属性值列表
+            value_keys: 对应的小写值列表
+        """
+        self._values = values
+        self._value_keys = value_keys
+        self._matched_text = None
+    
+    def update_matches(self, text):
+        """
+        根据光标前的文本生成补全列表，最后一个#或@之后的部分作为查询
+        
+        Args:
+            text: 光标前的文本
+        """
+        if self.variable_completion is None or text == self._matched_text:
+            return
+        self._matched_text = text
+        
+        start = max(text.rfind('#'), text.rfind('@'))
+        if start < 0:
+            self._matches.setStringList([])
+            return
+        self.reference_start_pos = start
+        reference = text[start:]
+        symbol = reference[0]
+        matches = [symbol + name for name in self.variable_completion.complete(reference[1:])]
+        
+        limit = self.variable_completion.limit
+        if len(matches) < limit and self._values:
+            key = reference.lower()
+            position = bisect.bisect_left(self._value_keys, key)
+            seen = set(matches)
+            while (len(matches) < limit and position < len(self._value_keys)
+                   and self._value_keys[position].startswith(key)):
+                value = self._values[position]
+                if value not in seen:
+                    matches.append(value)
+                position += 1
+        
+        self._matches.setStringList(matches)
+    
     def _clean_up(self, event):
         """弹窗隐藏时的清理工作"""
         try:
@@ -3790,7 +4170,9 @@ class CustomLineEdit(QLineEdit):
                 try:
                     text = self.text()
                     if '#' in text or '@' in text:
-                        # 显示补全弹窗
+                        # 先按光标前的文本生成补全列表，再显示补全弹窗
+                        if isinstance(self._completer, CustomCompleter):
+                            self._completer.update_matches(text[:self.cursorPosition()])
                         rect = self.rect()
                         self._completer.complete(rect)
                 except RuntimeError:
@@ -3819,6 +4201,10 @@ class CustomLineEdit(QLineEdit):
                 # 获取光标前的文本
                 text_before_cursor = text[:cursor_pos]
                 
+                # 按光标前的引用文本生成排序的补全列表
+                if isinstance(self._completer, CustomCompleter):
+                    self._completer.update_matches(text_before_cursor)
+                
                 # 设置补全前缀为全文本，让CustomCompleter自己处理拆分
                 self._completer.setCompletionPrefix(text_before_cursor)
                 
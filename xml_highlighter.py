@@ -0,0 +1,325 @@
+import re
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QColor, QSyntaxHighlighter, QTextCharFormat, QTextLayout
+
+# 块状态：上一行结束时所处的位置，-1（默认值）表示位于普通文本中
+IN_TEXT = -1
+IN_COMMENT = 1
+IN_CDATA = 2
+IN_TAG = 3
+IN_DOUBLE_QUOTED = 4
+IN_SINGLE_QUOTED = 5
+
+# 一行中的所有标记：注释和CDATA的开始、没有属性的完整标签、标签的开始（含标签名）、标签的结束，
+# 以及属性名（含等号）和紧随其后的属性值（可能在行尾之前没有结束引号）
+_HIGHLIGHT_RE = re.compile(
+    r'(?P<comment><!--)'
+    r'|(?P<cdata><!\[CDATA\[)'
+    r'|(?P<tag></?[^\s<>/?!="\']+\s*/?>)'
+    r'|(?P<open><[/?!]?[^\s<>/?!="\']*)'
+    r'|(?P<close>/?>|\?>)'
+    r'|(?P<attr>[^\s<>/?="\']+\s*=)\s*(?P<value>"[^"]*"?|\'[^\']*\'?)?'
+)
+
+# 注释和CDATA的结束标记
+_TERMINATORS = {IN_COMMENT: '-->', IN_CDATA: ']]>'}
+
+def _create_formats():
+    """创建高亮用的(标签, 属性名, 属性值, 注释)格式"""
+    formats = []
+    for color in ("#00008B",  # 标签，深蓝色
+                  "#8B0000",  # 属性名，深红色
+                  "#006400",  # 属性值，深绿色
+                  "#808080"):  # 注释和CDATA，灰色
+        format = QTextCharFormat()
+        format.setForeground(QColor(color))
+        formats.append(format)
+    return tuple(formats)
+
+def highlight_line(text, state, set_format, formats):
+    """
+    高亮一行文本
+    
+    Args:
+        text: 行文本
+        state: 上一行结束时的块状态
+        set_format: 设置格式的函数 set_format(起始位置, 长度, 格式)
+        formats: _create_formats返回的格式
+    
+    Returns:
+        本行结束时的块状态
+    """
+    tag_format, attr_format, attr_value_format, comment_format = formats
+    position = 0
+    length = len(text)
+    
+    # 延续上一行未结束的注释、CDATA或属性值
+    if state in _TERMINATORS:
+        end = text.find(_TERMINATORS[state])
+        if end < 0:
+            set_format(0, length, comment_format)
+            return state
+        position = end + 3
+        set_format(0, position, comment_format)
+        state = IN_TEXT
+    elif state in (IN_DOUBLE_QUOTED, IN_SINGLE_QUOTED):
+        end = text.find('"' if state == IN_DOUBLE_QUOTED else "'")
+        if end < 0:
+            set_format(0, length, attr_value_format)
+            return state
+        position = end + 1
+        set_format(0, position, attr_value_format)
+        state = IN_TAG
+    
+    in_tag = state == IN_TAG
+    while position < length:
+        for match in _HIGHLIGHT_RE.finditer(text, position):
+            kind = match.lastgroup
+            start, end = match.span()
+            
+            if kind == 'value':
+                # 属性名和属性值
+                value_start = match.start('value')
+                set_format(start, value_start - start, attr_format)
+                set_format(value_start, end - value_start, attr_value_format)
+                quote = text[value_start]
+                if end - value_start == 1 or text[end - 1] != quote:
+                    # 属性值在本行没有结束
+                    return IN_DOUBLE_QUOTED if quote == '"' else IN_SINGLE_QUOTED
+            elif kind == 'open':
+                in_tag = True
+                set_format(start, end - start, tag_format)
+            elif kind == 'close':
+                in_tag = False
+                set_format(start, end - start, tag_format)
+            elif kind == 'tag':
+                set_format(start, end - start, tag_format)
+            elif kind == 'attr':
+                set_format(start, end - start, attr_format)
+            else:
+                # 注释或CDATA：找到结束标记后从其后继续扫描
+                block_state = IN_COMMENT if kind == 'comment' else IN_CDATA
+                end = text.find(_TERMINATORS[block_state], end)
+                if end < 0:
+                    set_format(start, length - start, comment_format)
+                    return block_state
+                position = end + 3
+                set_format(start, position - start, comment_format)
+                break
+        else:
+            break
+    
+    return IN_TAG if in_tag else IN_TEXT
+
+class XMLHighlighter(QSyntaxHighlighter):
+    """
+    XML语法高亮
+    
+    每行只用一个组合的正则表达式从左到右扫描一遍，代价与行长度成正比，
+    属性名和属性值在同一次匹配中得到。
+    跨行的注释、CDATA、开始标签和属性值通过块状态延续到下一行，
+    某一行结束时的状态变化后Qt会自动重新高亮后续的行。
+    """
+    def __init__(self, parent=None):
+        super(XMLHighlighter, self).__init__(parent)
+        self.formats = _create_formats()
+    
+    def highlightBlock(self, text):
+        self.setCurrentBlockState(highlight_line(text, self.previousBlockState(), self.setFormat, self.formats))
+
+def _pack_states(start, end):
+    """把一行开始和结束时的状态保存为一个块状态值（不会是表示未高亮的-1）"""
+    return (start + 1) << 4 | (end + 1)
+
+def _start_state(value):
+    """块状态值中行开始时的状态，未高亮的行返回None"""
+    return None if value == -1 else (value >> 4) - 1
+
+def _end_state(value):
+    """块状态值中行结束时的状态，未高亮的行视为位于普通文本中"""
+    return IN_TEXT if value == -1 else (value & 15) - 1
+
+class ViewportXMLHighlighter(QObject):
+    """
+    优先高亮可见区域的XML语法高亮，用于QPlainTextEdit显示的大文档
+    
+    QSyntaxHighlighter在文本被替换时同步高亮全部的行，十万行的文档要等待数秒。
+    这里文本被整体替换后只立即高亮可见的行，其余的行在事件循环空闲时每次处理chunk_size行，
+    从文档开头依次进行。位于尚未处理部分的可见行先假定上一行的状态进行高亮，
+    依次处理到这些行时再按正确的状态重新高亮。
+    编辑只同步重新高亮被修改的行，以及起始状态因此改变的后续行（最多chunk_size行，其余的留给空闲时处理）。
+    
+    高亮规则与XMLHighlighter相同。格式直接设置在各行的布局上（与QSyntaxHighlighter相同），
+    不产生撤销记录，也不触发文本变化信号。每行的块状态同时保存行开始和结束时的状态，
+    拆分或合并行后也能判断后续的行是否需要重新高亮。
+    """
+    def __init__(self, editor, chunk_size=1000):
+        """
+        Args:
+            editor: 要高亮的QPlainTextEdit
+            chunk_size: 空闲时每次高亮的行数
+        """
+        super(ViewportXMLHighlighter, self).__init__(editor)
+        self.editor = editor
+        self.document = editor.document()
+        self.chunk_size = chunk_size
+        self.formats = _create_formats()
+        
+        # 这一行之前的行都已按正确的状态高亮
+        self._next_block = 0
+        # 按假定的状态提前高亮的可见行号范围[first, last)
+        self._provisional = (0, 0)
+        # 正在设置格式，忽略由此引起的重绘请求
+        self._highlighting = False
+        # 上次文本变化后的行数，用于平移已高亮部分的边界
+        self._block_count = self.document.blockCount()
+        
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._highlight_chunk)
+        
+        self.document.contentsChange.connect(self._on_contents_change)
+        editor.updateRequest.connect(self._on_update_request)
+    
+    def is_finished(self):
+        """是否已按正确的状态高亮全部的行"""
+        return self._next_block >= self.document.blockCount()
+    
+    def rehighlight(self):
+        """从头重新高亮整个文档，立即处理可见的行"""
+        self._next_block = 0
+        self._provisional = (0, 0)
+        self.highlight_visible()
+        self._timer.start()
+    
+    def _highlight_blocks(self, block, count, extra=0):
+        """
+        从block开始依次高亮count行，再继续高亮起始状态改变的后续行，最多extra行
+        
+        Args:
+            block: 起始行，以上一行保存的结束状态开始
+            count: 必须高亮的行数
+            extra: 之后最多继续高亮的行数
+        
+        Returns:
+            (最后一个被高亮的行, 之后的行是否无需重新高亮)
+        """
+        previous = block.previous()
+        state = _end_state(previous.userState()) if previous.isValid() else IN_TEXT
+        formats = self.formats
+        start = block.position()
+        last = None
+        while block.isValid():
+            if count > 0:
+                count -= 1
+            elif _start_state(block.userState()) == state:
+                break
+            elif extra > 0:
+                extra -= 1
+            else:
+                break
+            
+            ranges = []
+            
+            def set_format(position, length, format):
+                format_range = QTextLayout.FormatRange()
+                format_range.start = position
+                format_range.length = length
+                format_range.format = format
+                ranges.append(format_range)
+            
+            end_state = highlight_line(block.text(), state, set_format, formats)
+            block.layout().setFormats(ranges)
+            block.setUserState(_pack_states(state, end_state))
+            state = end_state
+            last = block
+            block = block.next()
+        
+        if last is not None:
+            # 格式只保存在布局中，通知文档重新布局和绘制这些行
+            self._highlighting = True
+            try:
+                self.document.markContentsDirty(start, last.position() + last.length() - start)
+            finally:
+                self._highlighting = False
+        return last, not block.isValid() or _start_state(block.userState()) == state
+    
+    def highlight_visible(self):
+        """立即高亮当前可见、尚未按正确状态高亮的行"""
+        editor = self.editor
+        block = editor.firstVisibleBlock()
+        bottom = editor.viewport().height()
+        offset = editor.contentOffset()
+        first = last = None
+        while block.isValid() and editor.blockBoundingGeometry(block).translated(offset).top() <= bottom:
+            number = block.blockNumber()
+            if number >= self._next_block and not self._provisional[0] <= number < self._provisional[1]:
+                if first is None:
+                    first = number
+                last = number
+            block = block.next()
+        if first is None:
+            return
+        
+        self._highlight_blocks(self.document.findBlockByNumber(first), last - first + 1)
+        if first == self._next_block:
+            # 紧接在已高亮部分之后，起始状态是正确的
+            self._next_block = last + 1
+        else:
+            self._provisional = (first, last + 1)
+    
+    def _highlight_chunk(self):
+        """空闲时从第一个未高亮的行开始按顺序高亮chunk_size行"""
+        block = self.document.findBlockByNumber(self._next_block)
+        if block.isValid():
+            last, _ = self._highlight_blocks(block, self.chunk_size)
+            self._next_block = last.blockNumber() + 1
+            if self._next_block >= self._provisional[0]:
+                self._provisional = (0, 0)
+        if self.is_finished():
+            self._timer.stop()
+    
+    def _on_update_request(self, rect, dy):
+        """滚动或重绘时高亮新出现的行"""
+        if not self._highlighting and not self.is_finished():
+            self.highlight_visible()
+    
+    def _on_contents_change(self, position, removed, added):
+        """文本变化后重新高亮被修改的行，以及起始状态因此改变的后续行"""
+        if self._highlighting:
+            return
+        first = self.document.findBlock(position)
+        if not first.isValid():
+            return
+        number = first.blockNumber()
+        self._provisional = (0, 0)
+        block_count = self.document.blockCount()
+        if number < self._next_block:
+            # 修改位置之后的已高亮行随插入或删除的行移动
+            self._next_block = max(number, self._next_block + block_count - self._block_count)
+        self._block_count = block_count
+        if number > self._next_block:
+            # 修改位于尚未高亮的部分，空闲时会依次处理到
+            self.highlight_visible()
+            return
+        
+        last = self.document.findBlock(position + added)
+        if not last.isValid():
+            last = self.document.lastBlock()
+        count = last.blockNumber() - number + 1
+        if count > self.chunk_size:
+            # 大段文本被替换（例如整个文档被重新设置），先高亮可见的行
+            self._next_block = number
+            self.highlight_visible()
+            self._timer.start()
+            return
+        
+        # 只在已高亮的部分中继续，之后的行空闲时会依次处理到
+        extra = min(self.chunk_size, max(0, self._next_block - last.blockNumber() - 1))
+        last, consistent = self._highlight_blocks(first, count, extra)
+        if consistent or last.blockNumber() + 1 >= self._next_block:
+            self._next_block = max(self._next_block, last.blockNumber() + 1)
+        else:
+            # 起始状态的改变超出了同步处理的范围（例如输入了<!--）
+            self._next_block = last.blockNumber() + 1
+            self._timer.start()
@@ -0,0 +1,98 @@
+import os
+from lxml import etree
+from PyQt5.QtCore import QThread, pyqtSignal
+from document_index import DocumentIndex
+from file_writer import content_digest
+from xml_outline import XMLOutline
+
+# 每次送入解析器的数据块大小，决定解析进度的更新频率
+_CHUNK_SIZE = 1024 * 1024
+
+class XMLLoadResult:
+    """后台加载完成后交给界面的数据"""
+    def __init__(self, file_path, tree, original_content, content_hash, document_index, modified_time):
+        self.file_path = file_path
+        self.tree = tree
+        self.original_content = original_content
+        self.content_hash = content_hash  # content_digest计算的原始数据哈希
+        self.document_index = document_index
+        self.modified_time = modified_time
+
+class XMLLoadThread(QThread):
+    """
+    在后台线程中读取并解析XML文件
+    
+    文件只读取一次，同一份数据既用于解析也作为原始内容保存；
+    解析按数据块进行并报告进度，随后在后台建立文档索引。
+    界面线程只需要在loaded信号中用结果填充控件。
+    """
+    # 进度百分比和当前阶段的描述
+    progress = pyqtSignal(int, str)
+    # 加载成功，参数为XMLLoadResult
+    loaded = pyqtSignal(object)
+    # 加载失败，参数为文件路径和错误信息
+    failed = pyqtSignal(str, str)
+    
+    def __init__(self, file_path, parent=None):
+        super(XMLLoadThread, self).__init__(parent)
+        self.file_path = file_path
+    
+    def run(self):
+        try:
+            self.loaded.emit(self.load())
+        except Exception as e:
+            self.failed.emit(self.file_path, str(e))
+    
+    def load(self):
+        """读取、解析文件并建立文档索引，返回XMLLoadResult"""
+        self.progress.emit(0, "读取文件")
+        modified_time = os.path.getmtime(self.file_path)
+        with open(self.file_path, 'rb') as f:
+            data = f.read()
+        
+        # 创建保留空白和注释的解析器
+        parser = etree.XMLParser(remove_blank_text=False,
+                                 remove_comments=False,
+                                 remove_pis=False,
+                                 strip_cdata=False)
+        
+        # 分块送入解析器以便报告进度
+        total = len(data) or 1
+        for offset in range(0, len(data), _CHUNK_SIZE):
+            parser.feed(data[offset:offset + _CHUNK_SIZE])
+            percent = min(offset + _CHUNK_SIZE, total) * 80 // total
+            self.progress.emit(percent, "解析XML")
+        root = parser.close()
+        tree = root.getroottree()
+        
+        self.progress.emit(80, "建立文档索引")
+        document_index = DocumentIndex(root)
+        
+        self.progress.emit(95, "加载界面")
+        # 按文件声明的编码解码，与文本模式读取一致，统一换行符
+        encoding = tree.docinfo.encoding or 'utf-8'
+        original_content = data.decode(encoding).replace('\r\n', '\n').replace('\r', '\n')
+        return XMLLoadResult(self.file_path, tree, original_content, content_digest(data),
+                             document_index, modified_time)
+
+class XMLOutlineThread(QThread):
+    """
+    在后台线程中为超大文件建立只读大纲（XMLOutline）
+    
+    信号与XMLLoadThread相同，loaded信号的参数为XMLOutline。
+    """
+    progress = pyqtSignal(int, str)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str, str)
+    
+    def __init__(self, file_path, parent=None):
+        super(XMLOutlineThread, self).__init__(parent)
+        self.file_path = file_path
+    
+    def run(self):
+        try:
+            outline = XMLOutline(self.file_path,
+                                 lambda percent: self.progress.emit(percent, "建立大纲"))
+            self.loaded.emit(outline)
+        except Exception as e:
+            self.failed.emit(self.file_path, str(e))
@@ -0,0 +1,222 @@
+import mmap
+import re
+from array import array
+from lxml import etree
+
+# 与xml_source_map中的标记扫描相同，按字节匹配内存映射中的各类标记
+_TOKEN_RE = re.compile(
+    rb'<(?:'
+    rb'!--.*?-->'
+    rb'|!\[CDATA\[.*?\]\]>'
+    rb'|\?.*?\?>'
+    rb'|!DOCTYPE[^\[>]*(?:\[.*?\])?[^>]*>'
+    rb'|/[^>]*>'
+    rb'|[^\s/>!?][^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>'
+    rb')',
+    re.S
+)
+
+# 开始标签和结束标签中的标签名
+_TAG_NAME_RE = re.compile(rb'</?([^\s/>]+)')
+
+# 大纲中注释预览文本的最大长度
+_COMMENT_PREVIEW_LENGTH = 80
+
+# 每扫描多少个节点报告一次进度
+_PROGRESS_INTERVAL = 20000
+
+def _local_name(name):
+    """去掉命名空间（{uri}或前缀）后的标签名"""
+    return name.rpartition('}')[2].rpartition(':')[2]
+
+class XMLOutline:
+    """
+    超大XML文件的轻量大纲，只读
+    
+    文件以内存映射方式打开，不整体读入内存。etree.iterparse流式解析文件，
+    得到每个元素的标签、层级和关键属性（name），处理完的元素随即被释放；
+    同时按文档顺序扫描标记，记录每个节点在文件中的字节范围。
+    大纲按文档顺序把节点保存在几个并列的数组中，节点用序号表示。
+    需要查看某个节点时再用materialize把它的字节范围解析为完整的子树。
+    """
+    def __init__(self, file_path, progress=None):
+        """
+        打开文件并建立大纲
+        
+        Args:
+            file_path: XML文件路径
+            progress: 可选，进度回调 progress(百分比)
+        
+        Raises:
+            etree.XMLSyntaxError: 文件不是格式正确的XML时
+            ValueError: 标记扫描结果与解析结果无法对应时
+        """
+        self.file_path = file_path
+        self.tags = []  # 标签名，注释为None
+        self.labels = []  # 元素的name属性或注释的预览文本
+        self.starts = array('q')  # 节点在文件中的起始字节偏移
+        self.ends = array('q')  # 节点在文件中的结束字节偏移（不含）
+        self.parents = array('q')  # 父节点序号，根元素为-1
+        self.depths = array('l')  # 层级，根元素为0
+        self.subtree_ends = array('q')  # 子树之后第一个节点的序号
+        
+        self._file = open(file_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._build(progress)
+        except Exception:
+            self.close()
+            raise
+    
+    def __len__(self):
+        return len(self.tags)
+    
+    def close(self):
+        """释放内存映射和文件"""
+        mm = getattr(self, '_mm', None)
+        if mm is not None:
+            mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def _build(self, progress):
+        """流式解析文件，同时按文档顺序扫描标记以得到每个节点的字节范围"""
+        mm = self._mm
+        size = len(mm) or 1
+        tokens = _TOKEN_RE.finditer(mm)
+        
+        def next_token(kind):
+            # 跳过处理指令、DOCTYPE和CDATA，返回下一个指定类型的标记
+            for match in tokens:
+                second = mm[match.start() + 1:match.start() + 2]
+                if second == b'!':
+                    if mm[match.start() + 2:match.start() + 4] != b'--':
+                        continue
+                    found = 'comment'
+                elif second == b'?':
+                    continue
+                elif second == b'/':
+                    found = 'end'
+                else:
+                    found = 'start'
+                if found != kind:
+                    raise ValueError(f"第{match.start()}字节处的标记与解析结果不一致")
+                return match
+            raise ValueError("标记扫描提前结束")
+        
+        def check_name(match, tag):
+            name = _TAG_NAME_RE.match(mm, match.start()).group(1).decode('utf-8')
+            if _local_name(name) != _local_name(tag):
+                raise ValueError(f"第{match.start()}字节处的标签{name}与解析结果{tag}不一致")
+        
+        stack = []  # 正在解析的元素序号，自闭合元素记为~序号
+        for event, node in etree.iterparse(mm, events=('start', 'end', 'comment'),
+                                           remove_blank_text=False, huge_tree=True):
+            if event == 'comment':
+                match = next_token('comment')
+                if stack:
+                    text = ' '.join((node.text or '').split())
+                    self._append(None, text[:_COMMENT_PREVIEW_LENGTH], match.start(), match.end(), stack)
+                    self.subtree_ends.append(len(self.tags))
+            elif event == 'start':
+                match = next_token('start')
+                check_name(match, node.tag)
+                index = self._append(node.tag, node.get('name'), match.start(), match.end(), stack)
+                self.subtree_ends.append(-1)
+                # 自闭合标签没有对应的结束标签，结束位置就是开始标签的结束位置
+                stack.append(index if mm[match.end() - 2:match.end()] != b'/>' else ~index)
+                if len(self.tags) % _PROGRESS_INTERVAL == 0 and progress is not None:
+                    progress(match.end() * 100 // size)
+            else:
+                index = stack.pop()
+                if index >= 0:
+                    match = next_token('end')
+                    check_name(match, node.tag)
+                    self.ends[index] = match.end()
+                else:
+                    index = ~index
+                self.subtree_ends[index] = len(self.tags)
+                
+                # 释放已处理完的元素，内存占用只与当前的嵌套深度有关
+                node.clear()
+                parent = node.getparent()
+                if parent is not None:
+                    while node.getprevious() is not None:
+                        del parent[0]
+        
+        if progress is not None:
+            progress(100)
+    
+    def _append(self, tag, label, start, end, stack):
+        """按文档顺序追加一个节点，返回其序号"""
+        index = len(self.tags)
+        self.tags.append(_local_name(tag) if tag is not None else None)
+        self.labels.append(label)
+        self.starts.append(start)
+        self.ends.append(end)
+        # 自闭合元素在开始和结束事件之间没有子节点，栈顶总是非负的父元素序号
+        self.parents.append(stack[-1] if stack else -1)
+        self.depths.append(len(stack))
+        return index
+    
+    # ---- 查询 ----
+    
+    def is_comment(self, index):
+        """判断节点是否为注释"""
+        return self.tags[index] is None
+    
+    def children(self, index):
+        """按文档顺序返回节点的直接子节点序号"""
+        children = []
+        child = index + 1
+        end = self.subtree_ends[index]
+        while child < end:
+            children.append(child)
+            child = self.subtree_ends[child]
+        return children
+    
+    def source_bytes(self, index):
+        """节点在文件中的原始字节"""
+        return self._mm[self.starts[index]:self.ends[index]]
+    
+    def source_text(self, index):
+        """节点在文件中的原始文本"""
+        return self.source_bytes(index).decode('utf-8')
+    
+    def start_tag(self, index):
+        """
+        只解析节点的开始标签，得到不含子节点的元素
+        
+        用于预览过大、不适合整体解析的节点的标签和属性。
+        """
+        match = _TOKEN_RE.match(self._mm, self.starts[index])
+        tag = match.group()
+        if not tag.endswith(b'/>'):
+            tag = tag[:-1] + b'/>'
+        return etree.fromstring(tag)
+    
+    def materialize(self, index):
+        """
+        把节点的字节范围解析为完整的lxml子树
+        
+        Args:
+            index: 节点序号
+        
+        Returns:
+            节点对应的元素或注释
+        
+        Raises:
+            etree.XMLSyntaxError: 节点无法单独解析时（例如使用了祖先元素上声明的命名空间前缀）
+        """
+        parser = etree.XMLParser(remove_blank_text=False,
+                                 remove_comments=False,
+                                 remove_pis=False,
+                                 strip_cdata=False,
+                                 huge_tree=True)
+        if self.is_comment(index):
+            # 注释不能单独作为文档根节点，放在临时元素中解析
+            wrapper = etree.fromstring(b'<outline>' + self.source_bytes(index) + b'</outline>', parser)
+            return wrapper[0]
+        return etree.fromstring(self.source_bytes(index), parser)
@@ -0,0 +1,611 @@
+import operator
+import re
+from bisect import bisect_left
+from itertools import accumulate
+from lxml import etree
+
+# 匹配XML中的各类标记：注释、CDATA、处理指令、DOCTYPE、结束标签和开始标签
+# 开始标签中的属性值可能包含'>'，因此需要按引号分段匹配
+_TOKEN_RE = re.compile(
+    r'<(?:'
+    r'!--.*?-->'
+    r'|!\[CDATA\[.*?\]\]>'
+    r'|\?.*?\?>'
+    r'|!DOCTYPE[^\[>]*(?:\[.*?\])?[^>]*>'
+    r'|/[^>]*>'
+    r'|[^\s/>!?][^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>'
+    r')',
+    re.S
+)
+
+# 开始标签中的标签名
+_TAG_NAME_RE = re.compile(r'<([^\s/>]+)')
+
+# QTextDocument按UTF-16计算位置，包含辅助平面字符时偏移量无法直接对应
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+def contains_astral(text):
+    """文本是否包含辅助平面字符（在QTextDocument中占两个位置）"""
+    return _ASTRAL_RE.search(text) is not None
+
+class XMLSourceMap:
+    """
+    记录文档中每个节点（元素、注释、处理指令）在代码文本中的位置
+    
+    通过一次标记扫描，把文本中的标记按文档顺序与lxml树中的节点一一对应，
+    得到每个节点开始标签的偏移量和长度。修改某个节点的开始标签后，
+    后续节点的偏移量通过树状数组累计偏移，无需重新扫描整个文本。
+    """
+    def __init__(self, text, root):
+        """
+        根据代码文本和对应的根元素建立位置映射
+        
+        Args:
+            text: 代码视图中的完整文本
+            root: 与文本对应的lxml根元素
+        
+        Raises:
+            ValueError: 文本中的标记与树中的节点无法对应时
+        """
+        if contains_astral(text):
+            raise ValueError("文本包含辅助平面字符，无法建立位置映射")
+        
+        self.nodes = [node for node in root.iter() if not isinstance(node, etree._Entity)]
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        
+        count = len(self.nodes)
+        self._starts = [0] * count
+        self._tag_lengths = [0] * count
+        self._shifts = [0] * (count + 1)
+        # 各节点标签长度的变化，与树状数组相同，用于一次计算所有节点的位置
+        self._deltas = [0] * count
+        
+        self._scan(text)
+    
+    def _scan(self, text):
+        """扫描文本中的标记并与节点对齐"""
+        position = 0
+        stack = []
+        started = False
+        count = len(self.nodes)
+        
+        for match in _TOKEN_RE.finditer(text):
+            token = match.group()
+            second = token[1]
+            
+            if second == '/':
+                # 结束标签
+                if not started:
+                    continue
+                if not stack:
+                    raise ValueError("结束标签与开始标签不匹配")
+                stack.pop()
+                if not stack:
+                    break
+                continue
+            
+            if second == '!' and token.startswith('<![CDATA['):
+                continue
+            if second == '!' and not token.startswith('<!--'):
+                # DOCTYPE等声明
+                continue
+            
+            if not started:
+                if second in '!?':
+                    # 根元素之前的注释和处理指令不属于根元素子树
+                    continue
+                started = True
+            
+            if position >= count:
+                raise ValueError("文本中的节点多于XML树中的节点")
+            
+            node = self.nodes[position]
+            if not self._token_matches(token, node):
+                raise ValueError(f"第{position}个节点与文本中的标记不匹配")
+            
+            self._starts[position] = match.start()
+            self._tag_lengths[position] = len(token)
+            
+            if second not in '!?' and not token.endswith('/>'):
+                stack.append(position)
+            position += 1
+            
+            if not stack and second not in '!?':
+                # 根元素是自闭合标签
+                break
+        
+        if position != count or stack:
+            raise ValueError("文本中的节点数量与XML树不一致")
+    
+    def _token_matches(self, token, node):
+        """检查标记类型与节点类型是否一致"""
+        if isinstance(node, etree._Comment):
+            return token.startswith('<!--')
+        if isinstance(node, etree._ProcessingInstruction):
+            return token.startswith('<?')
+        if token[1] in '!?':
+            return False
+        match = _TAG_NAME_RE.match(token)
+        name = match.group(1) if match else ''
+        return name.split(':')[-1] == etree.QName(node).localname
+    
+    def _prefix_shift(self, position):
+        """计算序号小于position的节点累计产生的偏移量"""
+        total = 0
+        while position > 0:
+            total += self._shifts[position]
+            position -= position & -position
+        return total
+    
+    def _add_shift(self, node_index, delta):
+        """记录node_index节点的标签长度变化，影响其后所有节点的位置"""
+        position = node_index + 1
+        size = len(self._shifts)
+        while position < size:
+            self._shifts[position] += delta
+            position += position & -position
+    
+    def __contains__(self, node):
+        return node in self.index
+    
+    def tag_span(self, node):
+        """
+        获取节点开始标签（注释、处理指令为整个节点）在文本中的范围
+        
+        Returns:
+            (start, end) 偏移量元组，节点不在映射中时返回None
+        """
+        node_index = self.index.get(node)
+        if node_index is None:
+            return None
+        start = self._starts[node_index] + self._prefix_shift(node_index)
+        return start, start + self._tag_lengths[node_index]
+    
+    def node_before(self, offset):
+        """
+        获取开始标签起始位置在offset之前的最后一个节点
+        
+        Returns:
+            节点，offset之前没有节点时返回None
+        """
+        count = len(self.nodes)
+        starts = _LazyStarts(self)
+        position = bisect_left(starts, offset, 0, count)
+        return self.nodes[position - 1] if position > 0 else None
+    
+    def update_tag(self, node, new_length):
+        """
+        节点的开始标签被替换为新文本后，更新映射
+        
+        Args:
+            node: 被修改的节点
+            new_length: 新开始标签文本的长度
+        """
+        node_index = self.index[node]
+        delta = new_length - self._tag_lengths[node_index]
+        if delta:
+            self._tag_lengths[node_index] = new_length
+            self._deltas[node_index] += delta
+            self._add_shift(node_index, delta)
+    
+    def replace_subtree(self, old_node, new_node, fragment, start, delta):
+        """
+        代码文本中一个节点的子树被替换、树中的节点也被替换为重新解析的节点后，更新映射
+        
+        只扫描新子树的文本；其后节点的位置统一加上文本长度的变化，不重新扫描。
+        新旧节点都可以是注释或处理指令。
+        
+        Args:
+            old_node: 映射中被替换的节点
+            new_node: 替换后的节点
+            fragment: 新子树的文本
+            start: 子树在文本中的起始偏移（替换前后相同）
+            delta: 替换后文本长度的变化
+        
+        Raises:
+            ValueError: 新子树的文本与新节点无法对应时
+        """
+        if isinstance(new_node.tag, str):
+            new_map = XMLSourceMap(fragment, new_node)
+            new_starts, new_lengths, new_nodes = new_map._starts, new_map._tag_lengths, new_map.nodes
+        else:
+            # 注释和处理指令没有子节点，整个节点就是一个标记
+            new_starts, new_lengths, new_nodes = [0], [len(fragment)], [new_node]
+        node_index = self.index[old_node]
+        old_count = sum(1 for node in old_node.iter() if not isinstance(node, etree._Entity))
+        self._replace_nodes(node_index, node_index + old_count, start, delta,
+                            new_starts, new_lengths, new_nodes)
+    
+    def replace_children(self, element, fragment, start, old_end):
+        """
+        元素本身保留、子节点在树中被修改，代码文本中它的子树也被替换为fragment后，更新映射
+        
+        元素的旧子孙节点已不能从树中得到，按旧子树的结束位置确定映射中属于旧子树的节点。
+        
+        Args:
+            element: 子节点变化的元素，在映射中
+            fragment: 元素新子树的文本
+            start: 子树在文本中的起始偏移（替换前后相同）
+            old_end: 替换前子树在文本中的结束偏移
+        
+        Raises:
+            ValueError: 新子树的文本与元素无法对应时
+        """
+        new_map = XMLSourceMap(fragment, element)
+        node_index = self.index[element]
+        next_index = bisect_left(_LazyStarts(self), old_end, node_index + 1, len(self.nodes))
+        self._replace_nodes(node_index, next_index, start, len(fragment) - (old_end - start),
+                            new_map._starts, new_map._tag_lengths, new_map.nodes)
+    
+    def _replace_nodes(self, node_index, next_index, start, delta, new_starts, new_lengths, new_nodes):
+        """
+        把序号[node_index, next_index)的节点换成新子树的节点，其后的节点整体平移delta
+        
+        节点数量不变时（例如修改属性或文本后重新解析），其后节点的平移记录在树状数组中，
+        只更新被替换范围内的位置和序号，代价与子树大小有关。
+        节点数量变化时其后所有节点的序号都要改变，只能重建各个数组和序号。
+        """
+        old_nodes = self.nodes[node_index:next_index]
+        if len(new_nodes) == len(old_nodes) and new_nodes:
+            self._replace_same_count(node_index, next_index, start, delta, new_starts)
+        else:
+            starts = self._absolute_starts()
+            self._starts = (starts[:node_index]
+                            + [start + offset for offset in new_starts]
+                            + [offset + delta for offset in starts[next_index:]])
+            self._shifts = [0] * (len(starts) - len(old_nodes) + len(new_nodes) + 1)
+            self._deltas = [0] * (len(starts) - len(old_nodes) + len(new_nodes))
+        self._tag_lengths[node_index:next_index] = new_lengths
+        self.nodes[node_index:next_index] = new_nodes
+        
+        # 移动到其他子树中的节点可能已按新位置登记了序号，只删除仍指向旧范围的序号
+        for position, node in enumerate(old_nodes, node_index):
+            if self.index.get(node) == position:
+                del self.index[node]
+        if len(new_nodes) == len(old_nodes):
+            self.index.update(zip(new_nodes, range(node_index, next_index)))
+        else:
+            self.index.update(zip(self.nodes[node_index:], range(node_index, len(self.nodes))))
+    
+    def _replace_same_count(self, node_index, next_index, start, delta, new_starts):
+        """节点数量不变时更新被替换范围内的位置，并把delta记录为范围内最后一个节点的偏移"""
+        # 先清除范围内节点原有的偏移，它们对其后节点的影响并入最后一个节点
+        removed = 0
+        for position in range(node_index, next_index):
+            shift = self._deltas[position]
+            if shift:
+                self._add_shift(position, -shift)
+                self._deltas[position] = 0
+                removed += shift
+        last = next_index - 1
+        if delta + removed:
+            self._add_shift(last, delta + removed)
+            self._deltas[last] = delta + removed
+        
+        # 范围内各节点之前的累计偏移相同
+        base = start - self._prefix_shift(node_index)
+        self._starts[node_index:next_index] = [base + offset for offset in new_starts]
+    
+    def _absolute_starts(self):
+        """一次线性计算所有节点计入累计偏移后的起始位置"""
+        return list(map(operator.add, self._starts, accumulate(self._deltas, initial=0)))
+
+class _LazyStarts:
+    """按序号计算节点起始位置的只读序列，用于二分查找"""
+    def __init__(self, source_map):
+        self.source_map = source_map
+    
+    def __len__(self):
+        return len(self.source_map.nodes)
+    
+    def __getitem__(self, node_index):
+        source_map = self.source_map
+        return source_map._starts[node_index] + source_map._prefix_shift(node_index)
+
+class DirtyRange:
+    """
+    记录文本自上次同步以来被用户修改的范围
+    
+    只保存未被修改的前缀长度和后缀长度。修改范围之前和之后的文本在同步时的文本
+    （位置映射对应的文本）和当前文本中完全相同，因此同一个修改范围既可以换算为
+    同步时文本中的偏移量，也可以换算为当前文本中的偏移量。
+    """
+    def __init__(self, length=0):
+        self.reset(length)
+    
+    def reset(self, length):
+        """文本重新同步后调用，length为同步时的文本长度"""
+        self.synced_length = length
+        self.length = length
+        self.prefix = length
+        self.suffix = length
+    
+    def record(self, position, added, length):
+        """
+        记录一次修改
+        
+        Args:
+            position: 修改开始的位置
+            added: 插入的字符数
+            length: 修改后的文本长度
+        """
+        self.length = length
+        self.prefix = min(self.prefix, position, length)
+        self.suffix = min(self.suffix, max(0, length - position - added))
+        self.suffix = min(self.suffix, length - self.prefix, self.synced_length - self.prefix)
+    
+    def is_clean(self):
+        """自上次同步以来是否没有修改"""
+        return self.prefix == self.synced_length == self.length
+    
+    def synced_span(self):
+        """修改范围在同步时文本中的(start, end)"""
+        return self.prefix, self.synced_length - self.suffix
+    
+    def current_span(self):
+        """修改范围在当前文本中的(start, end)"""
+        return self.prefix, self.length - self.suffix
+    
+    def map_span(self, start, end):
+        """
+        把同步时文本中的范围换算到当前文本中
+        
+        Returns:
+            (start, end)，范围与修改范围重叠时返回None
+        """
+        if end <= self.prefix:
+            return start, end
+        if start >= self.synced_length - self.suffix:
+            delta = self.length - self.synced_length
+            return start + delta, end + delta
+        return None
+
+class SyncedText:
+    """
+    与XML树同步时的代码文本（位置映射对应的文本）
+    
+    局部更新代码视图（替换开始标签或子树）后，同步时的文本也要做同样的替换。
+    文本按片段保存：片段是原始文本中的一段范围(start, end)或替换进来的新文本，
+    替换只修改片段列表，代价与片段数量有关而与文本长度无关；需要完整文本时才拼接一次。
+    片段超过_MAX_PIECES个时合并为一段，避免连续局部更新后片段列表过长。
+    """
+    _MAX_PIECES = 1024
+    
+    def __init__(self, text=''):
+        self.reset(text)
+    
+    def reset(self, text):
+        """整个文本重新同步"""
+        self._base = text
+        self._pieces = [(0, len(text))] if text else []
+        self._length = len(text)
+    
+    def __len__(self):
+        return self._length
+    
+    @staticmethod
+    def _piece_length(piece):
+        return piece[1] - piece[0] if isinstance(piece, tuple) else len(piece)
+    
+    @staticmethod
+    def _cut(piece, start, end):
+        """片段中[start, end)的部分"""
+        if isinstance(piece, tuple):
+            return piece[0] + start, piece[0] + end
+        return piece[start:end]
+    
+    def replace(self, start, end, text):
+        """
+        把[start, end)替换为text
+        
+        Args:
+            start: 起始偏移
+            end: 结束偏移
+            text: 新文本
+        """
+        before = []
+        after = []
+        position = 0
+        for piece in self._pieces:
+            length = self._piece_length(piece)
+            piece_start = position
+            position += length
+            if position <= start:
+                before.append(piece)
+            elif piece_start >= end:
+                after.append(piece)
+            else:
+                if piece_start < start:
+                    before.append(self._cut(piece, 0, start - piece_start))
+                if position > end:
+                    after.append(self._cut(piece, end - piece_start, length))
+        if text:
+            before.append(text)
+        self._pieces = before + after
+        self._length += len(text) - (end - start)
+        if len(self._pieces) > self._MAX_PIECES:
+            self.reset(self.text())
+    
+    def slice(self, start, end):
+        """[start, end)的文本，只拼接与之重叠的片段"""
+        parts = []
+        position = 0
+        for piece in self._pieces:
+            length = self._piece_length(piece)
+            piece_start = position
+            position += length
+            if position <= start:
+                continue
+            if piece_start >= end:
+                break
+            parts.append(self._text(self._cut(piece, max(start - piece_start, 0),
+                                              min(end - piece_start, length))))
+        return ''.join(parts)
+    
+    def _text(self, piece):
+        return self._base[piece[0]:piece[1]] if isinstance(piece, tuple) else piece
+    
+    def text(self):
+        """完整文本"""
+        if self._pieces != [(0, len(self._base))]:
+            self.reset(''.join(self._text(piece) for piece in self._pieces))
+        return self._base
+    
+    def element_end(self, start):
+        """
+        从元素开始标签的位置向后扫描，返回元素在文本中的结束偏移，只读取元素所在的一段文本
+        
+        Returns:
+            结束偏移，文本在元素结束前就已结束时返回None
+        """
+        return read_element_end(self.slice, start, self._length)
+
+def read_element_end(read, start, length):
+    """
+    与element_end相同，但通过read分段读取文本，从较小的一段开始，找不到结束位置时再扩大
+    
+    Args:
+        read: 函数，参数为(start, end)，返回文本中的这一段
+        start: 元素开始标签在文本中的起始偏移
+        length: 文本长度
+    
+    Returns:
+        结束偏移，文本在元素结束前就已结束时返回None
+    """
+    window = 4096
+    while True:
+        end = element_end(read(start, min(start + window, length)), 0)
+        if end is not None:
+            return start + end
+        if start + window >= length:
+            return None
+        window *= 4
+
+def element_end(text, start):
+    """
+    从元素开始标签的位置向后扫描标记，返回元素（含结束标签）在文本中的结束偏移
+    
+    只按开始和结束标签的嵌套层级计数，不检查标签名是否对应。
+    
+    Args:
+        text: 文本
+        start: 元素开始标签在文本中的起始偏移
+    
+    Returns:
+        结束偏移，文本在元素结束前就已结束时返回None
+    """
+    depth = 0
+    for match in _TOKEN_RE.finditer(text, start):
+        token = match.group()
+        second = token[1]
+        if second == '/':
+            depth -= 1
+        elif second in '!?':
+            continue
+        elif not token.endswith('/>'):
+            depth += 1
+        if depth <= 0:
+            return match.end()
+    return None
+
+def serialize_start_tag(node):
+    """
+    按lxml的序列化规则生成节点的开始标签文本（注释、处理指令为整个节点）
+    
+    只序列化节点本身，代价与子元素数量无关。
+    带命名空间声明的元素无法脱离上下文单独序列化，此时返回None。
+    
+    Args:
+        node: 元素、注释或处理指令节点
+    
+    Returns:
+        开始标签文本，无法生成时返回None
+    """
+    if isinstance(node, (etree._Comment, etree._ProcessingInstruction)):
+        return etree.tostring(node, encoding='unicode', with_tail=False)
+    if not isinstance(node.tag, str) or node.nsmap:
+        return None
+    
+    shallow = etree.Element(node.tag)
+    for key, value in node.attrib.items():
+        shallow.set(key, value)
+    
+    # 没有文本和子元素的元素会被序列化为自闭合标签
+    self_closing = node.text is None and len(node) == 0
+    if not self_closing:
+        shallow.text = ''
+    
+    text = etree.tostring(shallow, encoding='unicode')
+    if not self_closing:
+        text = text[:-(len(node.tag) + 3)]
+    return text
+
+def serialize_subtree(node):
+    """
+    单独序列化节点的子树（不含尾部文本），结果与整个文档序列化时的这一段相同
+    
+    代价与子树大小（以及祖先元素的子节点数）成正比。pretty_print需要为子树中的元素补充缩进、
+    元素带有命名空间声明，或文本包含辅助平面字符（无法与代码视图的位置对应）时返回None。
+    
+    Args:
+        node: 元素、注释或处理指令节点
+    
+    Returns:
+        子树文本，无法单独序列化时返回None
+    """
+    if isinstance(node.tag, str) and node.nsmap:
+        return None
+    text = etree.tostring(node, encoding='unicode', with_tail=False)
+    if contains_astral(text):
+        return None
+    # libxml2在含有文本（包括空白）子节点的元素之内不再补充缩进，保留空白解析的文档通常如此
+    parent = node.getparent()
+    while parent is not None:
+        if parent.text or any(child.tail for child in parent):
+            return text
+        parent = parent.getparent()
+    # pretty_print只在末尾多一个换行时，说明没有需要补充缩进的元素
+    if etree.tostring(node, encoding='unicode', with_tail=False, pretty_print=True) != text + '\n':
+        return None
+    return text
+
+def find_reparse_region(source_map, synced_text, read_text, dirty):
+    """
+    找出包含全部修改的最小元素，只需重新解析这个元素的子树
+    
+    从修改开始位置之前的最后一个节点起向上查找，第一个满足以下条件的元素即为所求：
+    开始标签在修改范围之前，在同步时的文本中其子树完整包含修改范围，
+    且在当前文本中扫描得到的子树结束位置与同步时的结束位置相对应。
+    当前文本只通过read_text读取修改范围和候选元素所在的几段，代价与文档大小无关。
+    
+    Args:
+        source_map: 同步时文本的XMLSourceMap，可以为None
+        synced_text: 同步时文本的SyncedText
+        read_text: 函数，参数为(start, end)，返回当前文本中的这一段
+        dirty: 记录修改范围的DirtyRange，length为当前文本的长度
+    
+    Returns:
+        (元素, 子树在文本中的起始偏移, 子树在当前文本中的结束偏移)，
+        修改涉及根元素或无法确定范围时返回None
+    """
+    if source_map is None or dirty.is_clean() or dirty.synced_length != len(synced_text):
+        return None
+    # 同步时的文本不含辅助平面字符（见XMLSourceMap），修改范围之外的文本与之相同
+    if contains_astral(read_text(*dirty.current_span())):
+        # 修改范围按UTF-16计算，与字符串偏移量不一致
+        return None
+    
+    dirty_start, synced_dirty_end = dirty.synced_span()
+    delta = dirty.length - dirty.synced_length
+    node = source_map.node_before(dirty_start)
+    while node is not None and node.getparent() is not None:
+        if isinstance(node.tag, str):
+            start = source_map.tag_span(node)[0]
+            synced_end = synced_text.element_end(start)
+            if synced_end is None:
+                return None
+            if (synced_end >= synced_dirty_end
+                    and read_element_end(read_text, start, dirty.length) == synced_end + delta):
+                return node, start, synced_end + delta
+        node = node.getparent()
+    return None
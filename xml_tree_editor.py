@@ -2,47 +2,49 @@ import sys
 import uuid
 import os
 import mimetypes
-from PyQt5.QtWidgets import (QTreeWidget, QTreeWidgetItem, QAbstractItemView, QApplication, 
+from PyQt5.QtWidgets import (QAbstractItemView, QApplication, 
                             QToolTip, QLabel, QStyle)
-from PyQt5.QtCore import Qt, QMimeData, QByteArray, QPoint, QRect, QSize, QUrl, QTimer
+from PyQt5.QtCore import Qt, QMimeData, QByteArray, QPoint, QRect, QSize, QUrl
 from PyQt5.QtGui import QDrag, QColor, QPainter, QPixmap, QIcon
 from lxml import etree
-from tree_state_manager import TreeStateManager
+from xml_commands import InsertNodeCommand, MoveNodeCommand
+from xml_tree_model import XmlTreeView
 
-class XMLTreeWidget(QTreeWidget):
+class XMLTreeEditorView(XmlTreeView):
+    """
+    可编辑的结构树视图，显示XmlTreeModel
+    
+    在XmlTreeView的基础上处理节点的拖动和放置：内部拖放移动元素，
+    从代码片段库拖入片段，从文件管理器拖入图片创建Image元素，
+    并在拖放过程中显示放置位置的提示和指示线。
+    """
     def __init__(self, parent=None):
-        super(XMLTreeWidget, self).__init__(parent)
+        super(XMLTreeEditorView, self).__init__(parent)
         
-        # 启用拖放功能
-        self.setDragEnabled(True)
-        self.setAcceptDrops(True)
-        self.setDropIndicatorShown(True)  # 确保显示拖放指示器
-        self.setDragDropMode(QAbstractItemView.InternalMove)
-        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        # 双击由主窗口打开各列的编辑器，元素列只在重命名时通过edit进入编辑
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
         
         # 设置更明确的拖放指示器样式
         self.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 show-decoration-selected: 1;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #3399FF;
                 color: white;
             }
-            QTreeWidget::item:hover {
+            QTreeView::item:hover {
                 background-color: rgba(229, 243, 255, 0.5);
             }
-            QTreeWidget::item:selected:hover {
+            QTreeView::item:selected:hover {
                 background-color: #3399FF;
                 color: white;
             }
-            QTreeWidget::indicator:unchecked {
+            QTreeView::indicator:unchecked {
                 image: url(none);
             }
         """)
         
-        # 存储树项目和元素的映射关系
-        self.item_element_map = {}
         self.main_window = None
         
         # 拖放视觉提示
@@ -69,11 +71,9 @@ class XMLTreeWidget(QTreeWidget):
         # 当前拖放操作类型
         self.currentDropOperation = ""
         
-        # 注释显示开关
-        self.show_comments = True
-        
-        # 注释文本颜色
-        self.comment_color = QColor(0, 128, 0)  # 绿色
+        # 拖放到元素中间时背景高亮的目标元素及其颜色
+        self.drop_target = None
+        self.drop_target_color = QColor(0, 0, 0, 0)
     
     def set_main_window(self, window):
         self.main_window = window
@@ -81,7 +81,7 @@ class XMLTreeWidget(QTreeWidget):
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.drag_start_position = event.pos()
-        super(XMLTreeWidget, self).mousePressEvent(event)
+        super(XMLTreeEditorView, self).mousePressEvent(event)
     
     def mouseMoveEvent(self, event):
         if not (event.buttons() & Qt.LeftButton):
@@ -90,8 +90,8 @@ class XMLTreeWidget(QTreeWidget):
         if (event.pos() - self.drag_start_position).manhattanLength() < QApplication.startDragDistance():
             return
         
-        selected_items = self.selectedItems()
-        if not selected_items:
+        selected_nodes = self.selected_nodes()
+        if not selected_nodes:
             return
         
         drag = QDrag(self)
@@ -99,10 +99,9 @@ class XMLTreeWidget(QTreeWidget):
         
         # 准备XML数据
         xml_data = []
-        for item in selected_items:
-            if hasattr(item, 'element'):
-                xml_str = etree.tostring(item.element, encoding='utf-8').decode('utf-8')
-                xml_data.append(xml_str)
+        for element in selected_nodes:
+            xml_str = etree.tostring(element, encoding='utf-8').decode('utf-8')
+            xml_data.append(xml_str)
         
         mime_data.setText("\n".join(xml_data))
         mime_data.setData("application/xml", "\n".join(xml_data).encode('utf-8'))
@@ -111,9 +110,9 @@ class XMLTreeWidget(QTreeWidget):
         pixmap = QPixmap(self.viewport().size())
         pixmap.fill(Qt.transparent)
         painter = QPainter(pixmap)
-        for item in selected_items:
-            rect = self.visualItemRect(item)
-            self.itemDelegate().paint(painter, self.viewOptions(), self.indexFromItem(item))
+        for index in self.selectionModel().selectedRows(0):
+            rect = self.visualRect(index)
+            self.itemDelegate().paint(painter, self.viewOptions(), index)
             painter.fillRect(rect, QColor(0, 120, 215, 100))  # 半透明蓝色
         painter.end()
         
@@ -122,17 +121,15 @@ class XMLTreeWidget(QTreeWidget):
         self.dragged_parents = []
         self.dragged_tags = []
         
-        for item in selected_items:
-            if hasattr(item, 'element'):
-                element = item.element
-                parent = element.getparent()
-                self.dragged_elements.append(element)
-                self.dragged_parents.append(parent)
-                # 正确处理注释节点的标签名
-                if isinstance(element, etree._Comment):
-                    self.dragged_tags.append("注释")
-                else:
-                    self.dragged_tags.append(element.tag)
+        for element in selected_nodes:
+            parent = element.getparent()
+            self.dragged_elements.append(element)
+            self.dragged_parents.append(parent)
+            # 正确处理注释节点的标签名
+            if isinstance(element, etree._Comment):
+                self.dragged_tags.append("注释")
+            else:
+                self.dragged_tags.append(element.tag)
         
         drag.setMimeData(mime_data)
         drag.setPixmap(pixmap)
@@ -175,18 +172,19 @@ class XMLTreeWidget(QTreeWidget):
                 event.ignore()
                 return
             
-            # 获取拖放位置的项目
-            drop_item = self.itemAt(event.pos())
+            # 获取拖放位置的元素
+            drop_index = self.indexAt(event.pos())
+            drop_element = self.model().node_from_index(drop_index)
             
-            if not drop_item or not hasattr(drop_item, 'element'):
+            if drop_element is None:
                 self.dropTipLabel.hide()
                 self.dropLineVisible = False
-                self.viewport().update()
+                self.set_drop_target(None)
                 event.acceptProposedAction()
                 return
             
-            # 获取项目在视图中的矩形区域
-            item_rect = self.visualItemRect(drop_item)
+            # 获取元素所在行在视图中的矩形区域
+            item_rect = self.visualRect(drop_index)
             
             # 计算鼠标与项目的相对位置
             rel_pos = event.pos()
@@ -218,7 +216,6 @@ class XMLTreeWidget(QTreeWidget):
                 self.currentDropOperation = "on"
                 self.dropLineVisible = False
                 
-                drop_element = drop_item.element
                 if drop_element.tag == "Group":
                     tip_text = "添加到组内"
                 else:
@@ -226,18 +223,16 @@ class XMLTreeWidget(QTreeWidget):
             
             # 更新样式和提示
             if drop_position == QAbstractItemView.OnItem:
-                drop_element = drop_item.element
-                # 高亮显示目标项
+                # 高亮显示目标元素
                 if drop_element.tag == "Group":
                     # 如果拖到Group上，使用绿色背景
-                    drop_item.setBackground(0, QColor(204, 255, 204))  # 淡绿色
+                    self.set_drop_target(drop_element, QColor(204, 255, 204))  # 淡绿色
                 else:
                     # 如果拖到其他元素上，使用黄色背景表示将创建新组
-                    drop_item.setBackground(0, QColor(255, 255, 204))  # 淡黄色
+                    self.set_drop_target(drop_element, QColor(255, 255, 204))  # 淡黄色
             else:
-                # 重置其他项的背景
-                for i in range(self.topLevelItemCount()):
-                    self.resetItemBackground(self.topLevelItem(i))
+                # 重置目标元素的背景
+                self.set_drop_target(None)
             
             # 将提示标签置于鼠标位置附近
             tip_pos = self.viewport().mapToGlobal(event.pos()) + QPoint(15, 15)
@@ -262,16 +257,16 @@ class XMLTreeWidget(QTreeWidget):
                     break
             
             if has_image:
-                # 获取拖放位置的项目
-                drop_item = self.itemAt(event.pos())
+                # 获取拖放位置的行
+                drop_index = self.indexAt(event.pos())
                 
-                if not drop_item:
-                    # 如果没有项目在光标下，可能是拖到了根元素或空白区域
+                if not drop_index.isValid():
+                    # 如果光标下没有元素，可能是拖到了根元素或空白区域
                     event.acceptProposedAction()
                     return
                 
-                # 获取项目在视图中的矩形区域
-                item_rect = self.visualItemRect(drop_item)
+                # 获取元素所在行在视图中的矩形区域
+                item_rect = self.visualRect(drop_index)
                 
                 # 计算鼠标与项目的相对位置
                 rel_pos = event.pos()
@@ -318,14 +313,29 @@ class XMLTreeWidget(QTreeWidget):
             event.ignore()
             return
     
-    def resetItemBackground(self, item):
-        """递归重置所有项的背景颜色"""
-        item.setBackground(0, QColor(0, 0, 0, 0))  # 透明背景
-        for i in range(item.childCount()):
-            self.resetItemBackground(item.child(i))
+    def set_drop_target(self, element, color=None):
+        """
+        设置背景高亮的放置目标
+        
+        Args:
+            element: 目标元素，为None时取消高亮
+            color: 背景颜色
+        """
+        if element is self.drop_target and (color is None or color == self.drop_target_color):
+            return
+        self.drop_target = element
+        if color is not None:
+            self.drop_target_color = color
+        self.viewport().update()
+    
+    def drawRow(self, painter, option, index):
+        """在放置目标的元素列下面先画出背景色"""
+        if self.drop_target is not None and self.model().node_from_index(index) is self.drop_target:
+            painter.fillRect(self.visualRect(index.sibling(index.row(), 0)), self.drop_target_color)
+        super(XMLTreeEditorView, self).drawRow(painter, option, index)
     
     def paintEvent(self, event):
-        super(XMLTreeWidget, self).paintEvent(event)
+        super(XMLTreeEditorView, self).paintEvent(event)
         
         # 绘制拖放指示线
         if self.dropLineVisible and not self.dropLineRect.isNull():
@@ -371,26 +381,28 @@ class XMLTreeWidget(QTreeWidget):
         self.dropTipLabel.hide()
         self.dropLineVisible = False
         
-        # 重置所有项的背景
-        for i in range(self.topLevelItemCount()):
-            self.resetItemBackground(self.topLevelItem(i))
+        # 重置目标元素的背景
+        self.set_drop_target(None)
         
         self.viewport().update()
-        super(XMLTreeWidget, self).dragLeaveEvent(event)
+        super(XMLTreeEditorView, self).dragLeaveEvent(event)
     
     def dropEvent(self, event):
+        """处理拖放事件，在主窗口的批量编辑中进行，树视图只重绘一次"""
+        if self.main_window is None:
+            self.handle_drop(event)
+            return
+        with self.main_window.batch_edit():
+            self.handle_drop(event)
+    
+    def handle_drop(self, event):
         """处理拖放事件"""
         # 隐藏提示并重置样式
         self.dropTipLabel.hide()
         self.dropLineVisible = False
         
         # 重置背景颜色
-        for i in range(self.topLevelItemCount()):
-            self.resetItemBackground(self.topLevelItem(i))
-        
-        # 保存树视图状态
-        self.state_manager = TreeStateManager(self)
-        self.state_manager.save_state()
+        self.set_drop_target(None)
         
         # 处理图片文件拖放
         if event.mimeData().hasUrls():
@@ -406,10 +418,10 @@ class XMLTreeWidget(QTreeWidget):
                 self.handle_image_drop(event, image_files)
                 return
         
-        # 获取拖放位置的项目和位置
-        drop_item = self.itemAt(event.pos())
+        # 获取拖放位置的元素
+        drop_element = self.node_at(event.pos())
         
-        if not drop_item or not hasattr(drop_item, 'element'):
+        if drop_element is None:
             event.ignore()
             return
         
@@ -470,8 +482,7 @@ class XMLTreeWidget(QTreeWidget):
                 event.ignore()
                 return
             
-            # 获取目标元素和其父元素
-            drop_element = drop_item.element
+            # 获取目标元素的父元素
             drop_parent = drop_element.getparent()
             
             # 特殊处理：如果是XML片段拖放
@@ -497,46 +508,51 @@ class XMLTreeWidget(QTreeWidget):
                         event.ignore()
                         return
                 
-                # 如果解析成功，执行插入操作
+                # 如果解析成功，执行插入操作（合并为一次撤销操作）
+                undo_stack = self.main_window.undo_stack
                 if snippet_elements:
-                    # 根据拖放位置确定插入逻辑
-                    if drop_indicator == QAbstractItemView.OnItem:
-                        # 拖到元素上方 - 作为子元素添加
-                        for snippet in snippet_elements:
-                            # 确保元素有换行符
-                            snippet.tail = "\n"
-                            drop_element.append(snippet)
-                            added_elements.append(snippet)
-                    
-                    elif drop_indicator == QAbstractItemView.BelowItem:
-                        # 拖到元素下方 - 作为同级元素插入
-                        if drop_parent is not None:
-                            # 获取目标元素在父元素中的索引
-                            idx = drop_parent.index(drop_element) + 1
-                            
-                            # 从后往前插入，保持原始顺序
-                            for snippet in reversed(snippet_elements):
+                    with undo_stack.macro('插入代码片段'):
+                        # 根据拖放位置确定插入逻辑
+                        if drop_indicator == QAbstractItemView.OnItem:
+                            # 拖到元素上方 - 作为子元素添加
+                            for snippet in snippet_elements:
                                 # 确保元素有换行符
                                 snippet.tail = "\n"
-                                drop_parent.insert(idx, snippet)
-                                added_elements.append(snippet)
-                    
-                    elif drop_indicator == QAbstractItemView.AboveItem:
-                        # 拖到元素上方 - 作为同级元素插入
-                        if drop_parent is not None:
-                            # 获取目标元素在父元素中的索引
-                            idx = drop_parent.index(drop_element)
-                            
-                            # 从后往前插入，保持原始顺序
-                            for snippet in reversed(snippet_elements):
-                                # 确保元素有换行符
-                                snippet.tail = "\n"
-                                drop_parent.insert(idx, snippet)
+                                undo_stack.push(InsertNodeCommand(drop_element, len(drop_element), snippet))
                                 added_elements.append(snippet)
+                        
+                        elif drop_indicator == QAbstractItemView.BelowItem:
+                            # 拖到元素下方 - 作为同级元素插入
+                            if drop_parent is not None:
+                                # 获取目标元素在父元素中的索引
+                                idx = drop_parent.index(drop_element) + 1
+                                
+                                # 从后往前插入，保持原始顺序
+                                for snippet in reversed(snippet_elements):
+                                    # 确保元素有换行符
+                                    snippet.tail = "\n"
+                                    undo_stack.push(InsertNodeCommand(drop_parent, idx, snippet))
+                                    added_elements.append(snippet)
+                        
+                        elif drop_indicator == QAbstractItemView.AboveItem:
+                            # 拖到元素上方 - 作为同级元素插入
+                            if drop_parent is not None:
+                                # 获取目标元素在父元素中的索引
+                                idx = drop_parent.index(drop_element)
+                                
+                                # 从后往前插入，保持原始顺序
+                                for snippet in reversed(snippet_elements):
+                                    # 确保元素有换行符
+                                    snippet.tail = "\n"
+                                    undo_stack.push(InsertNodeCommand(drop_parent, idx, snippet))
+                                    added_elements.append(snippet)
                 
-                # 更新UI
+                # 更新UI（只插入片段元素对应的树项目）
                 if self.main_window:
-                    self.main_window.update_tree_widget(save_expand_state=False)
+                    if drop_indicator == QAbstractItemView.OnItem:
+                        self.main_window.update_tree_items([drop_element])
+                    else:
+                        self.main_window.update_tree_items([drop_parent])
                     
                     # 如果有片段名称，将其添加为作用注释
                     if snippet_name and added_elements and hasattr(self.main_window, 'file_tabs'):
@@ -553,9 +569,6 @@ class XMLTreeWidget(QTreeWidget):
                     
                     # 更新代码视图
                     self.main_window.update_code_view()
-                    
-                    # 延迟恢复树视图状态，确保树视图已经完全刷新
-                    QTimer.singleShot(100, self._delayed_restore_state)
                 
                 # 接受事件
                 event.acceptProposedAction()
@@ -563,80 +576,75 @@ class XMLTreeWidget(QTreeWidget):
             
             # 如果是内部元素拖放，而且已经有元素引用
             if hasattr(self, 'dragged_elements') and self.dragged_elements:
-                # 根据拖放指示器的位置，执行不同的操作
+                # 记录所有受影响的父元素（原父元素和目标父元素），用于增量更新树视图
+                affected_parents = [element.getparent() for element in self.dragged_elements]
                 if drop_indicator == QAbstractItemView.OnItem:
-                    # 拖到元素上方 - 作为子元素添加
+                    affected_parents.append(drop_element)
+                else:
+                    affected_parents.append(drop_parent)
+                
+                # 根据拖放指示器的位置，执行不同的操作（所有移动合并为一次撤销操作）
+                undo_stack = self.main_window.undo_stack
+                with undo_stack.macro('移动'):
+                    if drop_indicator == QAbstractItemView.OnItem:
+                        # 拖到元素上方 - 作为子元素添加
                     
-                    # 如果目标元素是被拖动元素之一，阻止操作
-                    if drop_element in self.dragged_elements:
-                        event.ignore()
-                        return
+                        # 如果目标元素是被拖动元素之一，阻止操作
+                        if drop_element in self.dragged_elements:
+                            event.ignore()
+                            return
                     
-                    # 一个个地添加拖动元素到目标元素中
-                    for element in self.dragged_elements:
-                        if element.getparent() is not None:
-                            element.getparent().remove(element)
-                        
-                        # 确保元素有换行符
-                        element.tail = "\n"
-                        
-                        # 添加到目标元素
-                        drop_element.append(element)
-                
-                elif drop_indicator == QAbstractItemView.BelowItem:
-                    # 拖到元素下方 - 作为同级元素插入
-                    if drop_parent is not None:
-                        # 获取目标元素在父元素中的索引
-                        target_idx = drop_parent.index(drop_element) + 1
-                        
-                        # 特殊处理：如果是Group移动到Group相邻位置
-                        is_group_to_group = False
-                        if any(elem.tag == "Group" for elem in self.dragged_elements) and drop_element.tag == "Group":
-                            is_group_to_group = True
-                        
-                        # 一个一个地添加拖动元素，注意索引会随着插入变化
+                        # 一个个地添加拖动元素到目标元素中（确保元素有换行符）
                         for element in self.dragged_elements:
-                            if element.getparent() is not None:
+                            index = len(drop_element)
+                            if element.getparent() is drop_element:
+                                index -= 1
+                            undo_stack.push(MoveNodeCommand(element, drop_element, index, tail="\n"))
+                    
+                    elif drop_indicator == QAbstractItemView.BelowItem:
+                        # 拖到元素下方 - 作为同级元素插入
+                        if drop_parent is not None:
+                            # 获取目标元素在父元素中的索引
+                            target_idx = drop_parent.index(drop_element) + 1
+                            
+                            # 特殊处理：如果是Group移动到Group相邻位置
+                            is_group_to_group = False
+                            if any(elem.tag == "Group" for elem in self.dragged_elements) and drop_element.tag == "Group":
+                                is_group_to_group = True
+                            
+                            # 一个一个地添加拖动元素，注意索引会随着插入变化
+                            for element in self.dragged_elements:
                                 # 如果元素的当前位置在目标位置之前，需要调整目标索引
                                 if element.getparent() == drop_parent:
                                     curr_idx = drop_parent.index(element)
                                     if curr_idx < target_idx:
                                         target_idx -= 1
-                                element.getparent().remove(element)
+                                
+                                # 插入到正确位置（确保元素有换行符）
+                                undo_stack.push(MoveNodeCommand(element, drop_parent, target_idx, tail="\n"))
+                                target_idx += 1
+                    
+                    elif drop_indicator == QAbstractItemView.AboveItem:
+                        # 拖到元素上方 - 作为同级元素插入
+                        if drop_parent is not None:
+                            # 获取目标元素在父元素中的索引
+                            target_idx = drop_parent.index(drop_element)
                             
-                            # 确保元素有换行符
-                            element.tail = "\n"
+                            # 特殊处理：如果是Group移动到Group相邻位置
+                            is_group_to_group = False
+                            if any(elem.tag == "Group" for elem in self.dragged_elements) and drop_element.tag == "Group":
+                                is_group_to_group = True
                             
-                            # 插入到正确位置
-                            drop_parent.insert(target_idx, element)
-                            target_idx += 1
-                
-                elif drop_indicator == QAbstractItemView.AboveItem:
-                    # 拖到元素上方 - 作为同级元素插入
-                    if drop_parent is not None:
-                        # 获取目标元素在父元素中的索引
-                        target_idx = drop_parent.index(drop_element)
-                        
-                        # 特殊处理：如果是Group移动到Group相邻位置
-                        is_group_to_group = False
-                        if any(elem.tag == "Group" for elem in self.dragged_elements) and drop_element.tag == "Group":
-                            is_group_to_group = True
-                        
-                        # 反向添加元素，保持拖动元素的相对顺序
-                        for element in reversed(self.dragged_elements):
-                            if element.getparent() is not None:
+                            # 反向添加元素，保持拖动元素的相对顺序
+                            for element in reversed(self.dragged_elements):
                                 # 如果元素的当前位置在目标位置之前，需要调整目标索引
                                 if element.getparent() == drop_parent:
                                     curr_idx = drop_parent.index(element)
                                     if curr_idx < target_idx:
                                         target_idx -= 1
-                                element.getparent().remove(element)
-                            
-                            # 确保元素有换行符
-                            element.tail = "\n"
-                            
-                            # 插入到正确位置
-                            drop_parent.insert(target_idx, element)
+                                
+                                # 插入到正确位置（确保元素有换行符）
+                                undo_stack.push(MoveNodeCommand(element, drop_parent, target_idx, tail="\n"))
             
                 # 更新旧路径和元素的映射
                 old_paths = {}
@@ -646,17 +654,14 @@ class XMLTreeWidget(QTreeWidget):
                 except Exception as e:
                     print(f"更新注释映射失败: {e}")
             
-                # 更新UI
+                # 更新UI（只移动受影响的树项目，保留其子树和展开状态）
                 if self.main_window:
-                    self.main_window.update_tree_widget(save_expand_state=False)
+                    self.main_window.update_tree_items(affected_parents)
                     self.main_window.update_code_view()
                     
                     # 刷新树视图的注释显示
                     if hasattr(self.main_window, 'refresh_tree_comments'):
                         self.main_window.refresh_tree_comments()
-                    
-                    # 延迟恢复树视图状态
-                    QTimer.singleShot(100, self._delayed_restore_state)
                 
                 event.acceptProposedAction()
                 
@@ -670,25 +675,18 @@ class XMLTreeWidget(QTreeWidget):
             import traceback
             traceback.print_exc()
             event.ignore()
-            
+        
         # 在处理完drop事件后，强制刷新树结构和列显示
+        # （位于批量编辑中，树视图被重建时展开状态在批量编辑结束时一次性恢复）
         if self.main_window and hasattr(self.main_window, 'refresh_tree_columns'):
             self.main_window.refresh_tree_columns()
         elif self.main_window:
             # 如果没有专门的刷新列方法，则完全重建树视图
             self.main_window.update_tree_widget(save_expand_state=False)
-            
-        # 延迟恢复树视图状态
-        QTimer.singleShot(100, self._delayed_restore_state)
-    
-    def _delayed_restore_state(self):
-        """延迟恢复树视图状态，确保在UI刷新后执行"""
-        if hasattr(self, 'state_manager'):
-            self.state_manager.restore_state()
-            
-            # 恢复状态后也刷新注释
-            if self.main_window and hasattr(self.main_window, 'refresh_tree_comments'):
-                self.main_window.refresh_tree_comments()
+        
+        # 同时刷新注释
+        if self.main_window and hasattr(self.main_window, 'refresh_tree_comments'):
+            self.main_window.refresh_tree_comments()
     
     def update_comment_mappings(self, old_paths):
         """更新元素拖放后的注释映射 - 在新系统中仅刷新注释显示"""
@@ -703,25 +701,20 @@ class XMLTreeWidget(QTreeWidget):
             event.ignore()
             return
         
-        # 保存树视图状态
-        self.state_manager = TreeStateManager(self)
-        self.state_manager.save_state()
-        
         # 获取当前XML文件的目录
         xml_dir = os.path.dirname(self.main_window.current_file)
         if not xml_dir:
             event.ignore()
             return
         
-        # 获取拖放位置的项目和位置
-        drop_item = self.itemAt(event.pos())
+        # 获取拖放位置的元素
+        drop_element = self.node_at(event.pos())
         
-        if not drop_item or not hasattr(drop_item, 'element'):
+        if drop_element is None:
             event.ignore()
             return
         
         # 确定拖放的父元素和位置
-        drop_element = drop_item.element
         drop_parent = drop_element.getparent()
         
         # 如果拖放到元素中间，则添加为子元素
@@ -740,73 +733,40 @@ class XMLTreeWidget(QTreeWidget):
             else:  # below
                 insert_index = parent_element.index(drop_element) + 1
         
-        # 为每张图片创建Image元素
-        for img_path in image_files:
-            # 将图片路径转换为相对于XML文件的路径
-            rel_path = os.path.relpath(img_path, xml_dir)
-            # 统一使用正斜杠表示路径
-            rel_path = rel_path.replace('\\', '/')
-            
-            # 创建Image元素
-            img_element = etree.Element("Image")
-            img_element.set("x", "")
-            img_element.set("y", "")
-            img_element.set("src", rel_path)
-            
-            # 添加换行符
-            img_element.tail = "\n"
-            if insert_index == 0 and parent_element.tag == self.main_window.root.tag:
-                # 如果是添加到根元素开头，确保在元素前也有换行
-                img_element.text = "\n"
-            
-            # 插入到XML树中
-            parent_element.insert(insert_index, img_element)
-            insert_index += 1
-        
-        # 更新UI
+        # 为每张图片创建Image元素（合并为一次撤销操作）
+        undo_stack = self.main_window.undo_stack
+        with undo_stack.macro('插入图片'):
+            for img_path in image_files:
+                # 将图片路径转换为相对于XML文件的路径
+                rel_path = os.path.relpath(img_path, xml_dir)
+                # 统一使用正斜杠表示路径
+                rel_path = rel_path.replace('\\', '/')
+            
+                # 创建Image元素
+                img_element = etree.Element("Image")
+                img_element.set("x", "")
+                img_element.set("y", "")
+                img_element.set("src", rel_path)
+            
+                # 添加换行符
+                img_element.tail = "\n"
+                if insert_index == 0 and parent_element.tag == self.main_window.root.tag:
+                    # 如果是添加到根元素开头，确保在元素前也有换行
+                    img_element.text = "\n"
+            
+                # 插入到XML树中
+                undo_stack.push(InsertNodeCommand(parent_element, insert_index, img_element))
+                insert_index += 1
+        
+        # 更新UI（只插入新Image元素对应的树项目）
         if self.main_window:
-            self.main_window.update_tree_widget(save_expand_state=False)
+            self.main_window.update_tree_items([parent_element])
             self.main_window.update_code_view()
             
             # 刷新树视图的注释显示
             if hasattr(self.main_window, 'refresh_tree_comments'):
                 self.main_window.refresh_tree_comments()
-            
-            # 延迟恢复树视图状态
-            QTimer.singleShot(100, self._delayed_restore_state)
         
         # 刷新视图
         self.viewport().update()
         event.acceptProposedAction()
-
-# 修改TreeItem类，以支持拖放
-class DraggableTreeItem(QTreeWidgetItem):
-    def __init__(self, parent, element, base_dir=None):
-        super(DraggableTreeItem, self).__init__(parent)
-        self.element = element
-        self.base_dir = base_dir
-        
-        # 设置标签文本
-        if isinstance(element, etree._Comment):
-            self.setText(0, element.text.strip())
-        else:
-            self.setText(0, element.tag)
-        
-        # 设置拖放标志
-        self.setFlags(self.flags() | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled)
-    
-    def __lt__(self, other):
-        """比较函数，用于排序"""
-        # 如果两个都是注释节点，保持原有顺序
-        if (isinstance(self.element, etree._Comment) and 
-            isinstance(other.element, etree._Comment)):
-            return False
-        
-        # 如果只有一个是注释节点，注释节点应该跟随其相邻的元素
-        if isinstance(self.element, etree._Comment):
-            return False
-        if isinstance(other.element, etree._Comment):
-            return True
-        
-        # 如果都是普通元素，按标签名排序
-        return self.text(0) < other.text(0) 
\ No newline at end of file
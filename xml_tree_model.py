@@ -0,0 +1,688 @@
+import bisect
+from lxml import etree
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QTreeView, QAbstractItemView
+
+def _runs(rows):
+    """把递增的行号列表分成连续的区间[(first, last)]"""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+def _longest_increasing(items, keys):
+    """返回items中keys严格递增的最长子序列"""
+    tails = []  # tails[k]: 长度为k+1的递增子序列的最后一项在items中的位置
+    tail_keys = []
+    previous = [-1] * len(items)
+    for position, key in enumerate(keys):
+        k = bisect.bisect_left(tail_keys, key)
+        if k:
+            previous[position] = tails[k - 1]
+        if k == len(tails):
+            tails.append(position)
+            tail_keys.append(key)
+        else:
+            tails[k] = position
+            tail_keys[k] = key
+    
+    result = []
+    position = tails[-1] if tails else -1
+    while position >= 0:
+        result.append(items[position])
+        position = previous[position]
+    result.reverse()
+    return result
+
+class XmlTreeModel(QAbstractItemModel):
+    """
+    直接以lxml树为数据源的结构树模型
+    
+    不为节点创建任何项目对象，元素列的标签名或注释文本、注释列和属性列都在视图需要时
+    从节点上读取，内存占用和重绘代价只与视图访问过的行数有关。
+    只缓存视图访问过的父元素的可见子节点列表（以及各节点在缓存中的父元素），
+    文档被修改后用sync_children让受影响父元素的缓存与文档一致，并发出插入、删除、
+    移动行的信号，视图据此局部更新，保留其余行和被移动行的展开、选中状态。
+    """
+    # 在元素列中编辑标签名后发出，参数为元素和输入的标签名，模型本身不修改文档
+    tagEdited = pyqtSignal(object, str)
+    
+    def __init__(self, parent=None):
+        super(XmlTreeModel, self).__init__(parent)
+        self.root = None
+        self.show_comments = True
+        self.comment_color = QColor(0, 128, 0)  # 绿色
+        self.highlight_color = QColor(255, 255, 0, 100)  # 浅黄色
+        
+        # 非元素列的内容：列方案、{标签: 功能注释}和返回元素作用注释的函数
+        self.column_plan = None
+        self.feature_comments = {}
+        self.usage_comment = None
+        
+        # 背景高亮的节点（搜索结果）
+        self.highlighted = set()
+        
+        # 父元素 -> 缓存的可见子节点列表；父元素 -> {子节点: 行号}，为None时按需重建
+        self._children = {}
+        self._rows = {}
+        # 子节点 -> 缓存中的父元素。视图在行信号期间看到的是缓存中的结构，不是已修改的文档
+        self._parents = {}
+        # 索引中保存的是lxml代理对象的指针，需要保持引用以免代理对象被回收
+        self._nodes = {}
+    
+    def set_root(self, root):
+        """更换模型显示的根元素，视图中的展开和选中状态全部重置"""
+        self.beginResetModel()
+        self.root = root
+        self._children = {}
+        self._rows = {}
+        self._parents = {}
+        self._nodes = {}
+        self.highlighted = set()
+        if root is not None:
+            self._nodes[id(root)] = root
+        self.endResetModel()
+    
+    def set_column_plan(self, plan, feature_comments, usage_comment):
+        """
+        设置非元素列的内容
+        
+        Args:
+            plan: TreeColumnPlan，列标题和各列的内容
+            feature_comments: {标签: 功能注释}
+            usage_comment: 函数，参数为元素，返回其作用注释（可以为None）
+        """
+        old_count = self.columnCount()
+        new_count = len(plan.headers)
+        if new_count > old_count:
+            self.beginInsertColumns(QModelIndex(), old_count, new_count - 1)
+            self.column_plan = plan
+            self.endInsertColumns()
+        elif new_count < old_count:
+            self.beginRemoveColumns(QModelIndex(), new_count, old_count - 1)
+            self.column_plan = plan
+            self.endRemoveColumns()
+        else:
+            self.column_plan = plan
+        self.feature_comments = feature_comments
+        self.usage_comment = usage_comment
+        
+        self.headerDataChanged.emit(Qt.Horizontal, 0, new_count - 1)
+        self.refresh_columns()
+    
+    def set_show_comments(self, show):
+        """切换是否显示注释节点，已访问过的父元素下的注释行逐个插入或删除"""
+        if show != self.show_comments:
+            self.show_comments = show
+            self.sync_children(list(self._children))
+    
+    def set_highlighted(self, nodes):
+        """
+        设置背景高亮的节点，只通知高亮状态变化且已在视图中的行
+        
+        Args:
+            nodes: 要高亮的节点，可以包含尚未被视图访问的节点，它们在显示时才读取高亮状态
+        """
+        nodes = set(nodes)
+        changed = nodes.symmetric_difference(self.highlighted)
+        self.highlighted = nodes
+        for node in changed:
+            index = self.cached_index(node)
+            if index.isValid():
+                self.dataChanged.emit(index, index, [Qt.BackgroundRole])
+    
+    # ---- 节点与索引 ----
+    
+    def is_tree_node(self, node):
+        """判断节点是否在结构树中显示"""
+        if isinstance(node, etree._Comment):
+            return self.show_comments
+        return isinstance(node.tag, str)
+    
+    def _child_list(self, parent_node):
+        """获取父元素缓存的可见子节点列表（第一次访问时建立）"""
+        children = self._children.get(parent_node)
+        if children is None:
+            # 同步过程中视图可能访问新的父元素，仍缓存在其他父元素下的子节点由同步移过来
+            children = [child for child in parent_node
+                        if self.is_tree_node(child) and child not in self._parents]
+            self._children[parent_node] = children
+            self._rows[parent_node] = None
+            for child in children:
+                self._parents[child] = parent_node
+                self._nodes[id(child)] = child
+        return children
+    
+    def _row_map(self, parent_node):
+        """获取父元素缓存中{子节点: 行号}的映射"""
+        rows = self._rows.get(parent_node)
+        if rows is None:
+            rows = {child: row for row, child in enumerate(self._child_list(parent_node))}
+            self._rows[parent_node] = rows
+        return rows
+    
+    def _forget_rows(self, nodes):
+        """移除已删除的行及其子树在缓存中的记录"""
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            self._parents.pop(node, None)
+            self._rows.pop(node, None)
+            children = self._children.pop(node, None)
+            if children:
+                stack.extend(children)
+    
+    def cached_index(self, node, column=0):
+        """
+        获取节点在缓存中的模型索引，不为此访问任何子节点列表
+        
+        Returns:
+            节点所在的子节点列表已被视图访问过时返回对应的QModelIndex，否则返回无效索引
+        """
+        if node is None or self.root is None:
+            return QModelIndex()
+        if node is self.root:
+            return self.createIndex(0, column, node)
+        parent_node = self._parents.get(node)
+        if parent_node is None:
+            return QModelIndex()
+        return self.createIndex(self._row_map(parent_node)[node], column, node)
+    
+    def index_for_node(self, node, column=0):
+        """
+        获取节点对应的模型索引，节点的祖先尚未被访问时先建立它们的子节点列表
+        
+        Args:
+            node: 元素或注释节点
+            column: 列号
+        
+        Returns:
+            对应的QModelIndex，节点不在结构树中时返回无效索引
+        """
+        if node is None or self.root is None:
+            return QModelIndex()
+        
+        # 自下而上找到根元素，再自上而下确认每一层都在缓存中
+        ancestors = []
+        current = node
+        while current is not None and current is not self.root:
+            ancestors.append(current)
+            current = current.getparent()
+        if current is None:
+            return QModelIndex()
+        
+        parent_node = self.root
+        for current in reversed(ancestors):
+            if not self.is_tree_node(current):
+                return QModelIndex()
+            self._child_list(parent_node)
+            if self._parents.get(current) is not parent_node:
+                # 缓存尚未与文档同步
+                return QModelIndex()
+            parent_node = current
+        return self.cached_index(node, column)
+    
+    def node_from_index(self, index):
+        """获取索引对应的节点，无效索引返回None"""
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+    
+    def children_loaded(self, node):
+        """判断节点的子节点列表是否已被视图访问过"""
+        return node in self._children
+    
+    def loaded_children(self, node):
+        """获取节点已缓存的子节点列表，未访问过时返回空列表"""
+        return self._children.get(node, [])
+    
+    # ---- QAbstractItemModel接口 ----
+    
+    def index(self, row, column, parent=QModelIndex()):
+        if self.root is None or column < 0 or column >= self.columnCount():
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(0, column, self.root) if row == 0 else QModelIndex()
+        
+        children = self._child_list(parent.internalPointer())
+        if row < 0 or row >= len(children):
+            return QModelIndex()
+        return self.createIndex(row, column, children[row])
+    
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if node is self.root:
+            return QModelIndex()
+        return self.cached_index(self._parents.get(node))
+    
+    def rowCount(self, parent=QModelIndex()):
+        if self.root is None:
+            return 0
+        if not parent.isValid():
+            return 1
+        if parent.column() > 0:
+            return 0
+        node = parent.internalPointer()
+        if isinstance(node, etree._Comment):
+            return 0
+        return len(self._child_list(node))
+    
+    def columnCount(self, parent=QModelIndex()):
+        if self.column_plan is None:
+            return 1
+        return len(self.column_plan.headers)
+    
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return self.root is not None
+        if parent.column() > 0:
+            return False
+        node = parent.internalPointer()
+        children = self._children.get(node)
+        if children is not None:
+            return bool(children)
+        # 未访问过的节点只检查是否存在可见子节点，不建立子节点列表
+        return any(self.is_tree_node(child) for child in node)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation != Qt.Horizontal or role != Qt.DisplayRole:
+            return None
+        if self.column_plan is None:
+            return '元素' if section == 0 else None
+        if 0 <= section < len(self.column_plan.headers):
+            return self.column_plan.headers[section]
+        return None
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        is_comment = isinstance(node, etree._Comment)
+        
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == 0:
+                return (node.text or "").strip() if is_comment else node.tag
+            if is_comment or self.column_plan is None:
+                return ""
+            return self.column_plan.text(node, column, self.feature_comments, self.usage_comment)
+        
+        if column == 0:
+            if role == Qt.ForegroundRole and is_comment:
+                return self.comment_color
+            if role == Qt.BackgroundRole and node in self.highlighted:
+                return self.highlight_color
+        
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled
+        if index.column() == 0 and not isinstance(index.internalPointer(), etree._Comment):
+            flags |= Qt.ItemIsEditable
+        return flags
+    
+    def setData(self, index, value, role=Qt.EditRole):
+        """元素列的编辑结果通过tagEdited交给使用者，由它修改文档后再通知模型"""
+        if not index.isValid() or role != Qt.EditRole or index.column() != 0:
+            return False
+        node = index.internalPointer()
+        if isinstance(node, etree._Comment):
+            return False
+        self.tagEdited.emit(node, str(value))
+        return True
+    
+    # ---- 与文档同步 ----
+    
+    def node_changed(self, node):
+        """节点的标签、文本、属性或注释变化后，通知视图重新读取该行"""
+        index = self.cached_index(node)
+        if index.isValid():
+            self.dataChanged.emit(index, self.cached_index(node, self.columnCount() - 1))
+    
+    def refresh_columns(self, first=1):
+        """
+        通知视图重新读取已访问各行从first开始的列（注释或列配置变化后）
+        
+        Args:
+            first: 第一个需要重新读取的列
+        """
+        last = self.columnCount() - 1
+        if self.root is None or first > last:
+            return
+        self.dataChanged.emit(self.createIndex(0, first, self.root), self.createIndex(0, last, self.root))
+        for parent_node, children in self._children.items():
+            if children and (parent_node is self.root or parent_node in self._parents):
+                self.dataChanged.emit(self.createIndex(0, first, children[0]),
+                                      self.createIndex(len(children) - 1, last, children[-1]))
+    
+    def sync_children(self, parents):
+        """
+        让父元素缓存的子节点列表与文档一致，并发出相应的行信号
+        
+        插入、删除和移动都归结为"父元素的子节点列表变化"。先按文档顺序放置每个父元素的
+        子节点：缓存中已有的节点（包括从其他已访问父元素移来的）作为行移动，其子树在视图中的
+        展开和选中状态随之保留，新节点作为行插入；最后删除各父元素中不再属于它的行。
+        未被访问过的父元素不需要同步，只通知视图更新其展开标记。
+        
+        Args:
+            parents: 子节点发生变化的父元素（可以包含已脱离文档的元素）
+        """
+        if self.root is None:
+            return
+        
+        parents = [parent for parent in dict.fromkeys(parents) if parent is not None]
+        for parent_node in parents:
+            if parent_node in self._children:
+                if self._in_document(parent_node):
+                    self._place_children(parent_node)
+            else:
+                # 子节点有无的变化会影响展开标记
+                self.node_changed(parent_node)
+        
+        for parent_node in parents:
+            children = self._children.get(parent_node)
+            if children is None:
+                continue
+            if self._in_document(parent_node):
+                # 同步其他父元素期间才被视图访问的父元素在这里放置
+                self._place_children(parent_node)
+                children = self._children.get(parent_node)
+                if children is None:
+                    continue
+                count = sum(1 for child in parent_node if self.is_tree_node(child))
+            else:
+                count = 0
+            if count < len(children):
+                self._remove_rows(parent_node, count, len(children) - 1)
+    
+    def _in_document(self, node):
+        """判断节点是否仍然属于模型显示的文档"""
+        while node is not None:
+            if node is self.root:
+                return True
+            node = node.getparent()
+        return False
+    
+    def _place_children(self, parent_node):
+        """
+        按文档顺序把可见子节点放到缓存列表的前部，多出的行留在末尾由调用者删除
+        
+        缓存中相对顺序不变的最长一组子节点保持不动，只移动其余的行，
+        因此移动一个节点只产生一次行移动，与同级节点的数量无关。
+        """
+        children = self._children[parent_node]
+        wanted = [child for child in parent_node if self.is_tree_node(child)]
+        wanted_set = set(wanted)
+        
+        # 先删除已不在文档中或不再显示的行；移到其他已访问父元素下的行留给移动处理
+        stale = [row for row, child in enumerate(children)
+                 if child not in wanted_set and not self._moved_to_loaded_parent(child, parent_node)]
+        for first, last in reversed(_runs(stale)):
+            self._remove_rows(parent_node, first, last)
+        
+        rows = self._row_map(parent_node)
+        kept = [child for child in wanted if child in rows]
+        stable = set(_longest_increasing(kept, [rows[child] for child in kept]))
+        
+        row = 0
+        while row < len(wanted):
+            child = wanted[row]
+            if row < len(children) and children[row] is child:
+                row += 1
+                continue
+            
+            if child in stable:
+                # 当前位置上是需要移动或移出的行，先把它移到末尾
+                self._move_row(parent_node, children[row], parent_node, len(children))
+                continue
+            
+            owner = self._parents.get(child)
+            if owner is not None and self._move_row(owner, child, parent_node, row):
+                row += 1
+                continue
+            if owner is not None:
+                # 无法移动时（缓存中目标位于被移动的行之下）先删除原来的行
+                owner_row = self._row_map(owner)[child]
+                self._remove_rows(owner, owner_row, owner_row)
+                if parent_node not in self._children:
+                    return
+            
+            # 连续的新节点一次插入
+            end = row + 1
+            while end < len(wanted) and wanted[end] not in self._parents:
+                end += 1
+            self._insert_rows(parent_node, row, wanted[row:end])
+            row = end
+    
+    def _moved_to_loaded_parent(self, node, old_parent):
+        """判断节点是否已被移到文档中另一个子节点列表已缓存的父元素下"""
+        parent_node = node.getparent()
+        return (parent_node is not None and parent_node is not old_parent
+                and parent_node in self._children and self.is_tree_node(node)
+                and self._in_document(parent_node))
+    
+    def _insert_rows(self, parent_node, row, nodes):
+        """在父元素缓存的子节点列表中插入行"""
+        self.beginInsertRows(self.cached_index(parent_node), row, row + len(nodes) - 1)
+        self._children[parent_node][row:row] = nodes
+        self._rows[parent_node] = None
+        for node in nodes:
+            self._parents[node] = parent_node
+            self._nodes[id(node)] = node
+        self.endInsertRows()
+    
+    def _remove_rows(self, parent_node, first, last):
+        """从父元素缓存的子节点列表中删除行，并清除被删除子树的缓存"""
+        self.beginRemoveRows(self.cached_index(parent_node), first, last)
+        children = self._children[parent_node]
+        removed = children[first:last + 1]
+        del children[first:last + 1]
+        self._rows[parent_node] = None
+        self._forget_rows(removed)
+        self.endRemoveRows()
+    
+    def _move_row(self, old_parent, node, new_parent, row):
+        """
+        把缓存中的一行移动到新位置，视图中该行子树的状态保持不变
+        
+        Returns:
+            视图不允许这样移动时返回False，缓存不变
+        """
+        old_row = self._row_map(old_parent)[node]
+        if not self.beginMoveRows(self.cached_index(old_parent), old_row, old_row,
+                                  self.cached_index(new_parent), row):
+            return False
+        del self._children[old_parent][old_row]
+        self._rows[old_parent] = None
+        if old_parent is new_parent and old_row < row:
+            row -= 1
+        self._children[new_parent].insert(row, node)
+        self._rows[new_parent] = None
+        self._parents[node] = new_parent
+        self.endMoveRows()
+        return True
+
+class XmlTreeView(QTreeView):
+    """
+    显示结构树模型的视图，模型需提供node_from_index和index_for_node（XmlTreeModel或XmlOutlineModel）
+    
+    支持多选、内部拖放移动和右键菜单，右键菜单通过customContextMenuRequested
+    信号交给使用者处理，可用node_at获取鼠标位置对应的节点。
+    """
+    def __init__(self, parent=None):
+        super(XmlTreeView, self).__init__(parent)
+        
+        # 所有行高度一致，视图不必逐行计算高度
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setDragEnabled(True)
+        self.setAcceptDrops(True)
+        self.setDropIndicatorShown(True)
+        self.setDragDropMode(QAbstractItemView.InternalMove)
+        self.setDefaultDropAction(Qt.MoveAction)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+    
+    def node_at(self, position):
+        """获取视图坐标处的节点"""
+        model = self.model()
+        if model is None:
+            return None
+        return model.node_from_index(self.indexAt(position))
+    
+    def current_node(self):
+        """获取当前节点"""
+        model = self.model()
+        if model is None:
+            return None
+        return model.node_from_index(self.currentIndex())
+    
+    def selected_nodes(self):
+        """按选择顺序返回所有被选中的节点"""
+        model = self.model()
+        if model is None:
+            return []
+        return [model.node_from_index(index) for index in self.selectionModel().selectedRows(0)]
+    
+    def select_node(self, node):
+        """选中节点并滚动到可见位置"""
+        model = self.model()
+        if model is None:
+            return
+        index = model.index_for_node(node)
+        if index.isValid():
+            self.setCurrentIndex(index)
+            self.scrollTo(index)
+    
+    def expand_to_node(self, node):
+        """展开节点的所有祖先，使节点可见"""
+        model = self.model()
+        if model is None:
+            return
+        parent = model.index_for_node(node).parent()
+        while parent.isValid():
+            self.expand(parent)
+            parent = parent.parent()
+
+class XmlOutlineModel(QAbstractItemModel):
+    """
+    以XMLOutline大纲为数据源的只读结构树模型
+    
+    内部指针是节点在大纲中的序号，子节点列表在父节点第一次被展开时计算并缓存，
+    元素列显示标签名和name属性，注释显示预览文本。
+    提供node_from_index/index_for_node，可直接用XmlTreeView显示。
+    """
+    def __init__(self, outline=None, parent=None):
+        super(XmlOutlineModel, self).__init__(parent)
+        self.outline = None
+        self.comment_color = QColor(0, 128, 0)  # 绿色
+        self._children = {}  # 节点序号 -> 子节点序号列表
+        self._rows = {}  # 节点序号 -> 在父节点中的行号
+        if outline is not None:
+            self.set_outline(outline)
+    
+    def set_outline(self, outline):
+        """更换模型显示的大纲"""
+        self.beginResetModel()
+        self.outline = outline
+        self._children = {}
+        self._rows = {}
+        self.endResetModel()
+    
+    def _child_list(self, node):
+        """获取节点的子节点列表（按需建立并缓存）"""
+        children = self._children.get(node)
+        if children is None:
+            children = self.outline.children(node)
+            self._children[node] = children
+            for row, child in enumerate(children):
+                self._rows[child] = row
+        return children
+    
+    def node_from_index(self, index):
+        """获取索引对应的节点序号，无效索引返回None"""
+        if not index.isValid():
+            return None
+        return index.internalId()
+    
+    def index_for_node(self, node, column=0):
+        """获取节点序号对应的模型索引"""
+        if node is None or not self.outline:
+            return QModelIndex()
+        parent_node = self.outline.parents[node]
+        if parent_node < 0:
+            return self.createIndex(0, column, node)
+        self._child_list(parent_node)
+        return self.createIndex(self._rows[node], column, node)
+    
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.outline or column != 0:
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(0, 0, 0) if row == 0 else QModelIndex()
+        children = self._child_list(parent.internalId())
+        if row < 0 or row >= len(children):
+            return QModelIndex()
+        return self.createIndex(row, 0, children[row])
+    
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent_node = self.outline.parents[index.internalId()]
+        if parent_node < 0:
+            return QModelIndex()
+        return self.index_for_node(parent_node)
+    
+    def rowCount(self, parent=QModelIndex()):
+        if not self.outline:
+            return 0
+        if not parent.isValid():
+            return 1
+        return len(self._child_list(parent.internalId()))
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+    
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.outline)
+        node = parent.internalId()
+        return self.outline.subtree_ends[node] > node + 1
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return '元素（只读大纲）'
+        return None
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalId()
+        tag = self.outline.tags[node]
+        label = self.outline.labels[node]
+        
+        if role == Qt.DisplayRole:
+            if tag is None:
+                return label
+            return f'{tag}  [{label}]' if label else tag
+        
+        if role == Qt.ToolTipRole:
+            return f'字节 {self.outline.starts[node]} - {self.outline.ends[node]}，层级 {self.outline.depths[node]}'
+        
+        if role == Qt.ForegroundRole and tag is None:
+            return self.comment_color
+        
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
@@ -0,0 +1,85 @@
+import threading
+from lxml import etree
+from PyQt5.QtCore import QThread, pyqtSignal
+
+def syntax_errors(parser, error):
+    """
+    把解析失败时的错误转换为错误列表
+    
+    Args:
+        parser: 解析所用的XMLParser，只读取它自己的错误日志
+        error: 解析时抛出的etree.XMLSyntaxError
+    
+    Returns:
+        [(行号, 列号, 错误信息)]
+    """
+    errors = [(entry.line, entry.column, entry.message)
+              for entry in parser.error_log.filter_from_errors()]
+    if not errors:
+        line, column = error.position if error.position else (1, 0)
+        errors.append((line, column, error.msg))
+    return errors
+
+def validate_xml(text):
+    """
+    检查文本是否为格式正确的XML
+    
+    Args:
+        text: XML文本
+    
+    Returns:
+        错误列表 [(行号, 列号, 错误信息)]，格式正确时为空列表
+    """
+    parser = etree.XMLParser(remove_blank_text=False, huge_tree=True)
+    try:
+        etree.fromstring(text.encode('utf-8'), parser)
+    except etree.XMLSyntaxError as e:
+        return syntax_errors(parser, e)
+    return []
+
+class XMLValidationThread(QThread):
+    """
+    在后台检查代码视图中的文本是否为格式正确的XML
+    
+    线程常驻运行，submit只保存最新提交的文本并唤醒线程。线程每次取出最新的文本检查，
+    检查期间再次提交的文本会覆盖尚未检查的文本，连续输入时只检查最后一次的文本，
+    界面线程不会等待解析。
+    """
+    # 检查完成，参数为提交时的序号和错误列表 [(行号, 列号, 错误信息)]
+    validated = pyqtSignal(int, list)
+    
+    def __init__(self, parent=None):
+        super(XMLValidationThread, self).__init__(parent)
+        self._condition = threading.Condition()
+        self._pending = None
+        self._stopped = False
+    
+    def submit(self, text, generation):
+        """
+        提交要检查的文本
+        
+        Args:
+            text: 文本副本
+            generation: 提交序号，随结果一起返回，用于丢弃过期的结果
+        """
+        with self._condition:
+            self._pending = (text, generation)
+            self._condition.notify()
+    
+    def stop(self):
+        """停止线程并等待其结束"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.wait()
+    
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                text, generation = self._pending
+                self._pending = None
+            self.validated.emit(generation, validate_xml(text))